@@ -0,0 +1,161 @@
+"""Biaya CPU per baris untuk respons daftar buku: jalur ORM + response_model vs baris mentah + orjson.
+
+Lama : select(Book) (+ selectin kategori / job ingest / dokumen PDF), validasi
+       list[BookOut] dari atribut ORM, dump mode json, json.dumps (JSONResponse).
+Baru : crud_books.list_books (satu query kolom mentah + outer join, dict siap
+       kirim), orjson.dumps.
+
+Keduanya diukur langsung di proses ini terhadap SQLite sementara, tanpa HTTP,
+dipisah per tahap (fetch = query + materialisasi, serialize = sampai bytes).
+Output kedua jalur dicek identik. Di akhir diukur juga kompresi gzip/br untuk
+halaman terbesar.
+
+    python benchmarks/bench_serialization.py
+    python benchmarks/bench_serialization.py --books 20000 --sizes 20,100,1000 --json ser.json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+PROJECT_DIR = ROOT / "services" / "project_service"
+
+
+def measure(fn, iterations: int) -> tuple[float, float, object]:
+    # (cpu detik, wall detik, hasil terakhir); process_time ikut menghitung thread aiosqlite
+    result = None
+    cpu, wall = time.process_time(), time.perf_counter()
+    for _ in range(iterations):
+        result = fn()
+    return time.process_time() - cpu, time.perf_counter() - wall, result
+
+
+async def seed(db, models, n_books: int) -> None:
+    now = datetime.now(timezone.utc)
+    db.add_all(models.Category(id_kategori=i, nama=f"Kategori {i}") for i in range(1, 21))
+    for i in range(1, n_books + 1):
+        digest = f"{i:064x}" if i % 3 == 0 else None  # sepertiga buku punya PDF
+        if digest:
+            db.add(models.PdfBlob(sha256=digest, size=100_000 + i, ref_count=1))
+            db.add(models.PdfIngestJob(sha256=digest, status="done", attempts=1, run_after=now))
+            db.add(models.PdfDocument(sha256=digest, page_count=10 + i % 300, size=100_000 + i,
+                                      text_chars=5000, thumbnail_url=f"/files/{digest}/thumbnail.jpg"))
+        db.add(models.Book(
+            id_buku=i, judul=f"Judul Buku Nomor {i} — Edisi Revisi", penulis=f"Penulis {i % 997}",
+            tahun=1950 + i % 75, tersedia=i % 7 != 0, jumlah_eksemplar=1 + i % 5, eksemplar_tersedia=i % 5,
+            id_kategori=(i % 21) or None, pdf_sha256=digest,
+            pdf_url=f"/files/{digest}.pdf" if digest else None,
+        ))
+    await db.commit()
+
+
+async def run(args) -> dict:
+    # modul app dibaca dari project_service; konfigurasi env harus ada sebelum import
+    sys.path.insert(0, str(PROJECT_DIR))
+    from sqlalchemy import select
+    from pydantic import TypeAdapter
+    import orjson
+    from app import models, schemas, crud_books, responses
+    from app.database import engine, SessionLocal, sync_schema
+
+    async with engine.begin() as conn:
+        await conn.run_sync(sync_schema)
+    async with SessionLocal() as db:
+        await seed(db, models, args.books)
+
+    adapter = TypeAdapter(list[schemas.BookOut])
+    report = {"books": args.books, "sizes": {}}
+
+    for size in args.sizes:
+        iterations = max(args.min_iterations, args.rows_per_measure // size)
+
+        async def fetch_orm():
+            async with SessionLocal() as db:
+                return (await db.execute(select(models.Book).order_by(models.Book.id_buku).limit(size))).scalars().all()
+
+        async def fetch_rows():
+            async with SessionLocal() as db:
+                return await crud_books.list_books(db, 0, size)
+
+        def serialize_orm(books):
+            # setara jalur FastAPI: validasi response_model dari atribut, dump mode json, JSONResponse.render
+            data = adapter.dump_python(adapter.validate_python(books, from_attributes=True), mode="json")
+            return json.dumps(data, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode()
+
+        async def timed_fetch(fetch):
+            cpu, wall = time.process_time(), time.perf_counter()
+            for _ in range(iterations):
+                result = await fetch()
+            return time.process_time() - cpu, time.perf_counter() - wall, result
+
+        orm_fetch_cpu, orm_fetch_wall, books = await timed_fetch(fetch_orm)
+        row_fetch_cpu, row_fetch_wall, rows = await timed_fetch(fetch_rows)
+        orm_ser_cpu, _, old_body = measure(lambda: serialize_orm(books), iterations)
+        row_ser_cpu, _, new_body = measure(lambda: orjson.dumps(rows), iterations)
+
+        if old_body != new_body:
+            if json.loads(old_body) != json.loads(new_body):
+                raise SystemExit(f"output berbeda untuk halaman {size} baris")
+            print(f"catatan: halaman {size}: JSON sama, bytes berbeda", file=sys.stderr)
+
+        per_row = lambda seconds: round(seconds / (iterations * size) * 1e6, 2)  # µs per baris
+        old = {"fetch_cpu_us": per_row(orm_fetch_cpu), "serialize_cpu_us": per_row(orm_ser_cpu),
+               "total_cpu_us": per_row(orm_fetch_cpu + orm_ser_cpu), "fetch_wall_us": per_row(orm_fetch_wall)}
+        new = {"fetch_cpu_us": per_row(row_fetch_cpu), "serialize_cpu_us": per_row(row_ser_cpu),
+               "total_cpu_us": per_row(row_fetch_cpu + row_ser_cpu), "fetch_wall_us": per_row(row_fetch_wall)}
+        report["sizes"][str(size)] = {
+            "iterations": iterations,
+            "body_bytes": len(new_body),
+            "old": old,
+            "new": new,
+            "speedup": round(old["total_cpu_us"] / new["total_cpu_us"], 2) if new["total_cpu_us"] else None,
+        }
+        print(f"{size:>6} baris  lama {old['total_cpu_us']:>8} µs/baris  baru {new['total_cpu_us']:>8} µs/baris"
+              f"  ({report['sizes'][str(size)]['speedup']}x)", file=sys.stderr)
+
+    # kompresi halaman terbesar (body orjson terakhir)
+    body = new_body
+    report["compression"] = {"body_bytes": len(body)}
+    encodings = ["gzip"] + (["br"] if responses.brotli is not None else [])
+    for enc in encodings:
+        n = max(5, args.rows_per_measure // max(args.sizes))
+        cpu, _, out = measure(lambda: responses.compress(body, enc), n)
+        report["compression"][enc] = {
+            "bytes": len(out),
+            "ratio": round(len(body) / len(out), 2),
+            "cpu_us_per_kb": round(cpu / n / (len(body) / 1024) * 1e6, 2),
+        }
+    await engine.dispose()
+    return report
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--books", type=int, default=5000)
+    p.add_argument("--sizes", type=lambda v: [int(x) for x in v.split(",")], default=[20, 100, 1000])
+    p.add_argument("--rows-per-measure", type=int, default=20000, help="baris total per pengukuran")
+    p.add_argument("--min-iterations", type=int, default=5)
+    p.add_argument("--json", default=None, help="simpan hasil ke file JSON")
+    args = p.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ.update({
+            "PROJECT_DB_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+            "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+            "METRICS": "0",  # event SQLAlchemy metrics menambah biaya per query yang sama di kedua jalur
+        })
+        report = asyncio.run(run(args))
+
+    print(json.dumps(report, indent=2))
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
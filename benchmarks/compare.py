@@ -0,0 +1,114 @@
+"""Bandingkan dua hasil loadtest.py (baseline vs kandidat) dan tandai regresi.
+
+Regresi = throughput turun atau p95/p99 naik lebih dari --threshold persen
+(perubahan latency di bawah --min-ms diabaikan sebagai noise), atau jumlah error
+bertambah. Exit code 1 kalau ada regresi, jadi bisa dipakai di CI.
+
+    python benchmarks/compare.py benchmarks/baselines/main.json benchmarks/results/abc123-20250101-120000.json
+    python benchmarks/compare.py base.json new.json --threshold 5 --json diff.json
+"""
+import sys
+import json
+import argparse
+from pathlib import Path
+
+# metrik, arah "lebih baik" (+1 = makin besar makin baik)
+METRICS = (("rps", 1), ("p50_ms", -1), ("p95_ms", -1), ("p99_ms", -1))
+GUARDED = ("rps", "p95_ms", "p99_ms")  # p50 ditampilkan tapi tidak menggagalkan
+
+
+def _rows(report: dict) -> dict[str, dict]:
+    rows = {}
+    for phase, res in report.get("phases", {}).items():
+        rows[phase] = res
+        for op, r in res.get("ops", {}).items():
+            rows[f"{phase}/{op}"] = r
+    return rows
+
+
+def _pct(base, new) -> float | None:
+    if base in (None, 0) or new is None:
+        return None
+    return (new - base) / base * 100
+
+
+def compare(base: dict, new: dict, threshold: float, min_ms: float) -> tuple[list[dict], list[str]]:
+    diffs, regressions = [], []
+    base_rows, new_rows = _rows(base), _rows(new)
+    for name in [n for n in base_rows if n in new_rows]:
+        b, n = base_rows[name], new_rows[name]
+        row = {"name": name}
+        for metric, better in METRICS:
+            change = _pct(b.get(metric), n.get(metric))
+            row[metric] = {"base": b.get(metric), "new": n.get(metric), "change_pct": None if change is None else round(change, 1)}
+            if change is None or metric not in GUARDED:
+                continue
+            worse = -change if better > 0 else change
+            noise = metric.endswith("_ms") and abs(n[metric] - b[metric]) < min_ms
+            if worse > threshold and not noise:
+                regressions.append(f"{name}: {metric} {b[metric]} -> {n[metric]} ({change:+.1f}%)")
+        if n.get("errors", 0) > b.get("errors", 0):
+            regressions.append(f"{name}: error {b.get('errors', 0)} -> {n['errors']}")
+        diffs.append(row)
+
+    for service, peak in new.get("rss_peak_mb", {}).items():
+        base_peak = base.get("rss_peak_mb", {}).get(service)
+        change = _pct(base_peak, peak)
+        diffs.append({"name": f"rss/{service}", "rss_mb": {
+            "base": base_peak, "new": peak, "change_pct": None if change is None else round(change, 1),
+        }})
+        if change is not None and change > threshold:
+            regressions.append(f"rss {service}: {base_peak} MB -> {peak} MB ({change:+.1f}%)")
+    return diffs, regressions
+
+
+def _describe(report: dict) -> str:
+    meta = report.get("meta", {})
+    commit = (meta.get("commit") or "?")[:10] + (" (dirty)" if meta.get("dirty") else "")
+    return f"{commit} {meta.get('timestamp', '')} {meta.get('commit_subject') or ''}".strip()
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("baseline")
+    p.add_argument("candidate")
+    p.add_argument("--threshold", type=float, default=10, help="persen perubahan yang dianggap regresi")
+    p.add_argument("--min-ms", type=float, default=1.0, help="selisih latency di bawah ini diabaikan")
+    p.add_argument("--json", default=None, help="simpan perbandingan ke file JSON")
+    args = p.parse_args()
+
+    base = json.loads(Path(args.baseline).read_text())
+    new = json.loads(Path(args.candidate).read_text())
+    print(f"baseline : {_describe(base)}")
+    print(f"kandidat : {_describe(new)}")
+    if base.get("config") != new.get("config"):
+        changed = sorted(k for k in set(base.get("config", {})) | set(new.get("config", {}))
+                         if base.get("config", {}).get(k) != new.get("config", {}).get(k))
+        print(f"PERINGATAN: argumen run berbeda ({', '.join(changed)}); angka mungkin tidak sebanding")
+    if base.get("meta", {}).get("platform") != new.get("meta", {}).get("platform"):
+        print("PERINGATAN: hasil dari mesin/platform berbeda")
+
+    diffs, regressions = compare(base, new, args.threshold, args.min_ms)
+
+    fmt = lambda v: "-" if v is None else v
+    print(f"\n{'':<26}{'metrik':<8}{'baseline':>11}{'kandidat':>11}{'ubah %':>9}")
+    for row in diffs:
+        for metric, val in row.items():
+            if metric == "name":
+                continue
+            print(f"{row['name']:<26}{metric:<8}{fmt(val['base']):>11}{fmt(val['new']):>11}{fmt(val['change_pct']):>9}")
+
+    if regressions:
+        print(f"\nREGRESI (> {args.threshold}%):")
+        for line in regressions:
+            print(f"  {line}")
+    else:
+        print("\ntidak ada regresi")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({"diffs": diffs, "regressions": regressions}, indent=2))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
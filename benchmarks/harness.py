@@ -0,0 +1,206 @@
+"""Alat bersama untuk benchmark: menjalankan service di subprocess, sampling RSS, statistik latency.
+
+Dipakai loadtest.py; bisa juga di-import benchmark lain yang butuh auth + project + gateway.
+"""
+import os
+import sys
+import time
+import platform
+import threading
+import subprocess
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+SERVICES_DIR = ROOT / "services"
+SECRET = "bench-secret"
+
+# =========================
+# STATISTIK
+# =========================
+def percentiles(samples: list[float]) -> dict:
+    # nearest-rank, dalam ms; sama dengan bench_loans.py supaya angkanya bisa dibandingkan
+    if not samples:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None, "mean_ms": None}
+    s = sorted(samples)
+    pick = lambda p: round(s[min(len(s) - 1, int(len(s) * p))] * 1000, 2)
+    return {
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "max_ms": round(s[-1] * 1000, 2),
+        "mean_ms": round(sum(s) / len(s) * 1000, 2),
+    }
+
+
+# =========================
+# RSS (Linux /proc)
+# =========================
+def _children(pid: int) -> list[int]:
+    # worker uvicorn, process pool bcrypt / ingest PDF: semuanya dihitung ke service induknya
+    found = []
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                found.extend(int(c) for c in f.read().split())
+    except OSError:
+        return []
+    return found
+
+
+def _rss_bytes(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def tree_rss(pid: int) -> int:
+    total, stack = 0, [pid]
+    while stack:
+        p = stack.pop()
+        total += _rss_bytes(p)
+        stack.extend(_children(p))
+    return total
+
+
+class RssSampler:
+    """Sampling RSS pohon proses tiap service di thread terpisah.
+
+    ``peak`` = puncak sepanjang run; ``take_phase()`` mengembalikan puncak sejak
+    pemanggilan sebelumnya (dipanggil di akhir tiap fase). Di luar Linux semua angka None.
+    """
+
+    def __init__(self, pids: dict[str, int], interval: float = 0.1):
+        self.pids = pids
+        self.interval = interval
+        self.supported = os.path.isdir("/proc/self/task")
+        self.peak = dict.fromkeys(pids, 0)
+        self._phase = dict.fromkeys(pids, 0)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def start(self) -> "RssSampler":
+        if self.supported:
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                for name, pid in self.pids.items():
+                    rss = tree_rss(pid)
+                    self.peak[name] = max(self.peak[name], rss)
+                    self._phase[name] = max(self._phase[name], rss)
+
+    def _mb(self, values: dict[str, int]) -> dict[str, float | None]:
+        return {k: round(v / 1048576, 1) if self.supported else None for k, v in values.items()}
+
+    def take_phase(self) -> dict[str, float | None]:
+        with self._lock:
+            result = self._mb(self._phase)
+            self._phase = dict.fromkeys(self.pids, 0)
+        return result
+
+    def peaks(self) -> dict[str, float | None]:
+        with self._lock:
+            return self._mb(self.peak)
+
+
+# =========================
+# SERVICE SUBPROCESS
+# =========================
+def start_service(name: str, port: int, env: dict, workers: int = 1, log_dir: str | None = None) -> subprocess.Popen:
+    """uvicorn app.main:app dari services/<name>, menunggu /health sampai 200."""
+    out = open(os.path.join(log_dir, f"{name}.log"), "wb") if log_dir else subprocess.DEVNULL
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning",
+         "--workers", str(workers), "--timeout-keep-alive", "120"],
+        cwd=SERVICES_DIR / name, env={**os.environ, **env}, stdout=out, stderr=subprocess.STDOUT,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{name} berhenti saat start (exit {proc.returncode}), lihat {name}.log")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"{name} tidak bisa start")
+
+
+def stop_service(proc: subprocess.Popen) -> None:
+    proc.terminate()
+    try:
+        proc.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+# =========================
+# METADATA RUN
+# =========================
+def _git(*args: str) -> str | None:
+    try:
+        return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True, timeout=30).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_metadata() -> dict:
+    return {
+        "commit": _git("rev-parse", "HEAD"),
+        "commit_subject": _git("log", "-1", "--format=%s"),
+        # perubahan lokal yang belum di-commit ikut terukur; ditandai supaya tidak dikira baseline bersih
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+# =========================
+# PDF SINTETIS
+# =========================
+def make_pdf(pages: int, tag: str, filler_kb: int = 0) -> bytes:
+    """PDF valid dengan teks per halaman; ``tag`` membuat isinya unik (tidak kena dedup sha256)."""
+    objects: list[bytes] = []
+    kids = " ".join(f"{4 + i * 2} 0 R" for i in range(pages))
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for i in range(pages):
+        text = f"BT /F1 18 Tf 72 720 Td (Benchmark {tag} halaman {i + 1}) Tj ET"
+        if filler_kb and i == 0:
+            # komentar PDF: menambah ukuran file tanpa mengubah hasil render
+            text += "\n%" + "x" * (filler_kb * 1024)
+        stream = text.encode()
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {5 + i * 2} 0 R "
+            f"/Resources << /Font << /F1 3 0 R >> >> >>".encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for n, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % n + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
@@ -18,7 +18,7 @@ GATEWAY_APP="gateway-service"
 # sesuai .env Anda
 JWT_SECRET="CHANGE_ME_SUPER_SECRET"
 JWT_ALG="HS256"
-JWT_EXPIRE_MIN="120"
+JWT_EXPIRE_MIN="15"
 ADMIN_USERNAME="admin"
 ADMIN_PASSWORD="admin123"
 
@@ -119,6 +119,9 @@ az containerapp create \
   --env-vars \
     AUTH_SERVICE_URL="http://${AUTH_APP}:8000" \
     PROJECT_SERVICE_URL="http://${PROJ_APP}:8000" \
+    JWT_SECRET="$JWT_SECRET" \
+    JWT_ALG="$JWT_ALG" \
+    GATEWAY_TRUSTED_PROXY_HOPS=1 \
   -o none
 
 GATEWAY_FQDN="$(az containerapp show -g "$RG_NAME" -n "$GATEWAY_APP" --query properties.configuration.ingress.fqdn -o tsv)"
@@ -1,6 +1,9 @@
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.engine import make_url, URL
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import declarative_base
+
+from . import metrics
 
 
 DATABASE_URL = os.getenv("USER_DB_URL")
@@ -8,17 +11,55 @@ DATABASE_URL = os.getenv("USER_DB_URL")
 if not DATABASE_URL:
     raise RuntimeError("USER_DB_URL environment variable is not set")
 
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=True,
-)
+# Pool & cache (diabaikan untuk SQLite)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # detik; -1 = tidak pernah
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))  # 0 = matikan (mis. di belakang pgbouncer)
+
+_ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def _async_url(raw: str) -> tuple[URL, dict]:
+    # URL lama (postgresql+psycopg2://...?sslmode=require) tetap dipakai, driver diganti ke versi async
+    url = make_url(raw)
+    backend = url.get_backend_name()
+    if backend not in _ASYNC_DRIVERS:
+        raise RuntimeError(f"USER_DB_URL: database {backend} tidak didukung")
+    url = url.set(drivername=_ASYNC_DRIVERS[backend])
+
+    connect_args = {}
+    if backend == "postgresql":
+        # asyncpg tidak mengenal sslmode; padanannya argumen ssl
+        sslmode = url.query.get("sslmode")
+        if sslmode:
+            url = url.difference_update_query(["sslmode"])
+            connect_args["ssl"] = sslmode
+        connect_args["prepared_statement_cache_size"] = DB_STATEMENT_CACHE_SIZE
+        connect_args["statement_cache_size"] = DB_STATEMENT_CACHE_SIZE
+    return url, connect_args
+
+
+def _engine_kwargs(url: URL, connect_args: dict) -> dict:
+    kwargs = {"pool_pre_ping": True, "connect_args": connect_args}
+    if url.get_backend_name() != "sqlite":
+        kwargs.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    return kwargs
+
+
+_url, _connect_args = _async_url(DATABASE_URL)
+engine = create_async_engine(_url, **_engine_kwargs(_url, _connect_args))
+metrics.instrument_engine(engine, "primary")
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
\ No newline at end of file
+async def get_db():
+    async with SessionLocal() as db:
+        yield db
\ No newline at end of file
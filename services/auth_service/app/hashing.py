@@ -0,0 +1,125 @@
+import os
+import time
+import asyncio
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from passlib.context import CryptContext
+from prometheus_client import Counter, Gauge, Histogram
+
+# =========================
+# HASH POOL CONFIG
+# =========================
+HASH_WORKERS = max(1, int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 1))))
+# jumlah maksimum hash/verify yang sedang jalan + antre; lebih dari ini ditolak (503)
+HASH_QUEUE_SIZE = max(1, int(os.getenv("HASH_QUEUE_SIZE", str(HASH_WORKERS * 8))))
+HASH_RETRY_AFTER = os.getenv("HASH_RETRY_AFTER", "1")  # detik, untuk header Retry-After
+
+# dipakai di proses worker (modul ini di-import ulang di sana)
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+BCRYPT_LATENCY = Histogram(
+    "auth_bcrypt_duration_seconds", "hash/verify bcrypt di process pool, termasuk waktu antre",
+    ["op"], buckets=(0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+BCRYPT_REJECTED = Counter("auth_bcrypt_rejected_total", "hash/verify yang ditolak karena antrean penuh")
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify(password: str, password_hash: str) -> bool:
+    return pwd_context.verify(password, password_hash)
+
+
+def _warmup() -> None:
+    pass
+
+
+class HashPoolBusy(Exception):
+    """Antrean hash penuh: client sebaiknya mencoba lagi setelah Retry-After."""
+
+
+class HashPool:
+    """bcrypt di process pool terpisah, dengan antrean terbatas (admission control).
+
+    bcrypt menahan CPU puluhan ms per panggilan; di proses lain event loop auth
+    service tetap responsif dan throughput login naik sesuai jumlah core.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: ProcessPoolExecutor | None = None
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self._latencies: deque[float] = deque(maxlen=1024)  # detik, termasuk waktu antre
+
+    def start(self) -> None:
+        if self._executor is None:
+            # spawn: worker tidak mewarisi event loop / koneksi DB dari proses utama
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            # proses worker dibuat sekarang, bukan saat login pertama
+            for _ in range(self.workers):
+                self._executor.submit(_warmup)
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            BCRYPT_REJECTED.inc()
+            raise HashPoolBusy()
+        self.start()
+
+        self.pending += 1
+        t0 = time.perf_counter()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        except BrokenProcessPool:
+            # worker mati (mis. OOM): buat pool baru untuk request berikutnya
+            self.shutdown(wait=False)
+            raise HashPoolBusy()
+        finally:
+            self.pending -= 1
+        elapsed = time.perf_counter() - t0
+        self._latencies.append(elapsed)
+        BCRYPT_LATENCY.labels("hash" if fn is _hash else "verify").observe(elapsed)
+        self.completed += 1
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def verify(self, password: str, password_hash: str) -> bool:
+        return await self._run(_verify, password, password_hash)
+
+    def stats(self) -> dict:
+        lat = sorted(self._latencies)
+
+        def pct(p: float) -> float | None:
+            return round(lat[min(len(lat) - 1, int(p * len(lat)))] * 1000, 2) if lat else None
+
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "queued": max(0, self.pending - self.workers),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "latency_ms_p50": pct(0.50),
+            "latency_ms_p95": pct(0.95),
+            "latency_ms_p99": pct(0.99),
+        }
+
+
+hash_pool = HashPool(HASH_WORKERS, HASH_QUEUE_SIZE)
+Gauge("auth_bcrypt_pending", "hash/verify yang sedang jalan + antre").set_function(lambda: hash_pool.pending)
@@ -2,27 +2,25 @@ import os
 from datetime import datetime, timedelta, timezone
 
 from fastapi import FastAPI, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from passlib.context import CryptContext
 from jose import jwt
 
-from .database import Base, engine, get_db
+from .database import Base, engine, get_db, SessionLocal
 from .models import User
-from .schemas import RegisterIn, LoginIn, TokenOut
+from .schemas import RegisterIn, LoginIn, TokenOut, RefreshIn
+from . import refresh_tokens, metrics
+from .hashing import hash_pool, HashPoolBusy, HASH_RETRY_AFTER
 
 JWT_SECRET = os.getenv("JWT_SECRET", "CHANGE_ME")
 JWT_ALG = os.getenv("JWT_ALG", "HS256")
-JWT_EXPIRE_MIN = int(os.getenv("JWT_EXPIRE_MIN", "120"))
+JWT_EXPIRE_MIN = int(os.getenv("JWT_EXPIRE_MIN", "15"))  # pendek; diperpanjang lewat /refresh
 
 ADMIN_USERNAME = os.getenv("ADMIN_USERNAME", "admin")
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "admin123")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 app = FastAPI(redirect_slashes=False, title="Auth Service")
-
-Base.metadata.create_all(bind=engine)
+metrics.install(app)
 
 # =========================
 # UTIL
@@ -36,28 +34,66 @@ def create_access_token(sub: str, role: str) -> str:
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALG)
 
+def _token_response(user: User, refresh_token: str) -> dict:
+    return {
+        "access_token": create_access_token(user.username, user.role),
+        "token_type": "bearer",
+        "expires_in": JWT_EXPIRE_MIN * 60,
+        "refresh_token": refresh_token,
+    }
+
+# bcrypt jalan di process pool (hashing.py); antrean penuh = 503 + Retry-After
+def _busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Server sedang sibuk, coba lagi sebentar.",
+        headers={"Retry-After": HASH_RETRY_AFTER},
+    )
+
+async def hash_password(password: str) -> str:
+    try:
+        return await hash_pool.hash(password)
+    except HashPoolBusy:
+        raise _busy()
+
+async def verify_password(password: str, password_hash: str) -> bool:
+    try:
+        return await hash_pool.verify(password, password_hash)
+    except HashPoolBusy:
+        raise _busy()
+
 # =========================
-# SEED ADMIN
+# DATABASE INIT & SEED ADMIN
 # =========================
 @app.on_event("startup")
-def seed_admin():
-    db = Session(bind=engine)
-    try:
-        admin = db.execute(
+def start_hash_pool():
+    hash_pool.start()
+
+@app.on_event("shutdown")
+def stop_hash_pool():
+    hash_pool.shutdown()
+
+@app.on_event("startup")
+async def init_db():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+@app.on_event("startup")
+async def seed_admin():
+    async with SessionLocal() as db:
+        admin = (await db.execute(
             select(User).where(User.username == ADMIN_USERNAME)
-        ).scalar_one_or_none()
+        )).scalar_one_or_none()
 
         if not admin:
             admin = User(
                 username=ADMIN_USERNAME,
-                password_hash=pwd_context.hash(ADMIN_PASSWORD),
+                password_hash=await hash_password(ADMIN_PASSWORD),
                 role="admin"
             )
             db.add(admin)
-            db.commit()
+            await db.commit()
             print("Admin account created")
-    finally:
-        db.close()
 
 # =========================
 # ROUTES
@@ -66,34 +102,59 @@ def seed_admin():
 def health():
     return {"status": "ok"}
 
+@app.get("/health/hashing")
+def hashing_stats():
+    # kedalaman antrean & latensi bcrypt (untuk sizing HASH_WORKERS / HASH_QUEUE_SIZE)
+    return hash_pool.stats()
+
 @app.post("/register", status_code=status.HTTP_201_CREATED)
-def register(payload: RegisterIn, db: Session = Depends(get_db)):
-    existing = db.execute(
+async def register(payload: RegisterIn, db: AsyncSession = Depends(get_db)):
+    existing = (await db.execute(
         select(User).where(User.username == payload.username)
-    ).scalar_one_or_none()
+    )).scalar_one_or_none()
 
     if existing:
         raise HTTPException(status_code=409, detail="Username sudah terpakai.")
+    # koneksi pool dilepas selama menunggu antrean bcrypt (bisa lama saat burst)
+    await db.rollback()
 
     user = User(
         username=payload.username,
-        password_hash=pwd_context.hash(payload.password),
+        password_hash=await hash_password(payload.password),
         role="user"   #  user only
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
 
     return {"id": user.id, "username": user.username, "role": "user"}
 
 @app.post("/login", response_model=TokenOut)
-def login(payload: LoginIn, db: Session = Depends(get_db)):
-    user = db.execute(
+async def login(payload: LoginIn, db: AsyncSession = Depends(get_db)):
+    user = (await db.execute(
         select(User).where(User.username == payload.username)
-    ).scalar_one_or_none()
-
-    if not user or not pwd_context.verify(payload.password, user.password_hash):
+    )).scalar_one_or_none()
+    # koneksi pool dilepas selama menunggu antrean bcrypt; user dilepas dari session dulu
+    # supaya atributnya tidak di-expire oleh rollback
+    if user:
+        db.expunge(user)
+    await db.rollback()
+
+    if not user or not await verify_password(payload.password, user.password_hash):
         raise HTTPException(status_code=401, detail="Username/password salah.")
 
-    token = create_access_token(user.username, user.role)
-    return {"access_token": token, "token_type": "bearer"}
+    await refresh_tokens.purge_expired(db, user)
+    refresh_token = refresh_tokens.issue(db, user)
+    await db.commit()
+    return _token_response(user, refresh_token)
+
+@app.post("/refresh", response_model=TokenOut)
+async def refresh(payload: RefreshIn, db: AsyncSession = Depends(get_db)):
+    # tanpa bcrypt: cukup satu lookup hash token + rotasi
+    user, refresh_token = await refresh_tokens.rotate(db, payload.refresh_token)
+    return _token_response(user, refresh_token)
+
+@app.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(payload: RefreshIn, db: AsyncSession = Depends(get_db)):
+    await refresh_tokens.revoke(db, payload.refresh_token)
+    return None
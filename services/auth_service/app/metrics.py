@@ -0,0 +1,195 @@
+import os
+import re
+import time
+import uuid
+import logging
+from contextvars import ContextVar
+
+from prometheus_client import Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client.openmetrics.exposition import (
+    CONTENT_TYPE_LATEST as OPENMETRICS_CONTENT_TYPE,
+    generate_latest as generate_openmetrics,
+)
+
+# =========================
+# METRICS CONFIG
+# =========================
+# Modul ini sama persis di gateway_service, auth_service dan project_service (tiap service di-build terpisah).
+METRICS_ENABLED = os.getenv("METRICS", "1") == "1"
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "500"))  # query lebih lama dari ini di-log; 0 = mati
+
+REQUEST_ID_HEADER = "x-request-id"
+_REQUEST_ID_RE = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# SQL, checkout pool, decode JWT: umumnya di bawah 1 ms
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "Durasi request sampai body respons selesai dikirim",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "Request yang sedang diproses")
+DB_QUERY = Histogram(
+    "db_query_duration_seconds", "Durasi eksekusi statement SQL", ["engine", "operation"], buckets=FAST_BUCKETS,
+)
+DB_POOL_WAIT = Histogram(
+    "db_pool_checkout_seconds", "Waktu menunggu koneksi dari pool (termasuk membuka koneksi baru)",
+    ["engine"], buckets=FAST_BUCKETS,
+)
+DB_POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Koneksi pool yang sedang dipakai", ["engine"])
+JWT_VERIFY = Histogram(
+    "jwt_verify_duration_seconds", "Verifikasi JWT (hit = dari token cache)", ["cache"], buckets=FAST_BUCKETS,
+)
+
+_request_id: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+logger = logging.getLogger(__name__)
+
+
+# =========================
+# REQUEST ID
+# =========================
+def request_id() -> str | None:
+    return _request_id.get()
+
+
+def exemplar() -> dict | None:
+    # ditempel ke observasi histogram; terlihat di format OpenMetrics (lompat dari metrik ke request)
+    rid = _request_id.get()
+    return {"request_id": rid} if rid else None
+
+
+def _incoming_request_id(headers) -> str | None:
+    for name, value in headers:
+        if name == b"x-request-id":
+            rid = value.decode("latin-1")
+            return rid if _REQUEST_ID_RE.fullmatch(rid) else None
+    return None
+
+
+# =========================
+# ASGI MIDDLEWARE
+# =========================
+class MetricsMiddleware:
+    """Latency per route, request in-flight dan X-Request-ID.
+
+    ID dari header X-Request-ID dipakai ulang kalau formatnya valid, selain itu dibuat
+    baru. ID ditulis ke header request (jadi ikut diteruskan proxy yang menyalin header)
+    dan ke header respons. Route dicatat sebagai template path (``/books/{id_buku}``),
+    bukan path mentah, supaya jumlah label tetap kecil.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        rid = _incoming_request_id(scope["headers"])
+        if rid is None:
+            rid = uuid.uuid4().hex
+            scope["headers"] = [*scope["headers"], (b"x-request-id", rid.encode())]
+        token = _request_id.set(rid)
+
+        status = 500
+        stream = False
+
+        async def send_wrapper(message):
+            nonlocal status, stream
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                # header dari upstream (respons yang di-proxy) diganti, bukan digandakan
+                headers = [(k, v) for k, v in message.get("headers", []) if k.lower() != b"x-request-id"]
+                stream = any(k.lower() == b"content-type" and v.startswith(b"text/event-stream") for k, v in headers)
+                headers.append((b"x-request-id", rid.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # stream SSE terbuka berjam-jam; tidak dihitung sebagai latency request
+            if not stream:
+                route = scope.get("route")
+                HTTP_LATENCY.labels(
+                    scope["method"], getattr(route, "path", None) or "unmatched", str(status)
+                ).observe(time.perf_counter() - started, exemplar={"request_id": rid})
+            _request_id.reset(token)
+
+
+def install(app) -> None:
+    """Pasang middleware dan endpoint /metrics (format Prometheus / OpenMetrics)."""
+    if not METRICS_ENABLED:
+        return
+    from fastapi import Request
+    from fastapi.responses import Response
+
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics", include_in_schema=False)
+    def prometheus_metrics(request: Request):
+        # exemplar (request_id) hanya ada di format OpenMetrics
+        if "application/openmetrics-text" in request.headers.get("accept", ""):
+            return Response(generate_openmetrics(REGISTRY), media_type=OPENMETRICS_CONTENT_TYPE)
+        return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
+
+# =========================
+# SQLALCHEMY (durasi query, tunggu pool)
+# =========================
+def _operation(statement: str) -> str:
+    word = statement.lstrip()[:8].split(None, 1)
+    word = word[0].upper() if word else ""
+    return word if word in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "PRAGMA") else "OTHER"
+
+
+def instrument_engine(engine, name: str) -> None:
+    """Durasi statement (event cursor) dan waktu checkout koneksi pool untuk satu engine."""
+    if not METRICS_ENABLED:
+        return
+    from sqlalchemy import event
+
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        DB_QUERY.labels(name, _operation(statement)).observe(elapsed, exemplar=exemplar())
+        if DB_SLOW_QUERY_MS and elapsed * 1000 >= DB_SLOW_QUERY_MS:
+            logger.warning("query lambat %.0f ms [%s] request=%s: %s", elapsed * 1000, name, request_id(), statement[:500])
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(context):
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+    @event.listens_for(sync_engine, "checkout")
+    def _checkout(dbapi_conn, record, proxy):
+        DB_POOL_CHECKED_OUT.labels(name).inc()
+
+    @event.listens_for(sync_engine, "checkin")
+    def _checkin(dbapi_conn, record):
+        DB_POOL_CHECKED_OUT.labels(name).dec()
+
+    # tidak ada event "sebelum checkout": Pool.connect dibungkus untuk mengukur waktu tunggunya
+    pool = sync_engine.pool
+    connect = pool.connect
+
+    def timed_connect():
+        started = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            DB_POOL_WAIT.labels(name).observe(time.perf_counter() - started, exemplar=exemplar())
+
+    pool.connect = timed_connect
@@ -0,0 +1,111 @@
+import os
+import uuid
+import secrets
+import hashlib
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException, status
+from sqlalchemy import select, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import User, RefreshToken
+
+# =========================
+# REFRESH TOKEN CONFIG
+# =========================
+REFRESH_EXPIRE_DAYS = int(os.getenv("REFRESH_EXPIRE_DAYS", "14"))
+# token yang baru saja dirotasi dipakai lagi dalam jendela ini = refresh bersamaan (dua tab, retry
+# client), bukan pencurian: ditolak 401 tanpa mencabut family-nya
+REFRESH_REUSE_GRACE_SECONDS = float(os.getenv("REFRESH_REUSE_GRACE_SECONDS", "10"))
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _aware(dt: datetime) -> datetime:
+    # SQLite mengembalikan datetime tanpa zona; semua nilai disimpan dalam UTC
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def _invalid() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Refresh token tidak valid atau kadaluarsa.",
+    )
+
+
+def issue(db: AsyncSession, user: User, family_id: str | None = None) -> str:
+    # token acak (bukan JWT); yang disimpan hanya hash-nya. Pemanggil yang commit.
+    token = secrets.token_urlsafe(32)
+    db.add(RefreshToken(
+        token_hash=_hash(token),
+        user_id=user.id,
+        family_id=family_id or uuid.uuid4().hex,
+        expires_at=_now() + timedelta(days=REFRESH_EXPIRE_DAYS),
+    ))
+    return token
+
+
+async def purge_expired(db: AsyncSession, user: User) -> None:
+    await db.execute(
+        delete(RefreshToken).where(RefreshToken.user_id == user.id, RefreshToken.expires_at < _now())
+    )
+
+
+async def rotate(db: AsyncSession, token: str) -> tuple[User, str]:
+    # refresh token sekali pakai: yang lama dicabut, yang baru masuk family yang sama
+    row = (await db.execute(
+        select(RefreshToken, User)
+        .join(User, User.id == RefreshToken.user_id)
+        .where(RefreshToken.token_hash == _hash(token))
+    )).one_or_none()
+    if row is None:
+        raise _invalid()
+    rt, user = row
+
+    if rt.revoked_at is not None:
+        if _now() - _aware(rt.revoked_at) <= timedelta(seconds=REFRESH_REUSE_GRACE_SECONDS):
+            raise _invalid()
+        # token lama dipakai lagi jauh setelah dirotasi = kemungkinan dicuri: cabut seluruh family
+        await revoke_family(db, rt.family_id)
+        await db.commit()
+        raise _invalid()
+    if _aware(rt.expires_at) <= _now():
+        raise _invalid()
+
+    # UPDATE bersyarat: dua request refresh bersamaan dengan token yang sama, hanya satu yang menang
+    claimed = await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.id == rt.id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=_now())
+    )
+    if claimed.rowcount != 1:
+        await db.rollback()
+        raise _invalid()
+
+    new_token = issue(db, user, rt.family_id)
+    await db.commit()
+    return user, new_token
+
+
+async def revoke_family(db: AsyncSession, family_id: str) -> None:
+    await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.family_id == family_id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=_now())
+    )
+
+
+async def revoke(db: AsyncSession, token: str) -> None:
+    # logout: cabut token ini beserta semua rotasinya (token tak dikenal diabaikan)
+    family_id = (await db.execute(
+        select(RefreshToken.family_id).where(RefreshToken.token_hash == _hash(token))
+    )).scalar_one_or_none()
+    if family_id:
+        await revoke_family(db, family_id)
+        await db.commit()
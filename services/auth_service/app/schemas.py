@@ -11,3 +11,8 @@ class LoginIn(BaseModel):
 class TokenOut(BaseModel):
     access_token: str
     token_type: str = "bearer"
+    expires_in: int  # detik, umur access token
+    refresh_token: str
+
+class RefreshIn(BaseModel):
+    refresh_token: str = Field(min_length=1, max_length=200)
@@ -0,0 +1,86 @@
+"""Refresh bersamaan dengan token yang sama: satu menang, yang lain 401, family tetap hidup.
+
+    cd services/auth_service && python -m pytest -q tests
+"""
+import os
+import sys
+import asyncio
+import tempfile
+from datetime import timedelta
+
+import pytest
+
+_workdir = tempfile.mkdtemp()
+os.environ.setdefault("USER_DB_URL", f"sqlite:///{os.path.join(_workdir, 'auth.db')}")
+os.environ.setdefault("JWT_SECRET", "test-secret")
+os.environ.setdefault("METRICS", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import HTTPException  # noqa: E402
+from sqlalchemy import select  # noqa: E402
+
+from app import refresh_tokens  # noqa: E402
+from app.database import Base, engine, SessionLocal  # noqa: E402
+from app.models import User, RefreshToken  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def token():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    async with SessionLocal() as db:
+        user = User(username="pembaca", password_hash="x")
+        db.add(user)
+        await db.flush()
+        token = refresh_tokens.issue(db, user)
+        await db.commit()
+    yield token
+    await engine.dispose()
+
+
+async def _rotate(token: str):
+    async with SessionLocal() as db:
+        try:
+            return (await refresh_tokens.rotate(db, token))[1]
+        except HTTPException as exc:
+            return exc
+
+
+async def _revoked_count() -> int:
+    async with SessionLocal() as db:
+        rows = (await db.execute(select(RefreshToken.revoked_at))).scalars().all()
+    return sum(r is not None for r in rows)
+
+
+@pytest.mark.anyio
+async def test_concurrent_refresh_keeps_family(token):
+    results = await asyncio.gather(_rotate(token), _rotate(token))
+    winners = [r for r in results if isinstance(r, str)]
+    losers = [r for r in results if isinstance(r, HTTPException)]
+    assert len(winners) == 1 and len(losers) == 1
+    assert losers[0].status_code == 401
+
+    # yang kalah tidak mencabut family: token penerus masih bisa dirotasi
+    assert await _revoked_count() == 1
+    assert isinstance(await _rotate(winners[0]), str)
+
+
+@pytest.mark.anyio
+async def test_reuse_after_grace_revokes_family(token):
+    successor = await _rotate(token)
+    async with SessionLocal() as db:
+        rt = (await db.execute(
+            select(RefreshToken).where(RefreshToken.token_hash == refresh_tokens._hash(token))
+        )).scalar_one()
+        rt.revoked_at = rt.revoked_at - timedelta(seconds=refresh_tokens.REFRESH_REUSE_GRACE_SECONDS + 1)
+        await db.commit()
+
+    reused = await _rotate(token)
+    assert isinstance(reused, HTTPException) and reused.status_code == 401
+    assert isinstance(await _rotate(successor), HTTPException)
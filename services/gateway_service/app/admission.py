@@ -0,0 +1,243 @@
+import os
+import json
+import math
+import time
+import logging
+from collections import OrderedDict
+from typing import Callable, NamedTuple
+
+# =========================
+# ADMISSION CONFIG (RATE LIMIT + CONCURRENCY)
+# =========================
+RATE_LIMIT_ENABLED = os.getenv("GATEWAY_RATE_LIMIT", "1") == "1"
+RATE_BACKEND = os.getenv("GATEWAY_RATE_BACKEND", "memory")  # memory | redis
+RATE_REDIS_URL = os.getenv("GATEWAY_RATE_REDIS_URL", os.getenv("GATEWAY_CACHE_REDIS_URL", "redis://localhost:6379/0"))
+RATE_REDIS_PREFIX = os.getenv("GATEWAY_RATE_REDIS_PREFIX", "gw:rl:")
+RATE_MAX_KEYS = int(os.getenv("GATEWAY_RATE_MAX_KEYS", "100000"))  # batas memori backend memory
+# satu IP bisa berisi banyak user (NAT kantor/kampus): budget per IP = budget kelas x pengali ini
+RATE_IP_MULTIPLIER = float(os.getenv("GATEWAY_RATE_IP_MULTIPLIER", "4"))
+# jumlah proxy tepercaya di depan gateway; 0 = pakai alamat socket. Default 0: gateway yang
+# terbuka langsung (docker-compose) tidak boleh percaya X-Forwarded-For kiriman client.
+# Di belakang Azure ingress di-set 1 (deploy_azure_final.sh)
+TRUSTED_PROXY_HOPS = int(os.getenv("GATEWAY_TRUSTED_PROXY_HOPS", "0"))
+
+
+class Budget(NamedTuple):
+    rate: float   # token per detik
+    burst: float  # kapasitas bucket
+
+
+def _budget(route_class: str, default: str) -> Budget | None:
+    # format "rate,burst", mis. GATEWAY_RATE_LOGIN=0.2,5 (12/menit, burst 5); rate 0 = tanpa batas
+    rate, _, burst = os.getenv(f"GATEWAY_RATE_{route_class.upper()}", default).partition(",")
+    rate = float(rate)
+    if rate <= 0:
+        return None
+    return Budget(rate, float(burst or max(1.0, rate)))
+
+
+BUDGETS = {
+    "login": _budget("login", "0.2,5"),
+    "read": _budget("read", "20,100"),
+    "write": _budget("write", "5,20"),
+    "upload": _budget("upload", "0.2,3"),
+}
+
+logger = logging.getLogger(__name__)
+
+
+def classify(method: str, path: str) -> str | None:
+    # None = tidak dibatasi (UI, static, health, docs)
+    if path in ("/auth/login", "/auth/register"):
+        return "login"
+    if not path.startswith(("/auth/", "/api/", "/project/", "/uploads/")):
+        return None
+    if method in ("GET", "HEAD", "OPTIONS"):
+        return "read"
+    if (path.endswith("/pdf") or path.endswith("/books/bulk")) and method == "POST":
+        return "upload"
+    return "write"
+
+
+def client_ip(scope) -> str:
+    if TRUSTED_PROXY_HOPS > 0:
+        for name, value in scope.get("headers", []):
+            if name == b"x-forwarded-for":
+                hops = [h.strip() for h in value.decode("latin-1").split(",") if h.strip()]
+                if hops:
+                    # entri paling kanan ditambahkan proxy tepercaya; yang kiri bisa dipalsukan client
+                    return hops[-min(TRUSTED_PROXY_HOPS, len(hops))]
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+# =========================
+# TOKEN BUCKET: MEMORY
+# =========================
+class MemoryRateLimiter:
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()  # key -> (token, waktu)
+
+    async def hit(self, key: str, budget: Budget) -> float:
+        # 0 = diizinkan; selain itu detik yang perlu ditunggu
+        now = time.monotonic()
+        tokens, ts = self._buckets.pop(key, (budget.burst, now))
+        tokens = min(budget.burst, tokens + (now - ts) * budget.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / budget.rate
+        self._buckets[key] = (tokens, now)
+        # key paling lama tidak aktif dibuang (bucket-nya dianggap penuh lagi)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def stats(self) -> dict:
+        return {"backend": "memory", "keys": len(self._buckets)}
+
+
+# =========================
+# TOKEN BUCKET: REDIS (dipakai bersama beberapa replika gateway)
+# =========================
+_REDIS_BUCKET = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local b = redis.call('HMGET', KEYS[1], 't', 'ts')
+local tokens = tonumber(b[1]) or burst
+local ts = tonumber(b[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 't', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisRateLimiter:
+    # redis bersifat opsional: hanya dibutuhkan kalau GATEWAY_RATE_BACKEND=redis.
+    # Redis tidak bisa dihubungi = request diizinkan (fail open), bukan gateway ikut mati.
+    def __init__(self, url: str, prefix: str):
+        try:
+            import redis.asyncio as aioredis
+        except ImportError as e:
+            raise RuntimeError("GATEWAY_RATE_BACKEND=redis butuh paket redis (pip install redis)") from e
+
+        self._redis = aioredis.from_url(url)
+        self._script = self._redis.register_script(_REDIS_BUCKET)
+        self.prefix = prefix
+        self.errors = 0
+
+    async def hit(self, key: str, budget: Budget) -> float:
+        try:
+            wait = await self._script(keys=[self.prefix + key], args=[budget.rate, budget.burst, time.time()])
+            return float(wait)
+        except Exception:
+            self.errors += 1
+            logger.warning("rate limit: redis tidak bisa dihubungi", exc_info=True)
+            return 0.0
+
+    def stats(self) -> dict:
+        return {"backend": "redis", "errors": self.errors}
+
+
+def _make_limiter():
+    if RATE_BACKEND == "redis":
+        return RedisRateLimiter(RATE_REDIS_URL, RATE_REDIS_PREFIX)
+    if RATE_BACKEND == "memory":
+        return MemoryRateLimiter(RATE_MAX_KEYS)
+    raise RuntimeError(f"GATEWAY_RATE_BACKEND tidak dikenal: {RATE_BACKEND}")
+
+
+limiter = _make_limiter()
+
+# jumlah request yang ditolak, per kelas route (429) dan karena upstream penuh (503)
+rejected = {"limited": {c: 0 for c in BUDGETS}, "shed": 0}
+
+
+def stats() -> dict:
+    return {
+        "rate_limit": RATE_LIMIT_ENABLED,
+        "budgets": {c: b._asdict() if b else None for c, b in BUDGETS.items()},
+        **rejected,
+        **limiter.stats(),
+    }
+
+
+# =========================
+# ASGI MIDDLEWARE
+# =========================
+async def _reject(send, status: int, detail: str, retry_after: float) -> None:
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """Rate limit per user/IP dan batas request in-flight per upstream.
+
+    Ditolak secepatnya (429 / 503 + Retry-After) sebelum menyentuh upstream, bukan
+    mengantre sampai timeout. Slot in-flight baru dilepas setelah body respons selesai
+    dikirim, jadi download/stream panjang tetap terhitung.
+    """
+
+    def __init__(self, app, *, claims: Callable[[str], dict | None], upstreams: dict, detached: tuple = ()):
+        self.app = app
+        self.claims = claims          # Authorization header -> claims terverifikasi / None
+        self.upstreams = upstreams    # prefix path -> Upstream
+        self.detached = detached      # path yang dijawab gateway sendiri (stream relay), tanpa slot upstream
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        path, method = scope["path"], scope["method"]
+        route_class = classify(method, path)
+
+        if RATE_LIMIT_ENABLED and route_class and BUDGETS[route_class]:
+            wait = await self._check_rate(scope, route_class)
+            if wait > 0:
+                rejected["limited"][route_class] += 1
+                return await _reject(send, 429, "Terlalu banyak request, coba lagi nanti.", wait)
+
+        upstream = next((u for prefix, u in self.upstreams.items() if path.startswith(prefix)), None)
+        if upstream is None or path in self.detached:
+            return await self.app(scope, receive, send)
+
+        if not upstream.try_acquire():
+            rejected["shed"] += 1
+            return await _reject(send, 503, "Layanan sedang sibuk, coba lagi sebentar.", 1)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            upstream.release()
+
+    async def _check_rate(self, scope, route_class: str) -> float:
+        budget = BUDGETS[route_class]
+        # login tidak punya identitas user, jadi budget IP-nya tidak dilonggarkan
+        if route_class == "login":
+            ip_budget = budget
+        else:
+            ip_budget = Budget(budget.rate * RATE_IP_MULTIPLIER, budget.burst * RATE_IP_MULTIPLIER)
+
+        wait = await limiter.hit(f"{route_class}:ip:{client_ip(scope)}", ip_budget)
+        if wait > 0 or route_class == "login":
+            return wait
+
+        authorization = next((v.decode("latin-1") for k, v in scope.get("headers", []) if k == b"authorization"), "")
+        claims = self.claims(authorization) if authorization else None
+        if claims and claims.get("sub"):
+            wait = await limiter.hit(f"{route_class}:u:{claims['sub']}", budget)
+        return wait
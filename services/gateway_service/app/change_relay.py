@@ -0,0 +1,193 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import AsyncIterator, Callable
+
+import httpx
+
+# =========================
+# CHANGE RELAY CONFIG (SSE /api/books/changes)
+# =========================
+# 1 = satu stream ke project_service dibagi ke semua browser (butuh GATEWAY_EDGE_AUTH);
+# 0 = tiap browser di-proxy sendiri-sendiri ke upstream
+RELAY_ENABLED = os.getenv("GATEWAY_CHANGES_RELAY", "1") == "1"
+RELAY_BUFFER = int(os.getenv("GATEWAY_CHANGES_BUFFER", "1000"))        # event untuk replay Last-Event-ID
+RELAY_QUEUE = int(os.getenv("GATEWAY_CHANGES_QUEUE", "256"))           # antrean per browser sebelum diputus
+RELAY_HEARTBEAT = float(os.getenv("GATEWAY_CHANGES_HEARTBEAT", "15"))
+# stream upstream tetap dibuka sebentar setelah browser terakhir pergi (pindah halaman / reload)
+RELAY_IDLE_SECONDS = float(os.getenv("GATEWAY_CHANGES_IDLE", "60"))
+RELAY_RETRY_MS = int(os.getenv("GATEWAY_CHANGES_RETRY_MS", "3000"))
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+PING = b": ping\n\n"
+
+logger = logging.getLogger(__name__)
+
+
+class _Subscriber:
+    __slots__ = ("queue", "lagging")
+
+    def __init__(self, size: int):
+        self.queue: asyncio.Queue[bytes] = asyncio.Queue(size)
+        self.lagging = False
+
+
+class ChangeRelay:
+    """Satu stream SSE upstream, di-fan-out ke banyak koneksi browser.
+
+    Frame dari upstream diteruskan apa adanya (id event tetap milik project_service),
+    jadi ``Last-Event-ID`` dari browser bisa dijawab dari buffer relay. Putus dari
+    upstream = reconnect dengan id terakhir yang diterima, upstream yang me-replay
+    celahnya. Stream upstream baru dibuka saat ada browser dan ditutup lagi setelah
+    ``RELAY_IDLE_SECONDS`` tanpa browser.
+    """
+
+    def __init__(self, upstream, path: str, token: Callable[[], str]):
+        self.upstream = upstream
+        self.path = path
+        self.token = token   # bearer token milik gateway sendiri untuk koneksi upstream
+        self._buffer: deque[tuple[str, bytes]] = deque(maxlen=RELAY_BUFFER)
+        self._subscribers: set[_Subscriber] = set()
+        self._task: asyncio.Task | None = None
+        self._idle_since = time.monotonic()
+        self.last_id: str | None = None
+        self.connected = False
+        self.connects = 0
+        self.relayed = 0
+        self.dropped = 0
+
+    # ---------- browser ----------
+    async def stream(self, last_event_id: str | None) -> AsyncIterator[bytes]:
+        if self.last_id is None and last_event_id:
+            # relay belum pernah tersambung: mulai upstream dari posisi browser ini
+            self.last_id = last_event_id
+        replay = self._since(last_event_id) if last_event_id else []
+        sub = _Subscriber(RELAY_QUEUE)
+        self._subscribers.add(sub)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        try:
+            yield f"retry: {RELAY_RETRY_MS}\n\n".encode()
+            if replay is None:
+                yield self._reset_frame()
+            else:
+                for frame in replay:
+                    yield frame
+
+            while not (sub.lagging and sub.queue.empty()):
+                try:
+                    frame = await asyncio.wait_for(sub.queue.get(), RELAY_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield PING
+                    continue
+                yield frame
+        finally:
+            self._subscribers.discard(sub)
+            if not self._subscribers:
+                self._idle_since = time.monotonic()
+
+    def _since(self, last_event_id: str) -> list[bytes] | None:
+        # None = id tidak dikenal relay (sudah keluar dari buffer / dari sesi lain)
+        if last_event_id == self.last_id:
+            return []
+        for i, (event_id, _) in enumerate(self._buffer):
+            if event_id == last_event_id:
+                return [frame for _, frame in list(self._buffer)[i + 1:]]
+        return None
+
+    def _reset_frame(self) -> bytes:
+        id_line = f"id: {self.last_id}\n" if self.last_id else ""
+        return f"{id_line}event: reset\ndata: {{}}\n\n".encode()
+
+    def _broadcast(self, event_id: str | None, frame: bytes) -> None:
+        if event_id:
+            self._buffer.append((event_id, frame))
+            self.last_id = event_id
+        self.relayed += 1
+        for sub in list(self._subscribers):
+            try:
+                sub.queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                # browser lambat diputus; reconnect-nya mengejar dari buffer
+                sub.lagging = True
+                self._subscribers.discard(sub)
+                self.dropped += 1
+
+    def _idle(self) -> bool:
+        return not self._subscribers and time.monotonic() - self._idle_since > RELAY_IDLE_SECONDS
+
+    # ---------- upstream ----------
+    async def _run(self) -> None:
+        backoff = 0.5
+        while not self._idle():
+            headers = {
+                "authorization": f"Bearer {self.token()}",
+                "accept": "text/event-stream",
+                "accept-encoding": "identity",
+            }
+            if self.last_id:
+                headers["last-event-id"] = self.last_id
+            try:
+                resp = await self.upstream.send(
+                    "GET",
+                    self.path,
+                    headers=headers,
+                    # upstream mengirim ping tiap beberapa detik; lebih lama dari ini = koneksi mati
+                    timeout=self.upstream.timeout_with(read=RELAY_HEARTBEAT * 3),
+                )
+                try:
+                    if resp.status_code != 200:
+                        logger.warning("change relay: upstream membalas %s", resp.status_code)
+                    else:
+                        self.connected = True
+                        self.connects += 1
+                        backoff = 0.5
+                        await self._pump(resp)
+                finally:
+                    self.connected = False
+                    await resp.aclose()
+            except httpx.HTTPError:
+                logger.warning("change relay: stream upstream terputus", exc_info=True)
+            if self._idle():
+                break
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 10.0)
+
+    async def _pump(self, resp: httpx.Response) -> None:
+        lines: list[str] = []
+        event_id = None
+        async for line in resp.aiter_lines():
+            if line:
+                if line.startswith("id:"):
+                    event_id = line[3:].strip()
+                # komentar (ping) dan retry dari upstream tidak diteruskan; browser dapat dari relay
+                if not line.startswith((":", "retry:")):
+                    lines.append(line)
+                continue
+            if lines:
+                self._broadcast(event_id, ("\n".join(lines) + "\n\n").encode("utf-8"))
+            lines, event_id = [], None
+            if self._idle():
+                return
+
+    async def aclose(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "connected": self.connected,
+            "connects": self.connects,
+            "last_event_id": self.last_id,
+            "buffered": len(self._buffer),
+            "relayed": self.relayed,
+            "dropped": self.dropped,
+        }
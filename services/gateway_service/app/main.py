@@ -1,11 +1,23 @@
 import os
-import httpx
+import json
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
-from fastapi import FastAPI, Request
-from fastapi.responses import Response, HTMLResponse
+from typing import AsyncIterator, NamedTuple
+
+import anyio
+import httpx
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import Response, HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from fastapi import UploadFile, File
+
+from jose import JWTError, jwt
+
+from .upstream import Upstream
+from .token_cache import token_cache, JWT_SECRET, JWT_ALG
+from . import response_cache, singleflight, admission, metrics
+from .change_relay import ChangeRelay, RELAY_ENABLED, SSE_HEADERS
 
 BASE_DIR = Path(__file__).resolve().parent  # folder app/
 static_dir = BASE_DIR / "static"
@@ -14,7 +26,84 @@ templates_dir = BASE_DIR / "templates"
 AUTH = os.getenv("AUTH_SERVICE_URL", "http://auth_service:8000")
 PROJ = os.getenv("PROJECT_SERVICE_URL", "http://project_service:8000")
 
-app = FastAPI(title="Gateway Service")
+# Satu client (connection pool) per upstream, dipakai ulang oleh semua request.
+# URL boleh berisi beberapa replika dipisah koma, mis. http://proj-a:8000,http://proj-b:8000
+auth_upstream = Upstream.from_env("auth", AUTH, "AUTH")
+project_upstream = Upstream.from_env("project", PROJ, "PROJECT")
+UPSTREAMS = (auth_upstream, project_upstream)
+
+UPLOAD_READ_TIMEOUT = float(os.getenv("UPLOAD_READ_TIMEOUT", "60"))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_PDF_BYTES", str(50 * 1024 * 1024)))
+
+# 1 = body request/response di-pipe chunk demi chunk, 0 = mode lama (buffer penuh)
+STREAM_PROXY = os.getenv("GATEWAY_STREAM_PROXY", "1") == "1"
+
+# Validasi JWT di edge: token rusak/kadaluarsa langsung 401 tanpa hop ke project_service.
+# Default aktif kalau JWT_SECRET di-set untuk gateway (harus sama dengan auth & project service).
+EDGE_AUTH = os.getenv("GATEWAY_EDGE_AUTH", "1" if os.getenv("JWT_SECRET") else "0") == "1"
+# 1 = claims hasil decode diteruskan ke upstream di header X-Auth-Claims (JSON)
+FORWARD_CLAIMS = os.getenv("GATEWAY_FORWARD_CLAIMS", "0") == "1"
+CLAIMS_HEADER = "x-auth-claims"
+
+def _service_token() -> str:
+    # token gateway sendiri untuk stream relay; hanya dipakai kalau gateway memegang JWT_SECRET
+    return jwt.encode({"sub": "gateway", "r": "u", "exp": int(time.time()) + 300}, JWT_SECRET, algorithm=JWT_ALG)
+
+# change feed katalog: satu stream upstream untuk semua browser (token browser diverifikasi di edge)
+RELAY_CHANGES = RELAY_ENABLED and EDGE_AUTH
+change_relay = ChangeRelay(project_upstream, "books/changes", _service_token)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    for u in UPSTREAMS:
+        await u.start()
+    try:
+        yield
+    finally:
+        await change_relay.aclose()
+        for u in UPSTREAMS:
+            await u.aclose()
+
+app = FastAPI(title="Gateway Service", lifespan=lifespan)
+
+def _admission_claims(authorization: str) -> dict | None:
+    # untuk key rate limit per user; token tidak valid = dihitung per IP saja
+    scheme, _, token = authorization.partition(" ")
+    if not EDGE_AUTH or scheme.lower() != "bearer" or not token.strip():
+        return None
+    try:
+        return token_cache.verify(token.strip())
+    except JWTError:
+        return None
+
+app.add_middleware(
+    admission.AdmissionMiddleware,
+    claims=_admission_claims,
+    upstreams={"/auth/": auth_upstream, "/api/": project_upstream, "/project/": project_upstream},
+    # dilayani relay: tidak memakai slot in-flight upstream selama stream terbuka
+    detached=("/api/books/changes",) if RELAY_CHANGES else (),
+)
+# dipasang terakhir = middleware terluar: request yang ditolak admission (429/503) ikut terukur.
+# X-Request-ID dibuat di sini kalau client tidak mengirim, lalu ikut diteruskan ke upstream
+metrics.install(app)
+
+@app.exception_handler(httpx.PoolTimeout)
+async def upstream_pool_timeout(request: Request, exc: httpx.PoolTimeout):
+    # semua koneksi ke upstream terpakai sampai POOL_TIMEOUT: tolak cepat, jangan 500
+    return JSONResponse(
+        {"detail": "Layanan sedang sibuk, coba lagi sebentar."},
+        status_code=503,
+        headers={"Retry-After": "1"},
+    )
+
+@app.exception_handler(httpx.TransportError)
+async def upstream_unreachable(request: Request, exc: httpx.TransportError):
+    # semua replika (dan retry-nya) gagal: balas 502/504, bukan 500
+    timed_out = isinstance(exc, httpx.TimeoutException)
+    return JSONResponse(
+        {"detail": "Upstream tidak merespons." if timed_out else "Upstream tidak bisa dihubungi."},
+        status_code=504 if timed_out else 502,
+    )
 
 app.mount("/static", StaticFiles(directory=str(static_dir)), name="static")
 
@@ -46,6 +135,31 @@ def health():
 def build_info():
     return {"GATEWAY_BUILD_MARKER": "GW_FINAL_NO_INTERNAL_REDIRECT"}
 
+@app.get("/health/upstreams")
+def upstream_pools():
+    # okupansi connection pool per upstream (untuk sizing limits)
+    return {u.name: u.pool_stats() for u in UPSTREAMS}
+
+@app.get("/health/cache")
+def response_cache_stats():
+    return {"enabled": response_cache.CACHE_ENABLED, "ttl": response_cache.CACHE_TTL_SECONDS, **response_cache.cache.stats()}
+
+@app.get("/health/coalescing")
+def coalescing_stats():
+    return singleflight.coalescer.stats()
+
+@app.get("/health/admission")
+def admission_stats():
+    return admission.stats()
+
+@app.get("/health/changes")
+def change_relay_stats():
+    return {"relay": RELAY_CHANGES, **change_relay.stats()}
+
+@app.get("/health/token-cache")
+def token_cache_stats():
+    return {"edge_auth": EDGE_AUTH, **token_cache.stats()}
+
 # =========================
 # HELPERS
 # =========================
@@ -53,13 +167,32 @@ def _norm(path: str) -> str:
     # Hilangkan leading/trailing slash agar tidak memicu redirect_slashes di backend
     return (path or "").strip("/")
 
-def _forward_headers(request: Request) -> dict:
-    # Forward semua header kecuali Host
-    h = {k: v for k, v in request.headers.items() if k.lower() != "host"}
+def _forward_headers(request: Request, claims: dict | None = None) -> dict:
+    # Forward semua header kecuali Host (dan claims palsu kiriman client)
+    h = {k: v for k, v in request.headers.items() if k.lower() not in ("host", CLAIMS_HEADER)}
     # Pastikan backend menganggap request aslinya HTTPS (karena dari browser ke gateway memang HTTPS)
     h["x-forwarded-proto"] = "https"
+    if claims is not None and FORWARD_CLAIMS:
+        h[CLAIMS_HEADER] = json.dumps(claims, separators=(",", ":"))
     return h
 
+def _edge_claims(request: Request) -> dict | None:
+    # None = tidak ada token; biar upstream yang memutuskan (endpoint publik / 403 seperti biasa)
+    if not EDGE_AUTH:
+        return None
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    token = token.strip()
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return token_cache.verify(token)
+    except JWTError:
+        raise HTTPException(
+            status_code=401,
+            detail="Token tidak valid atau kadaluarsa.",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
 def _sanitize_response_headers(h: dict) -> dict:
     # Jangan kirim header encoding/transfer yang bisa bikin client bingung
     h.pop("content-encoding", None)
@@ -72,26 +205,298 @@ def _sanitize_response_headers(h: dict) -> dict:
 
     return h
 
+# Header hop-by-hop tidak boleh diteruskan apa adanya saat streaming
+HOP_BY_HOP = {"connection", "keep-alive", "transfer-encoding", "te", "trailer", "upgrade", "proxy-connection"}
+
+def _stream_response_headers(h) -> dict:
+    # Body diteruskan mentah (aiter_raw), jadi content-encoding & content-length tetap valid
+    out = {k: v for k, v in h.items() if k.lower() not in HOP_BY_HOP}
+    out.pop("location", None)
+    out.pop("Location", None)
+    return out
+
+def _has_body(request: Request) -> bool:
+    # GET tanpa body jangan sampai dikirim sebagai chunked ke backend
+    cl = request.headers.get("content-length")
+    if cl is not None:
+        return cl.strip() != "0"
+    return "transfer-encoding" in request.headers
+
+class UpstreamStreamingResponse(StreamingResponse):
+    """StreamingResponse yang selalu menutup respons upstream-nya.
+
+    ``finally`` di generator tidak cukup: kalau client sudah putus saat respons dikirim,
+    Starlette membatalkan stream sebelum generator sempat jalan, dan koneksi pool +
+    hitungan outstanding replika tertahan selamanya.
+    """
+
+    def __init__(self, upstream_resp: httpx.Response, content, **kwargs):
+        super().__init__(content, **kwargs)
+        self.upstream_resp = upstream_resp
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            with anyio.CancelScope(shield=True):
+                await self.upstream_resp.aclose()
+
+async def _iter_upstream(resp):
+    try:
+        async for chunk in resp.aiter_raw():
+            yield chunk
+    finally:
+        await resp.aclose()
+
+async def _proxy(upstream: Upstream, path: str, request: Request, claims: dict | None = None) -> Response:
+    if STREAM_PROXY:
+        return await _proxy_stream(upstream, path, request, claims)
+    return await _proxy_buffered(upstream, path, request, claims)
+
+async def _proxy_stream(upstream: Upstream, path: str, request: Request, claims: dict | None = None) -> Response:
+    headers = _forward_headers(request, claims)
+    # Body diteruskan mentah: jangan biarkan httpx minta gzip kalau client sendiri tidak minta
+    headers.setdefault("accept-encoding", "identity")
+
+    resp = await upstream.send(
+        request.method,
+        _norm(path),
+        headers=headers,
+        params=dict(request.query_params),
+        content=request.stream() if _has_body(request) else None,
+    )
+
+    # header langsung dikirim ke client, body menyusul per chunk
+    return UpstreamStreamingResponse(
+        resp,
+        _iter_upstream(resp),
+        status_code=resp.status_code,
+        headers=_stream_response_headers(resp.headers),
+    )
+
+async def _proxy_project(path: str, request: Request) -> Response:
+    # /api/* dan /project/* sama-sama ke project_service: lewat response cache untuk katalog
+    claims = _edge_claims(request)
+    upstream_path = _norm(path)
+
+    # client yang harus membaca primary tidak ikut cache / single-flight
+    shared = not response_cache.wants_primary(request)
+
+    cache_ok = not any(h in request.headers for h in singleflight.CACHE_BYPASS_HEADERS)
+    if shared and cache_ok and response_cache.cacheable_request(request.method, upstream_path, claims):
+        return await _proxy_cached(upstream_path, request, claims)
+
+    if shared and request.method == "GET" and singleflight.coalescable(upstream_path, request.headers):
+        key = singleflight.make_key(
+            upstream_path,
+            request.url.query,
+            singleflight.token_scope(request.headers.get("authorization", "")),
+            request.headers.get("accept-encoding", ""),
+        )
+        return _fetched_response(await _get_coalesced(key, upstream_path, request, claims))
+
+    resp = await _proxy(project_upstream, path, request, claims)
+    if response_cache.invalidates(request.method, upstream_path):
+        # respons baru dikirim setelah handler upstream selesai (commit), jadi aman di-invalidate sekarang
+        await response_cache.cache.invalidate()
+    return resp
+
+class Fetched(NamedTuple):
+    status: int
+    headers: dict
+    chunks: list
+    rest: AsyncIterator[bytes] | None  # None = body lengkap ada di chunks
+    resp: httpx.Response
+
+async def _fetch_get(
+    upstream_path: str, request: Request, claims: dict | None, extra_headers: dict | None = None
+) -> Fetched:
+    headers = _forward_headers(request, claims)
+    headers.setdefault("accept-encoding", "identity")
+    # respons dibagi ke request lain: validator / Range milik leader tidak ikut diteruskan
+    for h in singleflight.UNSHARED_HEADERS:
+        headers.pop(h, None)
+    headers.update(extra_headers or {})
+    resp = await project_upstream.send(
+        "GET",
+        upstream_path,
+        headers=headers,
+        params=dict(request.query_params),
+    )
+    out_headers = _stream_response_headers(resp.headers)
+
+    # body ditampung selama masih di bawah batas; lebih dari itu sisanya di-stream
+    cap = singleflight.COALESCE_MAX_BYTES
+    declared = resp.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > cap:
+        return Fetched(resp.status_code, out_headers, [], resp.aiter_raw(), resp)
+
+    chunks, size = [], 0
+    it = resp.aiter_raw()
+    try:
+        async for chunk in it:
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > cap:
+                return Fetched(resp.status_code, out_headers, chunks, it, resp)
+    finally:
+        if size <= cap:
+            await resp.aclose()
+    return Fetched(resp.status_code, out_headers, chunks, None, resp)
+
+async def _get_coalesced(
+    key: str, upstream_path: str, request: Request, claims: dict | None, extra_headers: dict | None = None
+) -> Fetched:
+    # GET identik yang bersamaan berbagi satu request upstream (hanya kalau body-nya lengkap tertampung)
+    async def fetch():
+        f = await _fetch_get(upstream_path, request, claims, extra_headers)
+        return f, (f if f.rest is None else None)
+
+    if not singleflight.COALESCE_ENABLED:
+        return (await fetch())[0]
+    return await singleflight.coalescer.do(key, fetch)
+
+async def _iter_rest(chunks: list, it, resp):
+    try:
+        for chunk in chunks:
+            yield chunk
+        async for chunk in it:
+            yield chunk
+    finally:
+        await resp.aclose()
+
+def _fetched_response(f: Fetched) -> Response:
+    if f.rest is None:
+        return Response(content=b"".join(f.chunks), status_code=f.status, headers=f.headers)
+    return UpstreamStreamingResponse(
+        f.resp, _iter_rest(f.chunks, f.rest, f.resp), status_code=f.status, headers=f.headers
+    )
+
+async def _proxy_cached(upstream_path: str, request: Request, claims: dict) -> Response:
+    cache = response_cache.cache
+    key = response_cache.make_key(
+        await cache.generation(),
+        upstream_path,
+        request.url.query,
+        claims.get("r", ""),
+        request.headers.get("accept-encoding", ""),
+    )
+    entry = await cache.get(key)
+    if entry is not None:
+        return response_cache.serve(entry, request, hit=True)
+
+    # miss: request yang sama dari role yang sama digabung jadi satu ke upstream. Isi cache dibaca
+    # dari primary: setelah tulis meng-invalidate cache, replika yang tertinggal tidak boleh mengisi
+    # generasi baru dengan data lama selama GATEWAY_CACHE_TTL
+    f = await _get_coalesced(key, upstream_path, request, claims, {"x-consistency": "strong"})
+    body_size = sum(len(c) for c in f.chunks)
+    if (
+        f.rest is not None
+        or body_size > response_cache.CACHE_MAX_ENTRY_BYTES
+        or not response_cache.storable(f.status, f.headers)
+    ):
+        return _fetched_response(f)
+
+    entry = response_cache.make_entry(f.status, f.headers, b"".join(f.chunks))
+    await cache.set(key, entry)
+    return response_cache.serve(entry, request, hit=False)
+
+async def _proxy_buffered(upstream: Upstream, path: str, request: Request, claims: dict | None = None) -> Response:
+    headers = _forward_headers(request, claims)
+    # Content-Encoding dibuang di bawah, jadi body upstream harus polos (httpx tidak selalu bisa decode br)
+    headers["accept-encoding"] = "identity"
+    resp = await upstream.send(
+        request.method,
+        _norm(path),
+        headers=headers,
+        params=dict(request.query_params),
+        content=await request.body(),
+        stream=False,
+    )
+
+    headers = _sanitize_response_headers(dict(resp.headers))
+    return Response(content=resp.content, status_code=resp.status_code, headers=headers)
+
 # =========================
 # UPLOAD FILE (PDF)
 # =========================
-@app.post("/api/books/{id_buku}/pdf")
-async def upload_book_pdf(id_buku: int, file: UploadFile = File(...), request: Request = None):
+# Body tidak di-parse (UploadFile) di gateway, jadi skemanya ditulis manual untuk Swagger
+PDF_UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"],
+                }
+            }
+        },
+    }
+}
+
+@app.post("/api/books/{id_buku}/pdf", openapi_extra=PDF_UPLOAD_OPENAPI)
+async def upload_book_pdf(id_buku: int, request: Request):
+    claims = _edge_claims(request)
+
+    # tolak lebih awal tanpa menyentuh project_service kalau ukurannya sudah jelas kebesaran
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > MAX_UPLOAD_BYTES + 64 * 1024:
+        return JSONResponse({"detail": f"File melebihi batas {MAX_UPLOAD_BYTES} byte"}, status_code=413)
+
+    # body multipart diteruskan mentah (boundary sama) chunk demi chunk, tanpa buffer di gateway
+    headers = {"content-type": request.headers.get("content-type", "application/octet-stream")}
+    if declared:
+        headers["content-length"] = declared
     # ambil token dari request (biar auth tetap jalan)
     auth = request.headers.get("authorization")
+    if auth:
+        headers["Authorization"] = auth
+    if claims is not None and FORWARD_CLAIMS:
+        headers[CLAIMS_HEADER] = json.dumps(claims, separators=(",", ":"))
+    rid = metrics.request_id()
+    if rid:
+        headers[metrics.REQUEST_ID_HEADER] = rid
+
+    resp = await project_upstream.send(
+        "POST",
+        f"books/{id_buku}/pdf",
+        headers=headers,
+        content=request.stream(),
+        timeout=project_upstream.timeout_with(read=UPLOAD_READ_TIMEOUT),
+    )
+    if response_cache.invalidates("POST", f"books/{id_buku}/pdf"):
+        # pdf_url buku berubah
+        await response_cache.cache.invalidate()
+
+    return UpstreamStreamingResponse(
+        resp,
+        _iter_upstream(resp),
+        status_code=resp.status_code,
+        headers=_stream_response_headers(resp.headers),
+    )
 
-    # forward multipart ke project_service
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        files = {
-            "file": (file.filename, await file.read(), file.content_type or "application/pdf")
-        }
-        headers = {}
-        if auth:
-            headers["Authorization"] = auth
-
-        r = await client.post(f"{PROJ}/books/{id_buku}/pdf", files=files, headers=headers)
-
-    return Response(content=r.content, status_code=r.status_code, media_type=r.headers.get("content-type"))
+# =========================
+# CHANGE FEED (SSE)
+# =========================
+# didaftarkan sebelum /api/{path:path}
+@app.get("/api/books/changes")
+async def book_changes(request: Request):
+    if not RELAY_CHANGES:
+        return await _proxy_project("books/changes", request)
+
+    if _edge_claims(request) is None:
+        raise HTTPException(
+            status_code=401,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return StreamingResponse(
+        change_relay.stream(request.headers.get("last-event-id")),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
 
 # =========================
 # PROXY ROUTES (AUTH & API)
@@ -120,20 +525,7 @@ async def proxy_auth_options(path: str, request: Request):
     return await proxy_auth(path=path, request=request)
 
 async def proxy_auth(path: str, request: Request):
-    p = _norm(path)
-    url = f"{AUTH}/{p}" if p else AUTH
-
-    async with httpx.AsyncClient(timeout=30.0, follow_redirects=False) as client:
-        resp = await client.request(
-            request.method,
-            url,
-            headers=_forward_headers(request),
-            params=dict(request.query_params),
-            content=await request.body(),
-        )
-
-    headers = _sanitize_response_headers(dict(resp.headers))
-    return Response(content=resp.content, status_code=resp.status_code, headers=headers)
+    return await _proxy(auth_upstream, path, request)
 
 
 @app.get("/project/{path:path}", operation_id="proxy_project_get")
@@ -157,40 +549,14 @@ async def proxy_project_options(path: str, request: Request):
     return await proxy_project(path=path, request=request)
 
 async def proxy_project(path: str, request: Request):
-    p = _norm(path)
-    url = f"{PROJ}/{p}" if p else PROJ
-
-    async with httpx.AsyncClient(timeout=30.0, follow_redirects=False) as client:
-        resp = await client.request(
-            request.method,
-            url,
-            headers=_forward_headers(request),
-            params=dict(request.query_params),
-            content=await request.body(),
-        )
-
-    headers = _sanitize_response_headers(dict(resp.headers))
-    return Response(content=resp.content, status_code=resp.status_code, headers=headers)
+    return await _proxy_project(path, request)
 
 # =========================
 # PROXY ROUTES (API -> PROJECT)
 # =========================
 @app.api_route("/api/{path:path}", methods=["GET","POST","PUT","PATCH","DELETE","OPTIONS","HEAD"])
 async def proxy_api(path: str, request: Request):
-    p = _norm(path)  
-    url = f"{PROJ}/{p}" if p else PROJ
-
-    async with httpx.AsyncClient(timeout=30.0, follow_redirects=False) as client:
-        resp = await client.request(
-            request.method,
-            url,
-            headers=_forward_headers(request),
-            params=dict(request.query_params),
-            content=await request.body(),
-        )
-
-    headers = _sanitize_response_headers(dict(resp.headers))
-    return Response(content=resp.content, status_code=resp.status_code, headers=headers)
+    return await _proxy_project(path, request)
 
 # ========= STATIC UPLOADS =========
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", "/app/uploads")  # PAKAI PATH ABSOLUT
@@ -0,0 +1,290 @@
+import os
+import json
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import NamedTuple
+from urllib.parse import parse_qsl, urlencode
+
+from fastapi import Request
+from fastapi.responses import Response
+
+# =========================
+# RESPONSE CACHE CONFIG
+# =========================
+CACHE_ENABLED = os.getenv("GATEWAY_CACHE", "1") == "1"
+CACHE_BACKEND = os.getenv("GATEWAY_CACHE_BACKEND", "memory")  # memory | redis
+CACHE_REDIS_URL = os.getenv("GATEWAY_CACHE_REDIS_URL", "redis://localhost:6379/0")
+CACHE_REDIS_PREFIX = os.getenv("GATEWAY_CACHE_REDIS_PREFIX", "gw:cache:")
+CACHE_TTL_SECONDS = int(os.getenv("GATEWAY_CACHE_TTL", "30"))
+CACHE_MAX_BYTES = int(os.getenv("GATEWAY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_MAX_ENTRY_BYTES = int(os.getenv("GATEWAY_CACHE_MAX_ENTRY_BYTES", str(1024 * 1024)))
+
+def _prefixes(name: str, default: str) -> tuple[str, ...]:
+    return tuple(p.strip().strip("/") for p in os.getenv(name, default).split(",") if p.strip())
+
+# path upstream (tanpa prefix /api) yang di-cache; tulis ke path ini meng-invalidate cache.
+# categories ikut: nama kategori di-embed di respons buku
+CACHE_PATHS = _prefixes("GATEWAY_CACHE_PATHS", "books,categories")
+# streaming / data besar: tidak pernah di-cache
+CACHE_EXCLUDE = _prefixes("GATEWAY_CACHE_EXCLUDE", "books/export,books/changes")
+# cookie read-your-writes dari project_service (database.READ_AFTER_WRITE_COOKIE)
+READ_AFTER_WRITE_COOKIE = "rw_until"
+
+logger = logging.getLogger(__name__)
+
+
+class CachedResponse(NamedTuple):
+    status: int
+    headers: dict
+    body: bytes
+    etag: str
+    stored_at: float  # epoch detik, untuk header Age
+
+
+def _under(path: str, prefixes: tuple[str, ...]) -> bool:
+    return any(path == p or path.startswith(p + "/") for p in prefixes)
+
+
+def is_cached_path(path: str) -> bool:
+    return _under(path, CACHE_PATHS) and not _under(path, CACHE_EXCLUDE)
+
+
+def cacheable_request(method: str, path: str, claims: dict | None) -> bool:
+    # hanya request yang tokennya sudah diverifikasi gateway: role di key cache harus bisa dipercaya
+    return CACHE_ENABLED and method == "GET" and claims is not None and is_cached_path(path)
+
+
+def invalidates(method: str, path: str) -> bool:
+    return CACHE_ENABLED and method not in ("GET", "HEAD", "OPTIONS") and _under(path, CACHE_PATHS)
+
+
+def wants_primary(request: Request) -> bool:
+    # sama dengan database.wants_strong di project_service: client yang baru menulis (cookie
+    # rw_until) / X-Consistency: strong membaca primary, jadi tidak boleh dapat respons bersama
+    # (cache, single-flight) yang mungkin berasal dari replika yang tertinggal
+    if request.headers.get("x-consistency", "").lower() == "strong":
+        return True
+    try:
+        return float(request.cookies.get(READ_AFTER_WRITE_COOKIE, "0")) > time.time()
+    except ValueError:
+        return False
+
+
+def storable(status: int, headers) -> bool:
+    # 206/304/error tidak disimpan; begitu juga respons yang minta tidak di-cache
+    if status != 200 or "set-cookie" in headers:
+        return False
+    cc = headers.get("cache-control", "").lower()
+    return "no-store" not in cc and "private" not in cc
+
+
+def make_key(generation: int, path: str, query: str, role: str, accept_encoding: str) -> str:
+    q = urlencode(sorted(parse_qsl(query, keep_blank_values=True)))
+    return f"{generation}|{role}|{encoding_variant(accept_encoding)}|{path}?{q}"
+
+
+def encoding_variant(accept_encoding: str) -> str:
+    # body diteruskan mentah (bisa gzip/br dari upstream): varian dibedakan per kombinasi encoding
+    # yang diterima client, bukan hanya ada/tidaknya gzip
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.partition(";")
+        name = name.strip()
+        if name not in ("br", "gzip", "*"):
+            continue
+        q = params.strip().removeprefix("q=")
+        try:
+            if q and float(q) <= 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(name)
+    return "+".join(sorted(accepted)) or "identity"
+
+
+def make_entry(status: int, headers: dict, body: bytes) -> CachedResponse:
+    etag = headers.get("etag") or f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    headers = {k: v for k, v in headers.items() if k.lower() not in ("etag", "date", "server")}
+    return CachedResponse(status, headers, body, etag, time.time())
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+def serve(entry: CachedResponse, request: Request, hit: bool) -> Response:
+    headers = {
+        "ETag": entry.etag,
+        "Cache-Control": entry.headers.get("cache-control", "private, no-cache"),
+        "Vary": "Authorization, Accept-Encoding",
+        "X-Cache": "HIT" if hit else "MISS",
+    }
+    if hit:
+        headers["Age"] = str(max(0, int(time.time() - entry.stored_at)))
+
+    # conditional request dijawab gateway sendiri, tanpa body
+    inm = request.headers.get("if-none-match")
+    if inm and _etag_matches(inm, entry.etag):
+        return Response(status_code=304, headers=headers)
+
+    # Vary dari upstream digantikan Vary gateway (sudah mencakup Accept-Encoding)
+    body_headers = {k: v for k, v in entry.headers.items() if k.lower() not in ("cache-control", "vary")}
+    return Response(content=entry.body, status_code=entry.status, headers={**body_headers, **headers})
+
+
+# =========================
+# BACKEND: MEMORY (LRU + TTL, dibatasi total byte)
+# =========================
+class MemoryCache:
+    def __init__(self, ttl: int, max_bytes: int):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, tuple[CachedResponse, float]] = OrderedDict()
+        self._bytes = 0
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.invalidations = 0
+
+    async def generation(self) -> int:
+        return self._generation
+
+    async def invalidate(self) -> None:
+        # generation baru = semua key lama tidak terjangkau; isinya dibuang sekalian
+        self._generation += 1
+        self._entries.clear()
+        self._bytes = 0
+        self.invalidations += 1
+
+    async def get(self, key: str) -> CachedResponse | None:
+        item = self._entries.get(key)
+        if item is not None:
+            entry, expires = item
+            if expires > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self._drop(key)
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, entry: CachedResponse) -> None:
+        if key.split("|", 1)[0] != str(self._generation):
+            return  # sudah di-invalidate selagi request ini jalan
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (entry, time.monotonic() + self.ttl)
+        self._bytes += len(entry.body)
+        self.stores += 1
+        while self._bytes > self.max_bytes and self._entries:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: str) -> None:
+        entry, _ = self._entries.pop(key)
+        self._bytes -= len(entry.body)
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "generation": self._generation,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "invalidations": self.invalidations,
+        }
+
+
+# =========================
+# BACKEND: REDIS (dipakai bersama beberapa replika gateway)
+# =========================
+class RedisCache:
+    # redis bersifat opsional: hanya dibutuhkan kalau GATEWAY_CACHE_BACKEND=redis.
+    # Redis tidak bisa dihubungi = dianggap miss, request tetap jalan ke upstream.
+    def __init__(self, url: str, prefix: str, ttl: int):
+        try:
+            import redis.asyncio as aioredis
+        except ImportError as e:
+            raise RuntimeError("GATEWAY_CACHE_BACKEND=redis butuh paket redis (pip install redis)") from e
+
+        self._redis = aioredis.from_url(url)
+        self.prefix = prefix
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    def _entry_key(self, key: str) -> str:
+        return f"{self.prefix}e:{hashlib.sha256(key.encode()).hexdigest()}"
+
+    async def generation(self) -> int:
+        try:
+            return int(await self._redis.get(f"{self.prefix}gen") or 0)
+        except Exception:
+            self.errors += 1
+            logger.warning("response cache: redis tidak bisa dihubungi", exc_info=True)
+            return -1  # key dengan generation -1 tidak pernah disimpan
+
+    async def invalidate(self) -> None:
+        try:
+            await self._redis.incr(f"{self.prefix}gen")
+            self.invalidations += 1
+        except Exception:
+            self.errors += 1
+            logger.warning("response cache: invalidate gagal", exc_info=True)
+
+    async def get(self, key: str) -> CachedResponse | None:
+        raw = None
+        if not key.startswith("-1|"):
+            try:
+                raw = await self._redis.get(self._entry_key(key))
+            except Exception:
+                self.errors += 1
+        if raw is None:
+            self.misses += 1
+            return None
+        meta, _, body = raw.partition(b"\n")
+        m = json.loads(meta)
+        self.hits += 1
+        return CachedResponse(m["status"], m["headers"], body, m["etag"], m["stored_at"])
+
+    async def set(self, key: str, entry: CachedResponse) -> None:
+        if key.startswith("-1|"):
+            return
+        meta = json.dumps({
+            "status": entry.status, "headers": entry.headers, "etag": entry.etag, "stored_at": entry.stored_at,
+        }).encode()
+        try:
+            await self._redis.set(self._entry_key(key), meta + b"\n" + entry.body, ex=self.ttl)
+            self.stores += 1
+        except Exception:
+            self.errors += 1
+
+    def stats(self) -> dict:
+        return {
+            "backend": "redis",
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+        }
+
+
+def _make_cache():
+    if CACHE_BACKEND == "redis":
+        return RedisCache(CACHE_REDIS_URL, CACHE_REDIS_PREFIX, CACHE_TTL_SECONDS)
+    if CACHE_BACKEND == "memory":
+        return MemoryCache(CACHE_TTL_SECONDS, CACHE_MAX_BYTES)
+    raise RuntimeError(f"GATEWAY_CACHE_BACKEND tidak dikenal: {CACHE_BACKEND}")
+
+
+cache = _make_cache()
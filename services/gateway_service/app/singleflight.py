@@ -0,0 +1,95 @@
+import os
+import asyncio
+import hashlib
+from typing import Any, Awaitable, Callable
+from urllib.parse import parse_qsl, urlencode
+
+from .response_cache import encoding_variant
+
+# =========================
+# SINGLE-FLIGHT CONFIG
+# =========================
+COALESCE_ENABLED = os.getenv("GATEWAY_COALESCE", "1") == "1"
+# respons lebih besar dari ini tidak dibagi; follower mengirim request sendiri
+COALESCE_MAX_BYTES = int(os.getenv("GATEWAY_COALESCE_MAX_BYTES", str(1024 * 1024)))
+# stream panjang (export, SSE) tidak digabung
+COALESCE_EXCLUDE = tuple(
+    p.strip().strip("/") for p in os.getenv("GATEWAY_COALESCE_EXCLUDE", "books/export,books/changes").split(",") if p.strip()
+)
+# respons bergantung pada header ini (206 per Range, 304 per validator client), jadi tidak dibagi
+UNSHARED_HEADERS = ("range", "if-range", "if-none-match", "if-modified-since", "if-match", "if-unmodified-since")
+# response cache menjawab If-None-Match sendiri dengan ETag gateway; sisanya tidak lewat cache
+CACHE_BYPASS_HEADERS = tuple(h for h in UNSHARED_HEADERS if h != "if-none-match")
+
+
+def coalescable(path: str, headers) -> bool:
+    if not COALESCE_ENABLED or any(h in headers for h in UNSHARED_HEADERS):
+        return False
+    return not any(path == p or path.startswith(p + "/") for p in COALESCE_EXCLUDE)
+
+
+def make_key(path: str, query: str, scope: str, accept_encoding: str) -> str:
+    q = urlencode(sorted(parse_qsl(query, keep_blank_values=True)))
+    return f"{scope}|{encoding_variant(accept_encoding)}|{path}?{q}"
+
+
+def token_scope(authorization: str) -> str:
+    # tanpa claims terverifikasi: hanya request dengan token yang sama persis yang boleh berbagi respons
+    return "t:" + hashlib.sha256(authorization.encode()).hexdigest() if authorization else "anon"
+
+
+class SingleFlight:
+    """Request identik yang bersamaan berbagi satu panggilan upstream.
+
+    ``fn`` mengembalikan ``(hasil_leader, hasil_bersama)``. ``hasil_bersama`` None berarti
+    hasilnya tidak bisa dibagi (mis. body terlalu besar / sudah di-stream ke leader),
+    jadi follower memanggil ``fn`` sendiri.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, asyncio.Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.fallbacks = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[tuple[Any, Any]]]) -> Any:
+        fut = self._calls.get(key)
+        if fut is not None:
+            self.coalesced += 1
+            shared = await asyncio.shield(fut)
+            if shared is not None:
+                return shared
+            self.fallbacks += 1
+            own, _ = await fn()
+            return own
+
+        fut = asyncio.get_running_loop().create_future()
+        self._calls[key] = fut
+        self.leaders += 1
+        try:
+            own, shared = await fn()
+        except asyncio.CancelledError:
+            # leader batal (client putus): follower tidak ikut gagal, mereka request sendiri
+            fut.set_result(None)
+            raise
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()  # tandai sudah diambil walau tidak ada follower
+            raise
+        else:
+            fut.set_result(shared)
+            return own
+        finally:
+            del self._calls[key]
+
+    def stats(self) -> dict:
+        return {
+            "enabled": COALESCE_ENABLED,
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "fallbacks": self.fallbacks,
+        }
+
+
+coalescer = SingleFlight()
@@ -0,0 +1,561 @@
+import os
+import math
+import time
+import random
+import asyncio
+import logging
+
+import httpx
+from prometheus_client import Histogram
+
+from .metrics import LATENCY_BUCKETS, exemplar
+
+# =========================
+# KONFIGURASI POOL UPSTREAM
+# =========================
+# Setiap nilai bisa di-override per upstream dengan prefix (mis. AUTH_POOL_MAX_CONNECTIONS),
+# kalau tidak ada pakai prefix global UPSTREAM_ (mis. UPSTREAM_POOL_MAX_CONNECTIONS).
+
+def _env(prefix: str, name: str, default: str) -> str:
+    return os.getenv(f"{prefix}_{name}", os.getenv(f"UPSTREAM_{name}", default))
+
+def _env_bool(prefix: str, name: str, default: str = "0") -> bool:
+    return _env(prefix, name, default).strip().lower() in ("1", "true", "yes", "on")
+
+
+# method yang aman diulang ke replika lain (body-nya juga harus bisa dikirim ulang)
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# status yang dianggap replika sedang bermasalah (dihitung circuit breaker, boleh di-retry)
+RETRY_STATUSES = {502, 503, 504}
+# latency replika yang tidak dipakai dianggap makin tidak relevan (e-folding, detik)
+LATENCY_DECAY_SECONDS = float(os.getenv("UPSTREAM_LATENCY_DECAY", "10"))
+
+
+def _replica_failed(resp: httpx.Response) -> bool:
+    # 503 + Retry-After = backend sengaja menolak (antrian bcrypt penuh, maintenance), bukan rusak:
+    # tidak dihitung breaker, tidak di-retry, diteruskan apa adanya ke client
+    if resp.status_code == 503 and "retry-after" in resp.headers:
+        return False
+    return resp.status_code in RETRY_STATUSES
+
+
+UPSTREAM_ATTEMPT = Histogram(
+    "gateway_upstream_attempt_seconds", "Waktu sampai header respons, per percobaan ke satu replika",
+    ["upstream", "replica", "outcome"], buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_CALL = Histogram(
+    "gateway_upstream_call_seconds", "Waktu sampai respons upstream diterima, termasuk retry & hedge",
+    ["upstream", "method", "status"], buckets=LATENCY_BUCKETS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# =========================
+# CIRCUIT BREAKER PER REPLIKA
+# =========================
+class CircuitBreaker:
+    """closed -> (gagal beruntun >= threshold) -> open -> (cooldown) -> half_open -> 1 probe."""
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.trips = 0
+
+    def available(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            return time.monotonic() - self.opened_at >= self.cooldown
+        return not self.probing
+
+    def on_attempt(self) -> None:
+        # request yang lewat saat cooldown habis menjadi probe tunggal
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = "half_open"
+        if self.state == "half_open":
+            self.probing = True
+
+    def on_success(self) -> None:
+        self.state = "closed"
+        self.failures = 0
+        self.probing = False
+
+    def on_failure(self) -> None:
+        self.failures += 1
+        if self.state == "half_open" or (self.state == "closed" and self.failures >= self.threshold):
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.trips += 1
+        self.probing = False
+
+    def on_cancel(self) -> None:
+        self.probing = False
+
+
+# =========================
+# REPLIKA
+# =========================
+class Replica:
+    def __init__(self, base_url: str, breaker: CircuitBreaker):
+        self.base_url = base_url.rstrip("/")
+        self.breaker = breaker
+        self.healthy = True  # hasil health check aktif terakhir
+        self.outstanding = 0  # request yang sedang berjalan (sampai body selesai dibaca)
+        self.ewma_ms = 0.0  # latency sampai header respons, dirata-rata eksponensial
+        self.observed_at = 0.0
+        self.requests = 0
+        self.errors = 0
+
+    def url(self, path: str) -> str:
+        return f"{self.base_url}/{path}" if path else self.base_url
+
+    def available(self) -> bool:
+        return self.healthy and self.breaker.available()
+
+    def observe(self, elapsed: float) -> None:
+        ms = elapsed * 1000
+        self.ewma_ms = ms if self.ewma_ms == 0 else self.ewma_ms * 0.8 + ms * 0.2
+        self.observed_at = time.monotonic()
+
+    def cost(self) -> float:
+        # latency x antrean; latency lama memudar supaya replika yang pernah lambat dicoba lagi
+        decay = math.exp(-(time.monotonic() - self.observed_at) / LATENCY_DECAY_SECONDS)
+        return (self.outstanding + 1) * (1.0 + self.ewma_ms * decay)
+
+    def stats(self) -> dict:
+        return {
+            "base_url": self.base_url,
+            "healthy": self.healthy,
+            "breaker": self.breaker.state,
+            "breaker_trips": self.breaker.trips,
+            "outstanding": self.outstanding,
+            "ewma_ms": round(self.ewma_ms, 2),
+            "requests": self.requests,
+            "errors": self.errors,
+        }
+
+
+class _TrackedStream(httpx.AsyncByteStream):
+    # outstanding replika baru turun setelah body selesai dibaca / respons ditutup
+    def __init__(self, stream: httpx.AsyncByteStream, replica: Replica):
+        self._stream = stream
+        self._replica = replica
+        self._done = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._done:
+                self._done = True
+                self._replica.outstanding -= 1
+
+
+class RetryBudget:
+    # retry (dan hedge) dibatasi ~ratio dari jumlah request, supaya saat semua replika lambat
+    # gateway tidak melipatgandakan beban. Saldo awal = cadangan untuk trafik kecil.
+    def __init__(self, ratio: float, reserve: float):
+        self.ratio = ratio
+        self.cap = max(reserve, 1.0)
+        self.balance = self.cap
+        self.spent = 0
+        self.denied = 0
+
+    def deposit(self) -> None:
+        self.balance = min(self.cap, self.balance + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.balance >= 1:
+            self.balance -= 1
+            self.spent += 1
+            return True
+        self.denied += 1
+        return False
+
+
+class Upstream:
+    """Satu client httpx jangka panjang (connection pool + keep-alive) untuk satu backend.
+
+    Backend bisa terdiri dari beberapa replika (URL dipisah koma). Replika dipilih dengan
+    power-of-two-choices berdasarkan request yang sedang berjalan dan latency-nya, dilewati
+    kalau health check gagal atau circuit breaker-nya terbuka.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        *,
+        limits: httpx.Limits,
+        timeout: httpx.Timeout,
+        http2: bool = False,
+        max_in_flight: int = 0,
+        retries: int = 2,
+        retry_budget: RetryBudget | None = None,
+        hedge_after: float = 0.0,
+        breaker_threshold: int = 5,
+        breaker_cooldown: float = 10.0,
+        health_path: str = "/health",
+        health_interval: float = 5.0,
+        health_timeout: float = 2.0,
+    ):
+        self.name = name
+        urls = [u.strip() for u in base_url.split(",") if u.strip()]
+        if not urls:
+            raise RuntimeError(f"Upstream '{name}' tidak punya URL")
+        self.replicas = [Replica(u, CircuitBreaker(breaker_threshold, breaker_cooldown)) for u in urls]
+        self.limits = limits
+        self.timeout = timeout
+        self.http2 = http2
+        # batas request gateway yang sedang berjalan ke upstream ini; 0 = tanpa batas
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.retries = retries
+        self.retry_budget = retry_budget or RetryBudget(0.2, 10)
+        self.hedge_after = hedge_after  # detik; 0 = hedging mati
+        self.health_path = "/" + health_path.lstrip("/")
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.hedges = 0
+        self._client: httpx.AsyncClient | None = None
+        self._health_task: asyncio.Task | None = None
+        self._cleanup: set[asyncio.Task] = set()
+
+    @classmethod
+    def from_env(cls, name: str, base_url: str, prefix: str) -> "Upstream":
+        limits = httpx.Limits(
+            max_connections=int(_env(prefix, "POOL_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(_env(prefix, "POOL_MAX_KEEPALIVE", "20")),
+            keepalive_expiry=float(_env(prefix, "POOL_KEEPALIVE_EXPIRY", "30")),
+        )
+        timeout = httpx.Timeout(
+            connect=float(_env(prefix, "CONNECT_TIMEOUT", "5")),
+            read=float(_env(prefix, "READ_TIMEOUT", "30")),
+            write=float(_env(prefix, "WRITE_TIMEOUT", "30")),
+            pool=float(_env(prefix, "POOL_TIMEOUT", "5")),
+        )
+        max_in_flight = int(_env(prefix, "MAX_IN_FLIGHT", str(limits.max_connections * 2)))
+        return cls(
+            name, base_url,
+            limits=limits, timeout=timeout, http2=_env_bool(prefix, "HTTP2"), max_in_flight=max_in_flight,
+            retries=int(_env(prefix, "RETRIES", "2")),
+            retry_budget=RetryBudget(
+                float(_env(prefix, "RETRY_BUDGET_RATIO", "0.2")),
+                float(_env(prefix, "RETRY_BUDGET_RESERVE", "10")),
+            ),
+            # GET yang belum dapat header setelah sekian ms dikirim juga ke replika lain
+            hedge_after=float(_env(prefix, "HEDGE_AFTER_MS", "0")) / 1000,
+            breaker_threshold=int(_env(prefix, "BREAKER_THRESHOLD", "5")),
+            breaker_cooldown=float(_env(prefix, "BREAKER_COOLDOWN", "10")),
+            health_path=_env(prefix, "HEALTH_PATH", "/health"),
+            health_interval=float(_env(prefix, "HEALTH_INTERVAL", "5")),
+            health_timeout=float(_env(prefix, "HEALTH_TIMEOUT", "2")),
+        )
+
+    # =========================
+    # LIFECYCLE (dipanggil dari lifespan app)
+    # =========================
+    async def start(self) -> None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=self.limits,
+                timeout=self.timeout,
+                http2=self.http2,
+                follow_redirects=False,
+            )
+        # health check aktif hanya berguna kalau ada replika lain untuk dipilih
+        if self._health_task is None and len(self.replicas) > 1 and self.health_interval > 0:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def aclose(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            raise RuntimeError(f"Upstream '{self.name}' belum di-start (lifespan belum jalan).")
+        return self._client
+
+    def timeout_with(self, **overrides: float) -> httpx.Timeout:
+        # timeout default upstream, dengan sebagian nilai diganti (mis. read lebih lama untuk upload)
+        t = self.timeout
+        values = {"connect": t.connect, "read": t.read, "write": t.write, "pool": t.pool}
+        values.update(overrides)
+        return httpx.Timeout(**values)
+
+    # =========================
+    # HEALTH CHECK AKTIF
+    # =========================
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.gather(*(self._check(r) for r in self.replicas))
+            await asyncio.sleep(self.health_interval)
+
+    async def _check(self, replica: Replica) -> None:
+        try:
+            resp = await self.client.get(replica.url(self.health_path.lstrip("/")), timeout=self.health_timeout)
+            ok = resp.status_code == 200
+        except httpx.HTTPError:
+            ok = False
+        if ok != replica.healthy:
+            logger.warning("upstream %s: replika %s %s", self.name, replica.base_url, "pulih" if ok else "tidak sehat")
+        replica.healthy = ok
+        if ok and replica.breaker.state == "open":
+            # health check lolos: izinkan probe tanpa menunggu cooldown penuh
+            replica.breaker.opened_at = 0.0
+
+    # =========================
+    # PEMILIHAN REPLIKA (POWER OF TWO CHOICES, BIAYA = LATENCY x ANTREAN)
+    # =========================
+    def _pick(self, exclude: list[Replica]) -> Replica | None:
+        fresh = [r for r in self.replicas if r not in exclude]
+        if not fresh:
+            return None
+        candidates = [r for r in fresh if r.available()]
+        if not candidates:
+            if exclude:
+                return None  # retry tidak dikirim ke replika yang sedang rusak
+            # semua replika dianggap rusak: tetap coba daripada langsung gagal (panic mode)
+            candidates = fresh
+        if len(candidates) == 1:
+            return candidates[0]
+        a, b = random.sample(candidates, 2)
+        return min(a, b, key=Replica.cost)
+
+    # =========================
+    # KIRIM REQUEST (RETRY + HEDGING)
+    # =========================
+    async def send(
+        self,
+        method: str,
+        path: str,
+        *,
+        headers: dict | None = None,
+        params: dict | None = None,
+        content=None,
+        timeout: httpx.Timeout | None = None,
+        stream: bool = True,
+    ) -> httpx.Response:
+        started = time.perf_counter()
+        status = "error"
+        try:
+            resp = await self._send(method, path, headers, params, content, timeout, stream)
+            status = str(resp.status_code)
+            return resp
+        finally:
+            UPSTREAM_CALL.labels(self.name, method, status).observe(time.perf_counter() - started, exemplar=exemplar())
+
+    async def _send(self, method, path, headers, params, content, timeout, stream) -> httpx.Response:
+        # body stream (request.stream()) hanya bisa dikirim sekali, jadi tidak pernah di-retry
+        replayable = content is None or isinstance(content, bytes)
+        idempotent = replayable and method in IDEMPOTENT_METHODS
+        self.retry_budget.deposit()
+
+        def attempt(replica: Replica):
+            return self._attempt(replica, method, path, headers, params, content, timeout)
+
+        tried: list[Replica] = []
+        attempts_left = 1 + (self.retries if replayable else 0)
+        while True:
+            attempts_left -= 1
+            replica = self._pick(tried)
+            tried.append(replica)
+            try:
+                if method == "GET" and idempotent and self.hedge_after > 0:
+                    resp = await self._hedged(replica, attempt, tried)
+                else:
+                    resp = await attempt(replica)
+            except httpx.PoolTimeout:
+                raise  # pool gateway sendiri yang penuh, bukan salah replika
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                # request belum sampai ke backend: aman dicoba ke replika lain walau bukan idempotent
+                if not self._can_retry(attempts_left, tried):
+                    raise
+                logger.info("upstream %s: %s gagal connect (%s), retry", self.name, replica.base_url, e)
+                continue
+            except httpx.TransportError:
+                if not idempotent or not self._can_retry(attempts_left, tried):
+                    raise
+                continue
+
+            if idempotent and _replica_failed(resp) and self._can_retry(attempts_left, tried):
+                await resp.aclose()
+                continue
+            break
+
+        if not stream:
+            await resp.aread()
+        return resp
+
+    def _can_retry(self, attempts_left: int, tried: list[Replica]) -> bool:
+        return attempts_left > 0 and self._pick(tried) is not None and self.retry_budget.withdraw()
+
+    async def _attempt(self, replica: Replica, method, path, headers, params, content, timeout) -> httpx.Response:
+        client = self.client
+        req = client.build_request(
+            method,
+            replica.url(path),
+            headers=headers,
+            params=params,
+            content=content,
+            timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT,
+        )
+        replica.breaker.on_attempt()
+        replica.outstanding += 1
+        replica.requests += 1
+        started = time.monotonic()
+        outcome = "error"
+        try:
+            resp = await client.send(req, stream=True)
+        except asyncio.CancelledError:
+            # kalah hedge / client putus: waktu tunggu sejauh ini tetap dicatat sebagai batas bawah latency
+            outcome = "cancelled"
+            replica.observe(time.monotonic() - started)
+            replica.outstanding -= 1
+            replica.breaker.on_cancel()
+            raise
+        except httpx.PoolTimeout:
+            outcome = "pool_timeout"
+            replica.outstanding -= 1
+            replica.breaker.on_cancel()
+            raise
+        except BaseException:
+            replica.outstanding -= 1
+            replica.errors += 1
+            replica.breaker.on_failure()
+            raise
+        else:
+            outcome = f"{resp.status_code // 100}xx"
+        finally:
+            UPSTREAM_ATTEMPT.labels(self.name, replica.base_url, outcome).observe(time.monotonic() - started)
+
+        replica.observe(time.monotonic() - started)
+        if _replica_failed(resp):
+            replica.errors += 1
+            replica.breaker.on_failure()
+        else:
+            replica.breaker.on_success()
+        resp.stream = _TrackedStream(resp.stream, replica)
+        return resp
+
+    async def _hedged(self, first: Replica, attempt, tried: list[Replica]) -> httpx.Response:
+        # GET lambat dikirim juga ke replika kedua; respons pertama yang sehat dipakai
+        primary = asyncio.ensure_future(attempt(first))
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_after)
+        if done:
+            return primary.result()
+
+        second = self._pick(tried)
+        if second is None or not self.retry_budget.withdraw():
+            return await primary
+        tried.append(second)
+        self.hedges += 1
+        pending = {primary, asyncio.ensure_future(attempt(second))}
+
+        finished: list[asyncio.Task] = []
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                finished.extend(done)
+                for task in done:
+                    if task.exception() is None and not _replica_failed(task.result()):
+                        winner = task.result()
+                        await self._close_all(t for t in finished if t is not task)
+                        return winner
+            # dua-duanya gagal: kembalikan respons error terakhir (kalau ada) supaya bisa di-retry
+            last = finished[-1]
+            with_resp = [t for t in finished if t.exception() is None]
+            if with_resp:
+                await self._close_all(with_resp[:-1])
+                return with_resp[-1].result()
+            raise last.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+                self._discard_later(task)
+
+    @staticmethod
+    async def _close_all(tasks) -> None:
+        for task in tasks:
+            if task.exception() is None:
+                await task.result().aclose()
+
+    def _discard_later(self, task: asyncio.Task) -> None:
+        # respons pemenang tidak menunggu request yang kalah selesai dibatalkan
+        async def discard():
+            try:
+                resp = await task
+            except BaseException:
+                return
+            await resp.aclose()
+
+        t = asyncio.create_task(discard())
+        self._cleanup.add(t)
+        t.add_done_callback(self._cleanup.discard)
+
+    # =========================
+    # ADMISSION (dipakai AdmissionMiddleware)
+    # =========================
+    def try_acquire(self) -> bool:
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self) -> None:
+        self.in_flight -= 1
+
+    # =========================
+    # OKUPANSI POOL
+    # =========================
+    def pool_stats(self) -> dict:
+        stats = {
+            "replicas": [r.stats() for r in self.replicas],
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "keepalive_expiry": self.limits.keepalive_expiry,
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "retry_budget": round(self.retry_budget.balance, 2),
+            "retries": self.retry_budget.spent,
+            "retries_denied": self.retry_budget.denied,
+            "hedges": self.hedges,
+            "connections": 0,
+            "active": 0,
+            "idle": 0,
+            "waiting": 0,
+        }
+        if self._client is None:
+            return stats
+
+        # httpx tidak punya API publik untuk ini; baca dari pool httpcore di bawahnya.
+        pool = getattr(self._client._transport, "_pool", None)
+        if pool is None:
+            return stats
+
+        conns = list(getattr(pool, "connections", []))
+        idle = sum(1 for c in conns if c.is_idle())
+        stats["connections"] = len(conns)
+        stats["idle"] = idle
+        stats["active"] = len(conns) - idle
+        stats["waiting"] = sum(1 for r in getattr(pool, "_requests", []) if r.is_queued())
+        return stats
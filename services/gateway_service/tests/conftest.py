@@ -0,0 +1,48 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# konfigurasi app dibaca saat import: env harus siap sebelum modul app mana pun di-import
+os.environ.setdefault("JWT_SECRET", "test-secret")
+os.environ.setdefault("METRICS", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+    def perf_counter(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def patch_clock(monkeypatch, clock):
+    # hanya modul yang diuji yang melihat jam palsu; event loop tetap memakai time asli
+    def patch(module) -> FakeClock:
+        monkeypatch.setattr(module, "time", SimpleNamespace(
+            monotonic=clock.monotonic, time=clock.time, perf_counter=clock.perf_counter,
+        ))
+        return clock
+    return patch
@@ -0,0 +1,119 @@
+"""Token bucket, klasifikasi route, IP client dan respons 429/503 AdmissionMiddleware."""
+import httpx
+import pytest
+
+from app import admission
+from app.admission import Budget, MemoryRateLimiter
+
+
+@pytest.fixture
+def limiter(patch_clock):
+    patch_clock(admission)
+    return MemoryRateLimiter(max_keys=100)
+
+
+@pytest.mark.anyio
+async def test_bucket_allows_burst_then_reports_wait(limiter):
+    budget = Budget(rate=2.0, burst=3.0)
+    assert [await limiter.hit("k", budget) for _ in range(3)] == [0.0, 0.0, 0.0]
+    # bucket kosong: 1 token lagi butuh 1/rate detik
+    assert await limiter.hit("k", budget) == pytest.approx(0.5)
+
+
+@pytest.mark.anyio
+async def test_bucket_refills_over_time(limiter, clock):
+    budget = Budget(rate=2.0, burst=3.0)
+    for _ in range(3):
+        await limiter.hit("k", budget)
+    clock.advance(0.5)  # +1 token
+    assert await limiter.hit("k", budget) == 0.0
+    assert await limiter.hit("k", budget) > 0
+
+    clock.advance(60)  # terisi penuh, tapi tidak melebihi burst
+    assert [await limiter.hit("k", budget) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert await limiter.hit("k", budget) > 0
+
+
+@pytest.mark.anyio
+async def test_buckets_are_per_key_and_evicted_lru(patch_clock):
+    patch_clock(admission)
+    limiter = MemoryRateLimiter(max_keys=2)
+    budget = Budget(rate=1.0, burst=1.0)
+    assert await limiter.hit("a", budget) == 0.0
+    assert await limiter.hit("b", budget) == 0.0
+    assert await limiter.hit("a", budget) > 0
+    await limiter.hit("c", budget)  # "b" paling lama tidak aktif: dibuang
+    assert limiter.stats()["keys"] == 2
+    assert await limiter.hit("b", budget) == 0.0
+
+
+@pytest.mark.parametrize("method, path, expected", [
+    ("POST", "/auth/login", "login"),
+    ("POST", "/auth/register", "login"),
+    ("GET", "/api/books", "read"),
+    ("HEAD", "/uploads/x.pdf", "read"),
+    ("POST", "/api/books/7/pdf", "upload"),
+    ("POST", "/api/books/bulk", "upload"),
+    ("PUT", "/api/books/7", "write"),
+    ("POST", "/auth/refresh", "write"),
+    ("GET", "/", None),
+    ("GET", "/static/app.js", None),
+])
+def test_classify(method, path, expected):
+    assert admission.classify(method, path) == expected
+
+
+def test_client_ip_ignores_forwarded_for_by_default(monkeypatch):
+    scope = {"client": ("10.0.0.9", 1234), "headers": [(b"x-forwarded-for", b"1.2.3.4, 5.6.7.8")]}
+    monkeypatch.setattr(admission, "TRUSTED_PROXY_HOPS", 0)
+    assert admission.client_ip(scope) == "10.0.0.9"
+    # di belakang satu proxy tepercaya: entri paling kanan, yang kiri bisa dipalsukan client
+    monkeypatch.setattr(admission, "TRUSTED_PROXY_HOPS", 1)
+    assert admission.client_ip(scope) == "5.6.7.8"
+
+
+class _FakeUpstream:
+    def __init__(self, free: bool):
+        self.free = free
+
+    def try_acquire(self) -> bool:
+        return self.free
+
+    def release(self) -> None:
+        pass
+
+
+async def _ok_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def _client(upstream_free: bool = True) -> httpx.AsyncClient:
+    app = admission.AdmissionMiddleware(
+        _ok_app, claims=lambda _auth: None, upstreams={"/api/": _FakeUpstream(upstream_free)},
+    )
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://gw")
+
+
+@pytest.mark.anyio
+async def test_middleware_rejects_with_retry_after(monkeypatch, limiter):
+    monkeypatch.setattr(admission, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(admission, "limiter", limiter)
+    monkeypatch.setitem(admission.BUDGETS, "login", Budget(rate=0.1, burst=2.0))
+
+    async with _client() as client:
+        statuses = [(await client.post("/auth/login")).status_code for _ in range(2)]
+        limited = await client.post("/auth/login")
+    assert statuses == [200, 200]
+    assert limited.status_code == 429
+    assert limited.headers["retry-after"] == "10"  # ceil((1 - 0 token) / 0.1)
+
+
+@pytest.mark.anyio
+async def test_middleware_sheds_when_upstream_full(monkeypatch):
+    monkeypatch.setattr(admission, "RATE_LIMIT_ENABLED", False)
+    async with _client(upstream_free=False) as client:
+        r = await client.get("/api/books")
+        assert r.status_code == 503
+        assert r.headers["retry-after"] == "1"
+        assert (await client.get("/")).status_code == 200  # bukan path upstream: tidak dibatasi
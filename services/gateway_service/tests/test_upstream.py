@@ -0,0 +1,174 @@
+"""Circuit breaker, retry budget, dan retry/pass-through di Upstream.send (transport tiruan)."""
+import httpx
+import pytest
+
+from app import upstream
+from app.upstream import CircuitBreaker, RetryBudget, Upstream
+
+
+# =========================
+# CIRCUIT BREAKER
+# =========================
+def test_breaker_opens_after_threshold(patch_clock):
+    patch_clock(upstream)
+    breaker = CircuitBreaker(threshold=3, cooldown=10)
+    for _ in range(2):
+        breaker.on_attempt()
+        breaker.on_failure()
+    assert breaker.state == "closed" and breaker.available()
+    breaker.on_success()  # sukses me-reset hitungan gagal beruntun
+    for _ in range(3):
+        breaker.on_attempt()
+        breaker.on_failure()
+    assert breaker.state == "open" and breaker.trips == 1
+    assert not breaker.available()
+
+
+def test_breaker_half_open_single_probe(patch_clock):
+    clock = patch_clock(upstream)
+    breaker = CircuitBreaker(threshold=1, cooldown=10)
+    breaker.on_attempt()
+    breaker.on_failure()
+    clock.advance(9.9)
+    assert not breaker.available()
+    clock.advance(0.1)
+    assert breaker.available()
+
+    breaker.on_attempt()  # request pertama setelah cooldown = probe
+    assert breaker.state == "half_open"
+    assert not breaker.available()  # probe lain tidak dikirim bersamaan
+
+    breaker.on_failure()  # probe gagal: buka lagi, cooldown dari awal
+    assert breaker.state == "open" and breaker.trips == 2
+    assert not breaker.available()
+
+    clock.advance(10)
+    breaker.on_attempt()
+    breaker.on_success()
+    assert breaker.state == "closed" and breaker.failures == 0 and breaker.available()
+
+
+def test_breaker_cancelled_probe_frees_slot(patch_clock):
+    clock = patch_clock(upstream)
+    breaker = CircuitBreaker(threshold=1, cooldown=1)
+    breaker.on_attempt()
+    breaker.on_failure()
+    clock.advance(1)
+    breaker.on_attempt()
+    breaker.on_cancel()  # kalah hedge / client putus: bukan bukti replika rusak
+    assert breaker.state == "half_open" and breaker.available()
+
+
+# =========================
+# RETRY BUDGET
+# =========================
+def test_retry_budget_reserve_then_ratio():
+    budget = RetryBudget(ratio=0.5, reserve=2)
+    assert budget.withdraw() and budget.withdraw()
+    assert not budget.withdraw()
+    assert (budget.spent, budget.denied) == (2, 1)
+
+    budget.deposit()
+    assert not budget.withdraw()  # 0.5 belum cukup untuk satu retry
+    budget.deposit()
+    assert budget.withdraw()
+
+    for _ in range(100):
+        budget.deposit()
+    assert budget.balance == budget.cap == 2
+
+
+# =========================
+# UPSTREAM.SEND
+# =========================
+class _Body(httpx.AsyncByteStream):
+    # body belum terbaca seperti dari jaringan (Response(content=...) sudah dianggap tertutup)
+    async def __aiter__(self):
+        yield b"{}"
+
+
+def _response(status: int, **headers) -> httpx.Response:
+    return httpx.Response(status, headers=headers, stream=_Body())
+
+
+def _upstream(handler, replicas: int = 2, **kwargs) -> Upstream:
+    urls = ",".join(f"http://r{i}" for i in range(replicas))
+    u = Upstream("test", urls, limits=httpx.Limits(), timeout=httpx.Timeout(5), health_interval=0, **kwargs)
+    u._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return u
+
+
+@pytest.mark.anyio
+async def test_retries_idempotent_request_on_other_replica():
+    hosts = []
+
+    def handler(request):
+        hosts.append(request.url.host)
+        return _response(502 if len(hosts) == 1 else 200)
+
+    u = _upstream(handler)
+    resp = await u.send("GET", "/books")
+    assert resp.status_code == 200
+    assert len(hosts) == 2 and hosts[0] != hosts[1]
+    assert sum(r.errors for r in u.replicas) == 1
+    # respons stream milik pemanggil: outstanding replika baru turun setelah ditutup
+    assert sum(r.outstanding for r in u.replicas) == 1
+    await resp.aclose()
+    assert all(r.outstanding == 0 for r in u.replicas)
+
+
+@pytest.mark.anyio
+async def test_post_is_not_retried_on_bad_status():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return _response(503)
+
+    resp = await _upstream(handler).send("POST", "/books", content=b"{}")
+    assert resp.status_code == 503 and len(calls) == 1
+
+
+@pytest.mark.anyio
+async def test_503_with_retry_after_is_passed_through():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return _response(503, **{"Retry-After": "2"})
+
+    u = _upstream(handler, breaker_threshold=1)
+    resp = await u.send("GET", "/books")
+    assert resp.status_code == 503 and resp.headers["retry-after"] == "2"
+    assert len(calls) == 1
+    # penolakan sengaja (load shedding) bukan kegagalan replika
+    assert all(r.breaker.state == "closed" and r.errors == 0 for r in u.replicas)
+
+
+@pytest.mark.anyio
+async def test_retries_stop_when_budget_is_empty():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return _response(502)
+
+    u = _upstream(handler, replicas=3, retries=2, retry_budget=RetryBudget(ratio=0, reserve=1))
+    assert (await u.send("GET", "/books")).status_code == 502
+    assert len(calls) == 2  # satu retry dari cadangan, lalu budget habis
+    assert u.retry_budget.denied == 1
+
+
+@pytest.mark.anyio
+async def test_open_breaker_replica_is_skipped():
+    hosts = []
+
+    def handler(request):
+        hosts.append(request.url.host)
+        return _response(200)
+
+    u = _upstream(handler, breaker_threshold=1, breaker_cooldown=60)
+    u.replicas[0].breaker.on_failure()
+    for _ in range(5):
+        await u.send("GET", "/books")
+    assert set(hosts) == {"r1"}
@@ -0,0 +1,202 @@
+import os
+import csv
+import json
+from typing import AsyncIterator
+
+from fastapi import HTTPException, Request, status
+from pydantic import ValidationError
+from sqlalchemy import select, case
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects import postgresql, sqlite
+
+from . import models, schemas, crud_categories, changes
+
+# =========================
+# BULK IMPORT CONFIG
+# =========================
+BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "1000"))
+MAX_ERRORS = 1000  # detail error per baris dibatasi supaya respons tetap kecil
+
+_UPDATABLE = ("judul", "penulis", "tahun", "id_kategori", "jumlah_eksemplar")
+
+BULK_IMPORT_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/x-ndjson": {"schema": {"type": "string"}, "example": '{"id_buku": 1, "judul": "...", "penulis": "..."}'},
+            "text/csv": {"schema": {"type": "string"}, "example": "id_buku,judul,penulis,tahun,tersedia,id_kategori,jumlah_eksemplar"},
+        },
+    }
+}
+
+
+# =========================
+# PARSER (NDJSON / CSV, streaming)
+# =========================
+async def _lines(request: Request) -> AsyncIterator[str]:
+    buf = b""
+    async for chunk in request.stream():
+        buf += chunk
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8-sig").rstrip("\r")
+    if buf:
+        yield buf.decode("utf-8-sig").rstrip("\r")
+
+
+async def _ndjson_records(request: Request) -> AsyncIterator[tuple[int, dict | str]]:
+    line_no = 0
+    async for line in _lines(request):
+        line_no += 1
+        if not line.strip():
+            continue
+        try:
+            obj = json.loads(line)
+        except ValueError as e:
+            yield line_no, f"JSON tidak valid: {e}"
+            continue
+        yield line_no, obj if isinstance(obj, dict) else "Baris harus berupa object JSON"
+
+
+async def _csv_records(request: Request) -> AsyncIterator[tuple[int, dict | str]]:
+    header = None
+    record, record_line, line_no = "", 0, 0
+    async for line in _lines(request):
+        line_no += 1
+        if not record:
+            record_line = line_no
+        record += line
+        # field ber-quote boleh berisi newline: tunggu sampai jumlah tanda kutip genap
+        if record.count('"') % 2:
+            record += "\n"
+            continue
+        row, record = next(csv.reader([record])), ""
+        if not any(v.strip() for v in row):
+            continue
+        if header is None:
+            header = [h.strip() for h in row]
+            continue
+        if len(row) != len(header):
+            yield record_line, f"Jumlah kolom {len(row)}, header {len(header)}"
+            continue
+        # sel kosong = pakai default schema
+        yield record_line, {k: v for k, v in zip(header, row) if v.strip() != ""}
+
+
+def parse_records(request: Request) -> AsyncIterator[tuple[int, dict | str]]:
+    ctype = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if ctype in ("application/x-ndjson", "application/ndjson", "application/jsonl"):
+        return _ndjson_records(request)
+    if ctype in ("text/csv", "application/csv"):
+        return _csv_records(request)
+    raise HTTPException(
+        status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+        detail="Kirim body sebagai application/x-ndjson atau text/csv",
+    )
+
+
+# =========================
+# BATCH INSERT
+# =========================
+async def _insert_batch(db: AsyncSession, rows: dict[int, tuple[int, dict]], mode: str, result: dict) -> None:
+    # rows: id_buku -> (nomor baris, data tervalidasi)
+    cat_ids = {d["id_kategori"] for _, d in rows.values() if d.get("id_kategori") is not None}
+    if cat_ids:
+        known = set((await db.execute(
+            select(models.Category.id_kategori).where(models.Category.id_kategori.in_(cat_ids))
+        )).scalars())
+        for id_buku, (line_no, d) in list(rows.items()):
+            if d.get("id_kategori") is not None and d["id_kategori"] not in known:
+                _error(result, line_no, id_buku, f"id_kategori {d['id_kategori']} tidak ada")
+                del rows[id_buku]
+    if not rows:
+        return
+
+    # executemany: SQLAlchemy 2.0 mengirimnya sebagai multi-row INSERT (insertmanyvalues)
+    # dengan statement yang ter-cache, bukan satu statement raksasa yang dikompilasi ulang tiap batch
+    values = [
+        {**d, "eksemplar_tersedia": d["jumlah_eksemplar"] if d["tersedia"] else 0}
+        for _, d in rows.values()
+    ]
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(models.Book)
+
+    # counter kategori dihitung ulang untuk kategori lama & baru dari buku di batch ini
+    affected = {d.get("id_kategori") for d in values}
+
+    if mode == "upsert":
+        old = (await db.execute(
+            select(models.Book.id_buku, models.Book.id_kategori).where(models.Book.id_buku.in_(rows.keys()))
+        )).all()
+        existing = {id_buku for id_buku, _ in old}
+        affected.update(id_kategori for _, id_kategori in old)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[models.Book.id_buku],
+            set_={
+                **{c: stmt.excluded[c] for c in _UPDATABLE},
+                **_copies_on_upsert(stmt.excluded),
+            },
+        )
+        await db.execute(stmt, values)
+        result["updated"] += len(existing)
+        result["inserted"] += len(rows) - len(existing)
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=[models.Book.id_buku]).returning(models.Book.id_buku)
+        inserted = set((await db.execute(stmt, values)).scalars())
+        result["inserted"] += len(inserted)
+        result["skipped"] += len(rows) - len(inserted)
+
+    await crud_categories.recompute_stats(db, affected)
+    await db.commit()
+
+
+def _copies_on_upsert(excluded) -> dict:
+    # eksemplar yang sedang dipinjam tetap dihitung; tersedia=false di file = tarik semua eksemplar
+    on_loan = models.Book.jumlah_eksemplar - models.Book.eksemplar_tersedia
+    available = excluded.jumlah_eksemplar - on_loan
+    available = case((excluded.tersedia.is_(False), 0), (available > 0, available), else_=0)
+    return {"eksemplar_tersedia": available, "tersedia": available > 0}
+
+
+def _error(result: dict, line_no: int, id_buku: int | None, msg: str) -> None:
+    result["failed"] += 1
+    if len(result["errors"]) < MAX_ERRORS:
+        result["errors"].append({"line": line_no, "id_buku": id_buku, "error": msg})
+    else:
+        result["errors_truncated"] = True
+
+
+async def import_books(db: AsyncSession, request: Request, mode: str) -> dict:
+    result = {"inserted": 0, "updated": 0, "skipped": 0, "failed": 0, "errors": [], "errors_truncated": False}
+    batch: dict[int, tuple[int, dict]] = {}
+
+    async for line_no, rec in parse_records(request):
+        if isinstance(rec, str):
+            _error(result, line_no, None, rec)
+            continue
+        try:
+            book = schemas.BookCreate.model_validate(rec)
+        except ValidationError as e:
+            id_buku = rec.get("id_buku") if isinstance(rec.get("id_buku"), int) else None
+            _error(result, line_no, id_buku, "; ".join(
+                f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()
+            ))
+            continue
+
+        if book.id_buku in batch:
+            if mode != "upsert":
+                _error(result, line_no, book.id_buku, "id_buku duplikat di dalam file")
+                continue
+            # upsert: baris terakhir yang menang
+            del batch[book.id_buku]
+        batch[book.id_buku] = (line_no, book.model_dump())
+
+        if len(batch) >= BATCH_SIZE:
+            await _insert_batch(db, batch, mode, result)
+            batch = {}
+
+    if batch:
+        await _insert_batch(db, batch, mode, result)
+    if result["inserted"] or result["updated"]:
+        changes.catalog_reset()
+    return result
@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import asyncio
+from collections import deque
+from typing import AsyncIterator
+
+from . import models, schemas
+
+# =========================
+# CHANGE FEED CONFIG (SSE /books/changes)
+# =========================
+CHANGES_BUFFER = int(os.getenv("CHANGES_BUFFER", "1000"))        # event terakhir yang bisa di-replay
+CHANGES_QUEUE = int(os.getenv("CHANGES_QUEUE", "256"))           # antrean per pelanggan sebelum diputus
+CHANGES_HEARTBEAT = float(os.getenv("CHANGES_HEARTBEAT", "15"))  # detik; di bawah idle timeout proxy/ingress
+CHANGES_RETRY_MS = int(os.getenv("CHANGES_RETRY_MS", "3000"))    # jeda reconnect yang disarankan ke client
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+PING = b": ping\n\n"
+
+
+class _Subscriber:
+    __slots__ = ("queue", "lagging")
+
+    def __init__(self, size: int):
+        self.queue: asyncio.Queue[bytes] = asyncio.Queue(size)
+        self.lagging = False
+
+
+class ChangeHub:
+    """Broadcast perubahan katalog ke semua koneksi SSE di proses ini.
+
+    Tiap event di-encode sekali jadi frame SSE lalu dibagikan ke antrean pelanggan.
+    ``CHANGES_BUFFER`` event terakhir disimpan untuk replay lewat ``Last-Event-ID``;
+    id yang sudah keluar dari buffer (atau dari proses sebelum restart) dijawab event
+    ``reset`` supaya client mengambil ulang daftar buku. Pelanggan yang antreannya penuh
+    diputus, lalu reconnect dan mengejar lewat replay.
+    """
+
+    def __init__(self, buffer_size: int, queue_size: int):
+        # prefix per proses: id dari proses lain / sebelum restart tidak pernah dianggap cocok
+        self.boot = f"{time.time_ns():x}"
+        self.queue_size = queue_size
+        self._seq = 0
+        self._buffer: deque[tuple[int, bytes]] = deque(maxlen=buffer_size)
+        self._subscribers: set[_Subscriber] = set()
+        self.published = 0
+        self.dropped = 0
+
+    def _event_id(self, seq: int) -> str:
+        return f"{self.boot}-{seq}"
+
+    def publish(self, op: str, id_buku: int | None, book: dict | None = None) -> None:
+        self._seq += 1
+        if op == "reset":
+            frame = self._reset_frame()
+        else:
+            data = json.dumps({"op": op, "id_buku": id_buku, "book": book}, ensure_ascii=False, separators=(",", ":"))
+            frame = f"id: {self._event_id(self._seq)}\ndata: {data}\n\n".encode("utf-8")
+        self._buffer.append((self._seq, frame))
+        self.published += 1
+
+        for sub in list(self._subscribers):
+            try:
+                sub.queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                sub.lagging = True
+                self._subscribers.discard(sub)
+                self.dropped += 1
+
+    def _since(self, last_event_id: str) -> list[bytes] | None:
+        # None = tidak bisa di-replay tanpa celah
+        boot, _, seq = last_event_id.rpartition("-")
+        if boot != self.boot or not seq.isdigit():
+            return None
+        seq = int(seq)
+        if seq > self._seq:
+            return None
+        oldest = self._buffer[0][0] if self._buffer else self._seq + 1
+        if seq < oldest - 1:
+            return None
+        return [frame for s, frame in self._buffer if s > seq]
+
+    def _reset_frame(self) -> bytes:
+        # event "reset" = ambil ulang seluruh daftar, lalu lanjut dari id ini
+        return f"id: {self._event_id(self._seq)}\nevent: reset\ndata: {{}}\n\n".encode()
+
+    async def stream(self, last_event_id: str | None) -> AsyncIterator[bytes]:
+        # replay dihitung dan pelanggan didaftarkan tanpa await di antaranya: tidak ada event yang
+        # terlewat atau terkirim dua kali
+        replay = self._since(last_event_id) if last_event_id else []
+        sub = _Subscriber(self.queue_size)
+        self._subscribers.add(sub)
+        try:
+            yield f"retry: {CHANGES_RETRY_MS}\n\n".encode()
+            if replay is None:
+                yield self._reset_frame()
+            else:
+                for frame in replay:
+                    yield frame
+
+            while not (sub.lagging and sub.queue.empty()):
+                try:
+                    frame = await asyncio.wait_for(sub.queue.get(), CHANGES_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield PING
+                    continue
+                yield frame
+        finally:
+            self._subscribers.discard(sub)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "last_event_id": self._event_id(self._seq),
+            "buffered": len(self._buffer),
+            "buffer_size": self._buffer.maxlen,
+            "published": self.published,
+            "dropped": self.dropped,
+        }
+
+
+hub = ChangeHub(CHANGES_BUFFER, CHANGES_QUEUE)
+
+
+# =========================
+# PUBLISH (dipanggil setelah commit)
+# =========================
+def book_saved(op: str, book: models.Book) -> None:
+    hub.publish(op, book.id_buku, schemas.BookOut.model_validate(book).model_dump(mode="json"))
+
+
+def book_deleted(id_buku: int) -> None:
+    hub.publish("delete", id_buku)
+
+
+def stock_changed(id_buku: int, eksemplar_tersedia: int) -> None:
+    # pinjam/kembali: hanya kolom stok yang berubah; client menggabungkan ke data bukunya
+    hub.publish("stock", id_buku, {"eksemplar_tersedia": eksemplar_tersedia, "tersedia": eksemplar_tersedia > 0})
+
+
+def catalog_reset() -> None:
+    # banyak buku berubah sekaligus (bulk import): client cukup ambil ulang daftarnya
+    hub.publish("reset", None)
@@ -1,44 +1,185 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, tuple_
 from fastapi import HTTPException, status
-from . import models, schemas
+from . import models, schemas, storage, pagination, crud_categories, crud_loans, changes, pdf_ingest
 
-def create_book(db: Session, payload: schemas.BookCreate) -> models.Book:
+async def create_book(db: AsyncSession, payload: schemas.BookCreate) -> models.Book:
     # Pastikan id_buku tidak bentrok
-    exists = db.execute(select(models.Book).where(models.Book.id_buku == payload.id_buku)).scalar_one_or_none()
+    exists = (await db.execute(select(models.Book).where(models.Book.id_buku == payload.id_buku))).scalar_one_or_none()
     if exists:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail=f"id_buku {payload.id_buku} sudah digunakan."
         )
 
+    await crud_categories.ensure_category(db, payload.id_kategori)
+
     book = models.Book(**payload.model_dump())
+    # tersedia=False saat dibuat = eksemplar belum boleh dipinjam
+    book.eksemplar_tersedia = book.jumlah_eksemplar if book.tersedia else 0
     db.add(book)
-    db.commit()
-    db.refresh(book)
+    await crud_categories.book_added(db, book)
+    await db.commit()
+    await db.refresh(book)
+    changes.book_saved("create", book)
     return book
 
-def get_book(db: Session, id_buku: int) -> models.Book:
-    book = db.execute(select(models.Book).where(models.Book.id_buku == id_buku)).scalar_one_or_none()
+async def get_book(db: AsyncSession, id_buku: int) -> models.Book:
+    book = (await db.execute(select(models.Book).where(models.Book.id_buku == id_buku))).scalar_one_or_none()
     if not book:
         raise HTTPException(status_code=404, detail="Buku tidak ditemukan.")
     return book
 
-def list_books(db: Session, skip: int = 0, limit: int = 20):
-    return db.execute(select(models.Book).offset(skip).limit(limit)).scalars().all()
+# =========================
+# BARIS BUKU UNTUK ENDPOINT BACA
+# =========================
+# Kolom mentah + outer join, bukan entity ORM: satu query per halaman (tanpa selectin kategori /
+# job ingest / dokumen PDF), tanpa identity map, dan dict hasilnya langsung di-encode orjson.
+# Bentuk dict harus sama persis dengan schemas.BookOut (termasuk urutan field).
+BOOK_ROW_COLUMNS = (
+    models.Book.judul,
+    models.Book.penulis,
+    models.Book.tahun,
+    models.Book.tersedia,
+    models.Book.id_kategori,
+    models.Book.id_buku,
+    models.Book.pdf_url,
+    models.Book.jumlah_eksemplar,
+    models.Book.eksemplar_tersedia,
+    models.Category.nama.label("nama_kategori"),
+    models.PdfIngestJob.status.label("pdf_status"),
+    models.PdfDocument.page_count,
+    models.PdfDocument.size,
+    models.PdfDocument.thumbnail_url,
+)
+
+def _select_book_rows(id_kategori: int | None = None):
+    # pdf_ingest_jobs.sha256 unik & pdf_documents.sha256 PK: join tidak menggandakan baris
+    stmt = (
+        select(*BOOK_ROW_COLUMNS)
+        .outerjoin(models.Category, models.Category.id_kategori == models.Book.id_kategori)
+        .outerjoin(models.PdfIngestJob, models.PdfIngestJob.sha256 == models.Book.pdf_sha256)
+        .outerjoin(models.PdfDocument, models.PdfDocument.sha256 == models.Book.pdf_sha256)
+    )
+    if id_kategori is not None:
+        # memakai index ix_books_id_kategori_id_buku
+        stmt = stmt.where(models.Book.id_kategori == id_kategori)
+    return stmt
+
+def book_row(row) -> dict:
+    (judul, penulis, tahun, tersedia, id_kategori, id_buku, pdf_url, jumlah, eksemplar,
+     nama_kategori, pdf_status, page_count, size, thumbnail_url) = row
+    return {
+        "judul": judul,
+        "penulis": penulis,
+        "tahun": tahun,
+        "tersedia": tersedia,
+        "id_kategori": id_kategori,
+        "id_buku": id_buku,
+        "pdf_url": pdf_url,
+        "jumlah_eksemplar": jumlah,
+        "eksemplar_tersedia": eksemplar,
+        "kategori": {"nama": nama_kategori, "id_kategori": id_kategori} if nama_kategori is not None else None,
+        "pdf_status": pdf_status,
+        "jumlah_halaman": page_count,
+        "ukuran_pdf": size,
+        "thumbnail_url": thumbnail_url,
+    }
+
+def book_dict(book: models.Book) -> dict:
+    # entity yang sudah dimuat (mis. hasil search) ke bentuk yang sama dengan book_row
+    doc = book.pdf_document
+    return book_row((
+        book.judul, book.penulis, book.tahun, book.tersedia, book.id_kategori, book.id_buku, book.pdf_url,
+        book.jumlah_eksemplar, book.eksemplar_tersedia, book.category.nama if book.category else None,
+        book.pdf_job.status if book.pdf_job else None,
+        doc.page_count if doc else None, doc.size if doc else None, doc.thumbnail_url if doc else None,
+    ))
+
+async def get_book_row(db: AsyncSession, id_buku: int) -> dict:
+    row = (await db.execute(_select_book_rows().where(models.Book.id_buku == id_buku))).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Buku tidak ditemukan.")
+    return book_row(row)
+
+async def list_books(db: AsyncSession, skip: int = 0, limit: int = 20, id_kategori: int | None = None) -> list[dict]:
+    # mode lama (offset); diurutkan supaya isi halaman stabil
+    stmt = _select_book_rows(id_kategori).order_by(models.Book.id_buku).offset(skip).limit(limit)
+    return [book_row(row) for row in (await db.execute(stmt)).all()]
 
-def update_book(db: Session, id_buku: int, payload: schemas.BookUpdate) -> models.Book:
-    book = get_book(db, id_buku)
+async def list_books_page(
+    db: AsyncSession,
+    cursor: str | None,
+    limit: int = 20,
+    sort: str = "id_buku",
+    order: str = "asc",
+    id_kategori: int | None = None,
+) -> dict:
+    # keyset pagination: WHERE (kolom, id_buku) > (nilai terakhir) memakai index, tanpa OFFSET
+    col = pagination.SORT_KEYS[sort]
+    key = (col,) if sort == "id_buku" else (col, models.Book.id_buku)
+    limit = max(1, min(limit, pagination.MAX_PAGE_SIZE))
+
+    stmt = _select_book_rows(id_kategori)
+    if cursor:
+        value, last_id = pagination.decode_cursor(cursor, sort, order)
+        last = (last_id,) if sort == "id_buku" else (value, last_id)
+        stmt = stmt.where(tuple_(*key) > tuple_(*last) if order == "asc" else tuple_(*key) < tuple_(*last))
+
+    stmt = stmt.order_by(*[k.asc() if order == "asc" else k.desc() for k in key]).limit(limit + 1)
+    rows = (await db.execute(stmt)).all()
+
+    items = rows[:limit]
+    next_cursor = pagination.encode_cursor(sort, order, items[-1]) if len(rows) > limit else None
+    return {"items": [book_row(row) for row in items], "next_cursor": next_cursor}
+
+async def update_book(db: AsyncSession, id_buku: int, payload: schemas.BookUpdate) -> models.Book:
+    book = await get_book(db, id_buku)
     data = payload.model_dump(exclude_unset=True)
+    if "id_kategori" in data:
+        await crud_categories.ensure_category(db, data["id_kategori"])
+
+    old_kategori, old_tersedia = book.id_kategori, book.tersedia
+    # stok eksemplar diubah dengan UPDATE kondisional (bisa bersamaan dengan pinjam/kembali)
+    jumlah = data.pop("jumlah_eksemplar", None)
+    tersedia = data.pop("tersedia", None)
+    if jumlah is not None:
+        await crud_loans.set_copies(db, id_buku, jumlah)
+    if tersedia is not None:
+        await crud_loans.set_available(db, id_buku, tersedia)
+    if jumlah is not None or tersedia is not None:
+        await db.refresh(book, ["jumlah_eksemplar", "eksemplar_tersedia", "tersedia"])
 
     for k, v in data.items():
         setattr(book, k, v)
 
-    db.commit()
-    db.refresh(book)
+    await crud_categories.book_changed(db, old_kategori, old_tersedia, book)
+    await db.commit()
+    await db.refresh(book)
+    changes.book_saved("update", book)
     return book
 
-def delete_book(db: Session, id_buku: int) -> None:
-    book = get_book(db, id_buku)
-    db.delete(book)
-    db.commit()
\ No newline at end of file
+async def delete_book(db: AsyncSession, id_buku: int) -> None:
+    book = await get_book(db, id_buku)
+    if await crud_loans.has_active_loans(db, id_buku):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Buku masih dipinjam.")
+    legacy_file = await storage.release_book_pdf(db, book)
+    await crud_loans.detach_book(db, book)
+    await crud_categories.book_removed(db, book)
+    await db.delete(book)
+    await db.commit()
+    changes.book_deleted(id_buku)
+    await storage.remove_legacy_file(legacy_file)
+
+async def attach_pdf(db: AsyncSession, id_buku: int, digest: str) -> models.Book:
+    # blob sudah di-pin (ref +1); referensi ke PDF lama dilepas di transaksi yang sama
+    book = await get_book(db, id_buku)
+    legacy_file = await storage.set_book_pdf(db, book, digest)
+    # ekstraksi metadata/teks/thumbnail jalan di background; isi yang sama tidak diproses ulang
+    await pdf_ingest.enqueue(db, digest)
+    await db.commit()
+    pdf_ingest.ingestor.wake()
+    await db.refresh(book)
+    changes.book_saved("pdf", book)
+    await storage.remove_legacy_file(legacy_file)
+    return book
\ No newline at end of file
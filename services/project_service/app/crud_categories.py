@@ -0,0 +1,151 @@
+from sqlalchemy import select, delete, func, case
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import HTTPException, status
+from . import models, schemas
+
+# =========================
+# CRUD KATEGORI
+# =========================
+async def list_categories(db: AsyncSession) -> list[models.Category]:
+    return (await db.execute(select(models.Category).order_by(models.Category.nama))).scalars().all()
+
+async def get_category(db: AsyncSession, id_kategori: int) -> models.Category:
+    category = await db.get(models.Category, id_kategori)
+    if not category:
+        raise HTTPException(status_code=404, detail="Kategori tidak ditemukan.")
+    return category
+
+async def ensure_category(db: AsyncSession, id_kategori: int | None) -> None:
+    # dicek di aplikasi supaya balasannya 400, bukan error FK dari database
+    if id_kategori is not None and await db.get(models.Category, id_kategori) is None:
+        raise HTTPException(status_code=400, detail=f"id_kategori {id_kategori} tidak ada.")
+
+async def create_category(db: AsyncSession, payload: schemas.CategoryCreate) -> models.Category:
+    category = models.Category(nama=payload.nama)
+    db.add(category)
+    await _commit_unique(db, payload.nama)
+    await db.refresh(category)
+    return category
+
+async def update_category(db: AsyncSession, id_kategori: int, payload: schemas.CategoryUpdate) -> models.Category:
+    category = await get_category(db, id_kategori)
+    category.nama = payload.nama
+    await _commit_unique(db, payload.nama)
+    await db.refresh(category)
+    return category
+
+async def delete_category(db: AsyncSession, id_kategori: int) -> None:
+    category = await get_category(db, id_kategori)
+    used = (await db.execute(
+        select(models.Book.id_buku).where(models.Book.id_kategori == id_kategori).limit(1)
+    )).scalar_one_or_none()
+    if used is not None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Kategori masih dipakai buku; pindahkan bukunya dulu.",
+        )
+    await db.delete(category)
+    await db.execute(delete(models.CategoryStat).where(models.CategoryStat.id_kategori == id_kategori))
+    await db.commit()
+
+async def _commit_unique(db: AsyncSession, nama: str) -> None:
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Kategori '{nama}' sudah ada.")
+
+# =========================
+# COUNTER PER KATEGORI (tabel category_stats)
+# =========================
+def _key(id_kategori: int | None) -> int:
+    return id_kategori or 0
+
+async def bump_stats(db: AsyncSession, id_kategori: int | None, buku: int, tersedia: int) -> None:
+    # upsert atomik (jumlah = jumlah + delta): penulis bersamaan tidak saling menimpa.
+    # Tidak commit; ikut transaksi perubahan bukunya.
+    if not buku and not tersedia:
+        return
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(models.CategoryStat).values(
+        id_kategori=_key(id_kategori), jumlah_buku=buku, jumlah_tersedia=tersedia
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.CategoryStat.id_kategori],
+        set_={
+            "jumlah_buku": models.CategoryStat.jumlah_buku + stmt.excluded.jumlah_buku,
+            "jumlah_tersedia": models.CategoryStat.jumlah_tersedia + stmt.excluded.jumlah_tersedia,
+        },
+    )
+    await db.execute(stmt)
+
+async def book_added(db: AsyncSession, book: models.Book) -> None:
+    await bump_stats(db, book.id_kategori, 1, int(book.tersedia))
+
+async def book_removed(db: AsyncSession, book: models.Book) -> None:
+    await bump_stats(db, book.id_kategori, -1, -int(book.tersedia))
+
+async def book_changed(db: AsyncSession, old_kategori: int | None, old_tersedia: bool, book: models.Book) -> None:
+    if old_kategori == book.id_kategori and old_tersedia == book.tersedia:
+        return
+    await bump_stats(db, old_kategori, -1, -int(old_tersedia))
+    await bump_stats(db, book.id_kategori, 1, int(book.tersedia))
+
+async def recompute_stats(db: AsyncSession, ids: set[int | None] | None = None) -> None:
+    # hitung ulang dari tabel books (bulk import / perbaikan); ids None = semua kategori
+    key = func.coalesce(models.Book.id_kategori, 0)
+    stmt = select(
+        key,
+        func.count(),
+        func.coalesce(func.sum(case((models.Book.tersedia, 1), else_=0)), 0),
+    ).group_by(key)
+    clear = delete(models.CategoryStat)
+    if ids is not None:
+        keys = {_key(i) for i in ids}
+        stmt = stmt.where(key.in_(keys))
+        clear = clear.where(models.CategoryStat.id_kategori.in_(keys))
+
+    rows = (await db.execute(stmt)).all()
+    await db.execute(clear)
+    if rows:
+        await db.execute(
+            models.CategoryStat.__table__.insert(),
+            [{"id_kategori": k, "jumlah_buku": n, "jumlah_tersedia": t} for k, n, t in rows],
+        )
+
+async def backfill_stats(db: AsyncSession) -> None:
+    # database lama (sebelum ada category_stats): isi counter sekali saat startup
+    has_stats = (await db.execute(select(models.CategoryStat.id_kategori).limit(1))).first()
+    has_books = (await db.execute(select(models.Book.id_buku).limit(1))).first()
+    if has_books and not has_stats:
+        await recompute_stats(db)
+        await db.commit()
+
+async def get_stats(db: AsyncSession) -> dict:
+    # baca counter (satu baris per kategori), bukan COUNT(*) atas seluruh tabel books
+    rows = (await db.execute(
+        select(
+            models.Category.id_kategori,
+            models.Category.nama,
+            func.coalesce(models.CategoryStat.jumlah_buku, 0),
+            func.coalesce(models.CategoryStat.jumlah_tersedia, 0),
+        )
+        .outerjoin(models.CategoryStat, models.CategoryStat.id_kategori == models.Category.id_kategori)
+        .order_by(models.Category.nama)
+    )).all()
+    items = [
+        {"id_kategori": i, "nama": nama, "jumlah_buku": n, "jumlah_tersedia": t}
+        for i, nama, n, t in rows
+    ]
+
+    none = await db.get(models.CategoryStat, 0)
+    if none is not None and none.jumlah_buku:
+        items.append({"id_kategori": None, "nama": None, "jumlah_buku": none.jumlah_buku, "jumlah_tersedia": none.jumlah_tersedia})
+
+    return {
+        "total_buku": sum(i["jumlah_buku"] for i in items),
+        "total_tersedia": sum(i["jumlah_tersedia"] for i in items),
+        "kategori": items,
+    }
@@ -0,0 +1,205 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, update, func, case
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import HTTPException, status
+from . import models, crud_categories, changes
+
+# =========================
+# LOAN CONFIG
+# =========================
+LOAN_DAYS = int(os.getenv("LOAN_DAYS", "14"))
+MAX_ACTIVE_LOANS = int(os.getenv("MAX_ACTIVE_LOANS", "10"))  # per user; 0 = tanpa batas
+
+Book = models.Book
+Loan = models.Loan
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+async def _book_or_404(db: AsyncSession, id_buku: int) -> None:
+    exists = (await db.execute(select(Book.id_buku).where(Book.id_buku == id_buku))).scalar_one_or_none()
+    if exists is None:
+        raise HTTPException(status_code=404, detail="Buku tidak ditemukan.")
+
+# =========================
+# PINJAM
+# =========================
+async def borrow(db: AsyncSession, id_buku: int, user_sub: str) -> models.Loan:
+    # jalur cepat tanpa lock: judul yang sudah habis langsung 409, tidak ikut antre di row lock
+    available = (await db.execute(
+        select(Book.eksemplar_tersedia).where(Book.id_buku == id_buku)
+    )).scalar_one_or_none()
+    if available is None:
+        raise HTTPException(status_code=404, detail="Buku tidak ditemukan.")
+    if available <= 0:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Semua eksemplar sedang dipinjam.")
+
+    if MAX_ACTIVE_LOANS:
+        active = (await db.execute(
+            select(func.count()).select_from(Loan).where(Loan.user_sub == user_sub, Loan.returned_at.is_(None))
+        )).scalar_one()
+        if active >= MAX_ACTIVE_LOANS:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Batas {MAX_ACTIVE_LOANS} pinjaman aktif sudah tercapai.",
+            )
+    # transaksi baca diakhiri dulu; transaksi tulis di bawah dimulai dari snapshot baru
+    await db.rollback()
+
+    # klaim satu eksemplar dengan satu UPDATE kondisional (bukan baca lalu tulis):
+    # peminjam bersamaan antre di row lock, dan yang kalah mendapat 0 baris, bukan stok minus
+    claimed = (await db.execute(
+        update(Book)
+        .where(Book.id_buku == id_buku, Book.eksemplar_tersedia > 0)
+        .values(
+            eksemplar_tersedia=Book.eksemplar_tersedia - 1,
+            tersedia=Book.eksemplar_tersedia > 1,  # nilai lama: sisa > 0 setelah dikurangi
+        )
+        .returning(Book.eksemplar_tersedia, Book.id_kategori, Book.judul)
+        .execution_options(synchronize_session=False)
+    )).first()
+    if claimed is None:
+        await db.rollback()
+        await _book_or_404(db, id_buku)
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Semua eksemplar sedang dipinjam.")
+
+    now = _now()
+    remaining, id_kategori, judul = claimed
+    loan = Loan(
+        id_buku=id_buku, judul=judul, user_sub=user_sub, borrowed_at=now, due_at=now + timedelta(days=LOAN_DAYS)
+    )
+    db.add(loan)
+    try:
+        await db.flush()
+    except IntegrityError:
+        # index unik pinjaman aktif: user ini sudah meminjam judul yang sama (klaim eksemplar ikut dibatalkan)
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Buku ini sedang Anda pinjam.")
+
+    if remaining == 0:
+        await crud_categories.bump_stats(db, id_kategori, 0, -1)
+    await db.commit()
+    changes.stock_changed(id_buku, remaining)
+    return loan
+
+# =========================
+# KEMBALIKAN
+# =========================
+async def return_book(db: AsyncSession, id_buku: int, user_sub: str) -> models.Loan:
+    # tutup pinjaman aktif dulu; hanya yang berhasil menutup yang boleh menambah stok
+    loan = (await db.execute(
+        update(Loan)
+        .where(Loan.id_buku == id_buku, Loan.user_sub == user_sub, Loan.returned_at.is_(None))
+        .values(returned_at=_now())
+        .returning(Loan)
+        .execution_options(synchronize_session=False)
+    )).scalar_one_or_none()
+    if loan is None:
+        await db.rollback()
+        raise HTTPException(status_code=404, detail="Tidak ada pinjaman aktif untuk buku ini.")
+
+    restored = (await db.execute(
+        update(Book)
+        .where(Book.id_buku == id_buku, Book.eksemplar_tersedia < Book.jumlah_eksemplar)
+        .values(eksemplar_tersedia=Book.eksemplar_tersedia + 1, tersedia=True)
+        .returning(Book.eksemplar_tersedia, Book.id_kategori)
+        .execution_options(synchronize_session=False)
+    )).first()
+    # None = jumlah eksemplar sudah dikurangi admin selama dipinjam; stok tidak ditambah
+    if restored is not None and restored[0] == 1:
+        await crud_categories.bump_stats(db, restored[1], 0, 1)
+    await db.commit()
+    if restored is not None:
+        changes.stock_changed(id_buku, restored[0])
+    return loan
+
+# =========================
+# DAFTAR PINJAMAN
+# =========================
+async def list_loans(
+    db: AsyncSession,
+    user_sub: str | None,
+    id_buku: int | None = None,
+    aktif: bool | None = None,
+    limit: int = 50,
+) -> list[models.Loan]:
+    stmt = select(Loan)
+    if user_sub is not None:
+        stmt = stmt.where(Loan.user_sub == user_sub)
+    if id_buku is not None:
+        stmt = stmt.where(Loan.id_buku == id_buku)
+    if aktif is not None:
+        stmt = stmt.where(Loan.returned_at.is_(None) if aktif else Loan.returned_at.is_not(None))
+    stmt = stmt.order_by(Loan.id.desc()).limit(max(1, min(limit, 500)))
+    return (await db.execute(stmt)).scalars().all()
+
+async def has_active_loans(db: AsyncSession, id_buku: int) -> bool:
+    return (await db.execute(
+        select(Loan.id).where(Loan.id_buku == id_buku, Loan.returned_at.is_(None)).limit(1)
+    )).first() is not None
+
+async def detach_book(db: AsyncSession, book: models.Book) -> None:
+    # buku dihapus: riwayat pinjaman disimpan, dilepas dari bukunya (judul lama tetap tercatat).
+    # Eksplisit, tidak hanya mengandalkan ON DELETE SET NULL (SQLite lama tanpa FK)
+    await db.execute(
+        update(Loan)
+        .where(Loan.id_buku == book.id_buku)
+        .values(id_buku=None, judul=func.coalesce(Loan.judul, book.judul))
+        .execution_options(synchronize_session=False)
+    )
+
+# =========================
+# PERUBAHAN STOK OLEH ADMIN (update_book)
+# =========================
+async def set_copies(db: AsyncSession, id_buku: int, jumlah: int) -> None:
+    # eksemplar yang sedang dipinjam tetap dihitung: tersedia bertambah/berkurang sebesar selisihnya
+    delta = jumlah - Book.jumlah_eksemplar
+    result = await db.execute(
+        update(Book)
+        .where(Book.id_buku == id_buku, Book.eksemplar_tersedia + delta >= 0)
+        .values(
+            jumlah_eksemplar=jumlah,
+            eksemplar_tersedia=Book.eksemplar_tersedia + delta,
+            tersedia=Book.eksemplar_tersedia + delta > 0,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Jumlah eksemplar lebih kecil dari yang sedang dipinjam.",
+        )
+
+async def set_available(db: AsyncSession, id_buku: int, tersedia: bool) -> None:
+    # False = tarik semua eksemplar; True = semua yang tidak sedang dipinjam kembali ke rak
+    if tersedia:
+        on_loan = (
+            select(func.count()).select_from(Loan)
+            .where(Loan.id_buku == id_buku, Loan.returned_at.is_(None))
+            .scalar_subquery()
+        )
+        available = Book.jumlah_eksemplar - on_loan
+        values = {
+            "eksemplar_tersedia": case((available > 0, available), else_=0),
+            "tersedia": available > 0,
+        }
+    else:
+        values = {"eksemplar_tersedia": 0, "tersedia": False}
+    await db.execute(
+        update(Book).where(Book.id_buku == id_buku).values(**values).execution_options(synchronize_session=False)
+    )
+
+async def sync_availability(db: AsyncSession) -> None:
+    # database lama: kolom eksemplar baru terisi default 1 walau tersedia=False; samakan sekali saat startup
+    result = await db.execute(
+        update(Book)
+        .where(Book.tersedia.is_(False), Book.eksemplar_tersedia > 0)
+        .values(eksemplar_tersedia=0)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
+        await db.commit()
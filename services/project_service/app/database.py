@@ -1,6 +1,19 @@
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+import math
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from fastapi import Request
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import make_url, URL
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.orm import declarative_base
+
+from . import metrics
 
 # =========================
 # DATABASE CONFIG (POSTGRES ONLY)
@@ -10,22 +23,278 @@ DATABASE_URL = os.getenv("PROJECT_DB_URL")
 if not DATABASE_URL:
     raise RuntimeError("PROJECT_DB_URL environment variable is not set")
 
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=True
-)
+# Pool & cache (diabaikan untuk SQLite)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # detik; -1 = tidak pernah
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))  # 0 = matikan (mis. di belakang pgbouncer)
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "30000"))
+
+# Read replica (opsional): URL dipisah koma, format sama dengan PROJECT_DB_URL
+DB_READ_URLS = [u.strip() for u in os.getenv("PROJECT_DB_READ_URLS", "").split(",") if u.strip()]
+DB_READ_MAX_LAG_SECONDS = float(os.getenv("DB_READ_MAX_LAG_SECONDS", "5"))  # replika yang tertinggal lebih dari ini dilewati
+DB_READ_HEALTH_INTERVAL = float(os.getenv("DB_READ_HEALTH_INTERVAL", "5"))
+# client yang baru menulis membaca dari primary selama sekian detik (read-your-writes, lewat cookie)
+DB_READ_AFTER_WRITE_SECONDS = float(os.getenv("DB_READ_AFTER_WRITE_SECONDS", "5"))
+READ_AFTER_WRITE_COOKIE = "rw_until"
+
+logger = logging.getLogger(__name__)
+
+_ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def _async_url(raw: str) -> tuple[URL, dict]:
+    # URL lama (postgresql+psycopg2://...?sslmode=require) tetap dipakai, driver diganti ke versi async
+    url = make_url(raw)
+    backend = url.get_backend_name()
+    if backend not in _ASYNC_DRIVERS:
+        raise RuntimeError(f"PROJECT_DB_URL: database {backend} tidak didukung")
+    url = url.set(drivername=_ASYNC_DRIVERS[backend])
+
+    connect_args = {}
+    if backend == "postgresql":
+        # asyncpg tidak mengenal sslmode; padanannya argumen ssl
+        sslmode = url.query.get("sslmode")
+        if sslmode:
+            url = url.difference_update_query(["sslmode"])
+            connect_args["ssl"] = sslmode
+        connect_args["prepared_statement_cache_size"] = DB_STATEMENT_CACHE_SIZE
+        connect_args["statement_cache_size"] = DB_STATEMENT_CACHE_SIZE
+    return url, connect_args
+
+
+def _engine_kwargs(url: URL, connect_args: dict) -> dict:
+    kwargs = {"pool_pre_ping": True, "connect_args": connect_args}
+    if url.get_backend_name() != "sqlite":
+        kwargs.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    return kwargs
+
+
+def _create_engine(url: URL, connect_args: dict) -> AsyncEngine:
+    eng = create_async_engine(url, **_engine_kwargs(url, connect_args))
+    if url.get_backend_name() == "sqlite":
+        # SQLite (dev/benchmark): WAL supaya pembaca tidak memblokir penulis, dan penulis
+        # bersamaan menunggu lock (busy_timeout) alih-alih langsung "database is locked".
+        # foreign_keys: SQLite default tidak menegakkan FK; disamakan dengan Postgres
+        @event.listens_for(eng.sync_engine, "connect")
+        def _sqlite_pragmas(dbapi_conn, _record):
+            cur = dbapi_conn.cursor()
+            cur.execute("PRAGMA journal_mode=WAL")
+            cur.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+            cur.execute("PRAGMA foreign_keys=ON")
+            cur.close()
+    return eng
 
-SessionLocal = sessionmaker(
-    autocommit=False,
+
+_url, _connect_args = _async_url(DATABASE_URL)
+engine = _create_engine(_url, _connect_args)
+metrics.instrument_engine(engine, "primary")
+
+SessionLocal = async_sessionmaker(
+    engine,
     autoflush=False,
-    bind=engine
+    expire_on_commit=False,
 )
 
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
+async def get_db():
+    async with SessionLocal() as db:
+        yield db
+
+# =========================
+# READ REPLICA ROUTING
+# =========================
+# lag replikasi postgres dalam detik; 0 kalau semua WAL yang diterima sudah di-replay
+_PG_LAG_SQL = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+class ReadReplica:
+    def __init__(self, raw_url: str):
+        url, connect_args = _async_url(raw_url)
+        self.name = url.render_as_string(hide_password=True)
+        self.engine: AsyncEngine = _create_engine(url, connect_args)
+        metrics.instrument_engine(self.engine, f"replica:{url.host or url.database}")
+        self.sessions = async_sessionmaker(self.engine, autoflush=False, expire_on_commit=False)
+        self.healthy = True
+        self.lag = 0.0
+        self.errors = 0
+        self.reads = 0
+
+    def mark_down(self, reason: str) -> None:
+        if self.healthy:
+            logger.warning("read replica %s dilewati: %s", self.name, reason)
+        self.healthy = False
+        self.errors += 1
+
+    async def check(self) -> None:
+        try:
+            async with self.engine.connect() as conn:
+                if conn.dialect.name == "postgresql":
+                    self.lag = float((await conn.execute(_PG_LAG_SQL)).scalar() or 0)
+                else:
+                    await conn.execute(text("SELECT 1"))
+                    self.lag = 0.0
+        except (DBAPIError, OSError) as e:
+            self.mark_down(f"health check gagal ({e.__class__.__name__})")
+            return
+        if self.lag > DB_READ_MAX_LAG_SECONDS:
+            self.mark_down(f"lag {self.lag:.1f}s")
+        elif not self.healthy:
+            logger.info("read replica %s pulih (lag %.1fs)", self.name, self.lag)
+            self.healthy = True
+
+    def stats(self) -> dict:
+        return {"url": self.name, "healthy": self.healthy, "lag": self.lag, "reads": self.reads, "errors": self.errors}
+
+
+class ReadRouter:
+    """Memilih session untuk read-only route: replika sehat (round-robin) atau primary."""
+
+    def __init__(self, urls: list[str]):
+        self.replicas = [ReadReplica(u) for u in urls]
+        self._next = 0
+        self.primary_reads = 0
+
+    def pick(self, strong: bool = False) -> ReadReplica | None:
+        # None = pakai primary
+        if strong or not self.replicas:
+            return None
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[self._next % len(self.replicas)]
+            self._next += 1
+            if replica.healthy:
+                return replica
+        return None
+
+    async def health_loop(self) -> None:
+        # dijalankan sebagai background task dari startup app
+        while True:
+            await asyncio.gather(*(r.check() for r in self.replicas))
+            await asyncio.sleep(DB_READ_HEALTH_INTERVAL)
+
+    async def dispose(self) -> None:
+        for r in self.replicas:
+            await r.engine.dispose()
+
+    def stats(self) -> dict:
+        return {"replicas": [r.stats() for r in self.replicas], "primary_reads": self.primary_reads}
+
+
+read_router = ReadRouter(DB_READ_URLS)
+
+
+class ReadYourWritesMiddleware:
+    """Request tulis yang berhasil memasang cookie ``rw_until`` berumur DB_READ_AFTER_WRITE_SECONDS.
+
+    Selama cookie itu masih berlaku, read dari client yang sama diarahkan ke primary
+    (lihat wants_strong); client lain tetap membaca dari replika. Cookie berisi waktu
+    kedaluwarsa (epoch), jadi tetap berlaku kalau request berikutnya jatuh ke instance lain.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] in ("GET", "HEAD", "OPTIONS")
+            or not read_router.replicas
+            or DB_READ_AFTER_WRITE_SECONDS <= 0
+        ):
+            return await self.app(scope, receive, send)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                until = time.time() + DB_READ_AFTER_WRITE_SECONDS
+                cookie = (
+                    f"{READ_AFTER_WRITE_COOKIE}={until:.3f}; Max-Age={math.ceil(DB_READ_AFTER_WRITE_SECONDS)}; "
+                    "Path=/; HttpOnly; SameSite=Lax"
+                )
+                message = {**message, "headers": [*message.get("headers", []), (b"set-cookie", cookie.encode())]}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+@asynccontextmanager
+async def read_session(strong: bool = False) -> AsyncIterator[AsyncSession]:
+    replica = read_router.pick(strong)
+    db = None
+    if replica is not None:
+        db = replica.sessions()
+        try:
+            # ambil koneksi di awal: replika mati ketahuan di sini dan request pindah ke primary
+            await db.connection()
+        except (DBAPIError, OSError) as e:
+            replica.mark_down(f"koneksi gagal ({e.__class__.__name__})")
+            await db.close()
+            replica, db = None, None
+
+    if db is None:
+        read_router.primary_reads += 1
+        db = SessionLocal()
+    else:
+        replica.reads += 1
+
+    async with db:
+        try:
+            yield db
+        except DBAPIError as e:
+            if replica is not None and e.connection_invalidated:
+                replica.mark_down("koneksi terputus")
+            raise
+
+
+def wants_strong(request: Request) -> bool:
+    # X-Consistency: strong = selalu primary; cookie rw_until = client ini baru saja menulis
+    if request.headers.get("x-consistency", "").lower() == "strong":
+        return True
     try:
+        return float(request.cookies.get(READ_AFTER_WRITE_COOKIE, "0")) > time.time()
+    except ValueError:
+        return False
+
+
+async def get_read_db(request: Request):
+    async with read_session(wants_strong(request)) as db:
         yield db
-    finally:
-        db.close()
+
+def sync_schema(conn) -> None:
+    # dipanggil lewat AsyncConnection.run_sync saat startup.
+    # create_all hanya membuat tabel baru; kolom/index baru di tabel lama ditambahkan di sini
+    Base.metadata.create_all(bind=conn)
+
+    insp = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {c["name"]: c for c in insp.get_columns(table.name)}
+        for col in table.columns:
+            if col.name in existing:
+                if col.nullable and not existing[col.name]["nullable"]:
+                    # kolom yang dilonggarkan jadi nullable (mis. loans.id_buku). SQLite tidak bisa
+                    # ALTER COLUMN: tabel lama harus dibuat ulang
+                    if conn.dialect.name == "postgresql":
+                        conn.execute(text(f"ALTER TABLE {table.name} ALTER COLUMN {col.name} DROP NOT NULL"))
+                    else:
+                        logger.warning("kolom %s.%s masih NOT NULL; buat ulang tabelnya", table.name, col.name)
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {col.name} {col.type.compile(conn.dialect)}"
+            if col.server_default is not None:
+                arg = col.server_default.arg
+                ddl += f" DEFAULT '{arg}'" if isinstance(arg, str) else f" DEFAULT {arg.compile(dialect=conn.dialect)}"
+            conn.execute(text(ddl))
+
+    for table in Base.metadata.sorted_tables:
+        existing_idx = {i["name"] for i in insp.get_indexes(table.name)}
+        for idx in table.indexes:
+            if idx.name not in existing_idx:
+                idx.create(conn, checkfirst=True)
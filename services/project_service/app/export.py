@@ -0,0 +1,80 @@
+import io
+import os
+import csv
+import json
+import zlib
+from typing import AsyncIterator
+
+from sqlalchemy import select
+
+from . import models
+from .database import read_session
+
+# =========================
+# EXPORT CONFIG
+# =========================
+YIELD_PER = int(os.getenv("EXPORT_YIELD_PER", "2000"))  # baris per fetch dari server-side cursor
+
+# kolom mentah (bukan entity ORM): tidak ada identity map / objek Book yang dibangun
+EXPORT_COLUMNS = (
+    models.Book.id_buku,
+    models.Book.judul,
+    models.Book.penulis,
+    models.Book.tahun,
+    models.Book.tersedia,
+    models.Book.jumlah_eksemplar,
+    models.Book.eksemplar_tersedia,
+    models.Book.id_kategori,
+    models.Book.pdf_url,
+)
+FIELDNAMES = [c.key for c in EXPORT_COLUMNS]
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+async def _partitions(strong: bool) -> AsyncIterator[list]:
+    # Session sendiri: dependency get_db sudah ditutup sebelum body streaming mulai dikirim.
+    # Export membaca seluruh tabel, jadi dijalankan di read replica kalau ada.
+    async with read_session(strong) as db:
+        result = await db.stream(
+            select(*EXPORT_COLUMNS)
+            .order_by(models.Book.id_buku)
+            .execution_options(yield_per=YIELD_PER)
+        )
+        async for rows in result.partitions():
+            yield rows
+
+
+async def _ndjson(strong: bool) -> AsyncIterator[bytes]:
+    async for rows in _partitions(strong):
+        yield "".join(
+            json.dumps(dict(zip(FIELDNAMES, row)), ensure_ascii=False, separators=(",", ":")) + "\n"
+            for row in rows
+        ).encode("utf-8")
+
+
+async def _csv(strong: bool) -> AsyncIterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(FIELDNAMES)
+    async for rows in _partitions(strong):
+        writer.writerows(rows)
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+async def _gzip(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    comp = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = format gzip
+    async for chunk in chunks:
+        out = comp.compress(chunk)
+        if out:
+            yield out
+    yield comp.flush()
+
+
+def export_stream(fmt: str, gzip: bool, strong: bool = False) -> AsyncIterator[bytes]:
+    chunks = _csv(strong) if fmt == "csv" else _ndjson(strong)
+    return _gzip(chunks) if gzip else chunks
@@ -1,73 +1,100 @@
 import os
-import uuid
-import shutil
+import asyncio
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.staticfiles import StaticFiles
+import aiofiles.os
+from fastapi import FastAPI, HTTPException, Request, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from .database import Base, engine, SessionLocal
-from .models import Book
+from . import storage, pdf_delivery, crud_categories, crud_loans, changes, pdf_ingest, metrics
+from .search import install_search
+from .database import engine, sync_schema, SessionLocal, read_router, get_db, ReadYourWritesMiddleware
 from .routes_books import router as books_router
-
-# =========================
-# DATABASE INIT
-# =========================
-Base.metadata.create_all(bind=engine)
+from .routes_files import router as files_router
+from .routes_categories import router as categories_router
+from .routes_loans import router as loans_router
+from .uploads import UPLOAD_DIR
 
 # =========================
 # APP INIT
 # =========================
 app = FastAPI(title="Project Service - Perpustakaan")
+# write yang berhasil -> cookie singkat; read berikutnya dari client itu ke primary (lihat database.py)
+app.add_middleware(ReadYourWritesMiddleware)
+# /metrics + latency per route, SQL & pool (lihat metrics.py); X-Request-ID dari gateway dipakai ulang
+metrics.install(app)
 
 app.include_router(books_router)
+app.include_router(files_router)
+app.include_router(categories_router)
+app.include_router(loans_router)
+
+@app.on_event("startup")
+async def init_db():
+    # skema & index pencarian dibuat lewat koneksi async (DDL-nya sendiri tetap sync via run_sync)
+    async with engine.begin() as conn:
+        await conn.run_sync(sync_schema)
+        await conn.run_sync(install_search)
+    async with SessionLocal() as db:
+        await crud_loans.sync_availability(db)
+        await crud_categories.backfill_stats(db)
+
+@app.on_event("startup")
+async def start_blob_gc():
+    # hapus blob PDF yang sudah tidak dipakai buku mana pun
+    if storage.BLOB_GC_INTERVAL_SECONDS > 0:
+        app.state.blob_gc_task = asyncio.create_task(storage.gc_loop(SessionLocal))
+
+@app.on_event("startup")
+async def start_pdf_ingest():
+    # metadata/teks/thumbnail PDF diproses di process pool, di luar worker request
+    if pdf_ingest.INGEST_ENABLED:
+        app.state.pdf_ingest_task = asyncio.create_task(pdf_ingest.ingestor.run(SessionLocal))
+
+@app.on_event("shutdown")
+async def stop_pdf_ingest():
+    await pdf_ingest.ingestor.dispose()
+
+@app.on_event("startup")
+async def start_read_replica_health():
+    # cek koneksi & lag replika secara berkala; replika bermasalah dilewati sampai pulih
+    if read_router.replicas:
+        app.state.read_health_task = asyncio.create_task(read_router.health_loop())
+
+@app.on_event("shutdown")
+async def stop_read_replicas():
+    await read_router.dispose()
 
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
-# =========================
-# UPLOAD CONFIG
-# =========================
-UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+@app.get("/health/read-replicas")
+def read_replica_stats():
+    return read_router.stats()
+
+@app.get("/health/changes")
+def change_feed_stats():
+    return changes.hub.stats()
 
-app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
+@app.get("/health/pdf-ingest")
+async def pdf_ingest_stats(db: AsyncSession = Depends(get_db)):
+    return await pdf_ingest.queue_stats(db)
 
 # =========================
-# UPLOAD PDF ENDPOINT
+# PDF LAMA (/uploads, sebelum content-addressed store)
 # =========================
-@app.post("/books/{id_buku}/pdf")
-async def upload_book_pdf(
-    id_buku: int,
-    file: UploadFile = File(...)
-):
-    # validasi ekstensi
-    if not file.filename or not file.filename.lower().endswith(".pdf"):
-        raise HTTPException(status_code=400, detail="File harus PDF (.pdf)")
-
-    db = SessionLocal()
-    try:
-        # cek buku
-        book = db.query(Book).filter(Book.id_buku == id_buku).first()
-        if not book:
-            raise HTTPException(status_code=404, detail="Buku tidak ditemukan")
-
-        # nama file unik
-        filename = f"{id_buku}_{uuid.uuid4().hex}.pdf"
-        filepath = os.path.join(UPLOAD_DIR, filename)
-
-        # simpan file
-        with open(filepath, "wb") as f:
-            shutil.copyfileobj(file.file, f)
-
-        # simpan URL ke DB
-        book.pdf_url = f"/uploads/{filename}"
-        db.commit()
-
-        return {
-            "message": "PDF berhasil diupload",
-            "pdf_url": book.pdf_url
-        }
-
-    finally:
-        db.close()
+@app.api_route("/uploads/{filename}", methods=["GET", "HEAD"])
+async def get_legacy_pdf(filename: str, request: Request):
+    path = os.path.join(UPLOAD_DIR, os.path.basename(filename))
+    if filename.startswith(".") or not await aiofiles.os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="File tidak ditemukan")
+
+    st = await aiofiles.os.stat(path)
+    return pdf_delivery.file_response(
+        request,
+        size=st.st_size,
+        etag=f'"{st.st_mtime_ns:x}-{st.st_size:x}"',
+        reader=lambda start, end: pdf_delivery.iter_file(path, start, end),
+        path=path,
+        last_modified=st.st_mtime,
+    )
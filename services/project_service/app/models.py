@@ -1,5 +1,7 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import (
+    Column, Integer, BigInteger, String, Text, LargeBinary, Boolean, DateTime, ForeignKey, Index, func, text,
+)
+from sqlalchemy.orm import relationship, deferred
 from .database import Base
 
 class Category(Base):
@@ -12,6 +14,13 @@ class Category(Base):
 
 class Book(Base):
     __tablename__ = "books"
+    __table_args__ = (
+        # index untuk keyset pagination (kolom sort + id_buku sebagai tiebreaker)
+        Index("ix_books_judul_id_buku", "judul", "id_buku"),
+        Index("ix_books_penulis_id_buku", "penulis", "id_buku"),
+        # filter ?kategori= (urut id_buku, juga untuk keyset)
+        Index("ix_books_id_kategori_id_buku", "id_kategori", "id_buku"),
+    )
 
     id_buku = Column(Integer, primary_key=True, autoincrement=False, index=True)
 
@@ -19,10 +28,103 @@ class Book(Base):
     penulis = Column(String(150), nullable=False)
     tahun = Column(Integer, nullable=True)
 
+    # tersedia = masih ada eksemplar yang bisa dipinjam (selalu eksemplar_tersedia > 0);
+    # diubah bersama eksemplar_tersedia oleh UPDATE kondisional di crud_loans
     tersedia = Column(Boolean, default=True, nullable=False)
+    jumlah_eksemplar = Column(Integer, nullable=False, default=1, server_default="1")
+    eksemplar_tersedia = Column(Integer, nullable=False, default=1, server_default="1")
 
     # PENTING
     pdf_url = Column(String, nullable=True)
+    # sha256 blob PDF di content-addressed store (NULL = belum ada / file lama di /uploads)
+    pdf_sha256 = Column(String(64), ForeignKey("pdf_blobs.sha256"), nullable=True, index=True)
 
     id_kategori = Column(Integer, ForeignKey("categories.id_kategori"), nullable=True)
-    category = relationship("Category", back_populates="books")
+    # selalu di-load dengan satu SELECT ... IN per hasil query (tanpa lazy load N+1, aman untuk async)
+    category = relationship("Category", back_populates="books", lazy="selectin")
+    # hasil ingest PDF (per isi file, bukan per buku): status job dan metadata, juga di-load selectin
+    pdf_job = relationship(
+        "PdfIngestJob", primaryjoin="PdfIngestJob.sha256 == foreign(Book.pdf_sha256)",
+        viewonly=True, lazy="selectin",
+    )
+    pdf_document = relationship(
+        "PdfDocument", primaryjoin="PdfDocument.sha256 == foreign(Book.pdf_sha256)",
+        viewonly=True, lazy="selectin",
+    )
+
+class Loan(Base):
+    __tablename__ = "loans"
+    __table_args__ = (
+        # satu user hanya boleh punya satu pinjaman aktif per judul (juga pengaman race double-submit)
+        Index(
+            "ux_loans_active_book_user", "id_buku", "user_sub", unique=True,
+            postgresql_where=text("returned_at IS NULL"), sqlite_where=text("returned_at IS NULL"),
+        ),
+        Index("ix_loans_user_sub_returned_at", "user_sub", "returned_at"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    # riwayat pinjaman tetap ada setelah bukunya dihapus: id_buku jadi NULL, judul disimpan di sini
+    id_buku = Column(Integer, ForeignKey("books.id_buku", ondelete="SET NULL"), nullable=True)
+    judul = Column(String(200), nullable=True)
+    user_sub = Column(String(150), nullable=False)  # claim "sub" dari JWT (username)
+    borrowed_at = Column(DateTime(timezone=True), nullable=False)
+    due_at = Column(DateTime(timezone=True), nullable=False)
+    returned_at = Column(DateTime(timezone=True), nullable=True)
+
+class CategoryStat(Base):
+    __tablename__ = "category_stats"
+
+    # counter per kategori, di-update di transaksi yang sama dengan perubahan buku.
+    # id_kategori 0 = buku tanpa kategori (karena itu tidak ada FK ke categories)
+    id_kategori = Column(Integer, primary_key=True, autoincrement=False)
+    jumlah_buku = Column(Integer, nullable=False, default=0)
+    jumlah_tersedia = Column(Integer, nullable=False, default=0)
+
+class PdfBlob(Base):
+    __tablename__ = "pdf_blobs"
+
+    # satu baris per isi file unik; dipakai bersama oleh semua buku dengan PDF yang sama
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+class PdfIngestJob(Base):
+    __tablename__ = "pdf_ingest_jobs"
+    __table_args__ = (
+        # worker mengambil job siap jalan paling lama: WHERE status=... ORDER BY run_after
+        Index("ix_pdf_ingest_jobs_status_run_after", "status", "run_after"),
+    )
+
+    # satu job per isi file (sha256): PDF yang sama di beberapa buku cukup diproses sekali.
+    # Tanpa FK ke pdf_blobs; baris turunan dihapus oleh GC blob.
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    sha256 = Column(String(64), unique=True, nullable=False)
+    status = Column(String(16), nullable=False, default="queued")  # queued | running | done | failed
+    attempts = Column(Integer, nullable=False, default=0)
+    run_after = Column(DateTime(timezone=True), nullable=False)
+    locked_until = Column(DateTime(timezone=True), nullable=True)  # lease worker; lewat = boleh diambil lagi
+    error = Column(String(500), nullable=True)
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+class PdfDocument(Base):
+    __tablename__ = "pdf_documents"
+
+    sha256 = Column(String(64), primary_key=True)
+    page_count = Column(Integer, nullable=False)
+    size = Column(BigInteger, nullable=False)
+    title = Column(String(300), nullable=True)   # dari metadata PDF
+    author = Column(String(300), nullable=True)
+    text_chars = Column(Integer, nullable=False, default=0)
+    thumbnail_url = Column(String, nullable=True)  # NULL = tidak ada thumbnail (renderer tidak terpasang / gagal)
+    # byte gambar hanya dibaca endpoint thumbnail, tidak ikut di-load bersama data buku
+    thumbnail = deferred(Column(LargeBinary, nullable=True))
+    ingested_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+class PdfPage(Base):
+    __tablename__ = "pdf_pages"
+
+    sha256 = Column(String(64), primary_key=True)
+    page_no = Column(Integer, primary_key=True, autoincrement=False)  # mulai dari 1
+    text = Column(Text, nullable=False, default="")
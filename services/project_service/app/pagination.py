@@ -0,0 +1,33 @@
+import json
+import base64
+from fastapi import HTTPException
+
+from . import models
+
+# Kolom yang boleh dipakai untuk urutan keyset; id_buku selalu jadi tiebreaker unik.
+# Tiap kolom punya index komposit (kolom, id_buku) di models.Book.
+SORT_KEYS = {
+    "id_buku": models.Book.id_buku,
+    "judul": models.Book.judul,
+    "penulis": models.Book.penulis,
+}
+MAX_PAGE_SIZE = 1000
+
+def encode_cursor(sort: str, order: str, row) -> str:
+    raw = json.dumps([sort, order, getattr(row, sort), row.id_buku], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, sort: str, order: str):
+    # return (nilai kolom sort, id_buku) dari baris terakhir halaman sebelumnya
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        c_sort, c_order, value, last_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor tidak valid.")
+
+    if c_sort != sort or c_order != order:
+        raise HTTPException(status_code=400, detail="Cursor tidak cocok dengan sort/order.")
+    # nilai hasil edit tangan dengan tipe lain akan gagal di query (500 di Postgres), bukan 400
+    if type(last_id) is not int or type(value) is not SORT_KEYS[sort].type.python_type:
+        raise HTTPException(status_code=400, detail="Cursor tidak valid.")
+    return value, last_id
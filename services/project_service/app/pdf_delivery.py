@@ -0,0 +1,222 @@
+import os
+import uuid
+from email.utils import formatdate
+from typing import AsyncIterator, Callable
+
+import anyio
+from fastapi import Request
+from fastapi.responses import Response
+
+# =========================
+# DELIVERY CONFIG
+# =========================
+MAX_RANGES = int(os.getenv("PDF_MAX_RANGES", "32"))  # lebih dari ini: Range diabaikan, kirim file utuh
+CHUNK_SIZE = 64 * 1024
+
+Reader = Callable[[int, int], AsyncIterator[bytes]]
+
+
+# =========================
+# RANGE & CONDITIONAL HEADERS
+# =========================
+def parse_range(header: str | None, size: int) -> list[tuple[int, int]] | None:
+    # None = abaikan Range (kirim 200 utuh); [] = tidak ada range yang bisa dipenuhi (416)
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        first, sep, last = part.partition("-")
+        if not sep:
+            return None
+        first, last = first.strip(), last.strip()
+        if not first:
+            # suffix range: "-500" = 500 byte terakhir
+            if not last.isdigit():
+                return None
+            n = int(last)
+            if n > 0 and size > 0:
+                ranges.append((max(0, size - n), size - 1))
+            continue
+        if not first.isdigit() or (last and not last.isdigit()):
+            return None
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start < size:
+            end = int(last) if last else size - 1
+            ranges.append((start, min(end, size - 1)))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    # gabungkan range yang tumpang tindih / bersebelahan
+    merged: list[tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _etag_in(header: str, etag: str) -> bool:
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+# =========================
+# RESPONSE (RANGE / MULTIPART / SENDFILE)
+# =========================
+class RangeFileResponse(Response):
+    """Kirim seluruh file atau sebagian (Range) dengan zero-copy kalau server ASGI mendukung.
+
+    - ``http.response.pathsend``: file utuh dikirim server langsung dari path.
+    - ``http.response.zerocopysend``: potongan file dikirim dari file descriptor (sendfile).
+    - selain itu: dibaca per chunk lewat ``reader``.
+    """
+
+    media_type = "application/pdf"
+
+    def __init__(
+        self,
+        *,
+        size: int,
+        headers: dict,
+        reader: Reader,
+        path: str | None = None,
+        ranges: list[tuple[int, int]] | None = None,
+        status_code: int = 200,
+    ):
+        self.size = size
+        self.reader = reader
+        self.path = path
+        self.status_code = status_code
+        self.background = None
+
+        headers = dict(headers)
+        self.parts: list[tuple[bytes, int, int]] = []
+        self.epilogue = b""
+
+        if status_code == 206 and ranges and len(ranges) == 1:
+            start, end = ranges[0]
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            self.parts = [(b"", start, end)]
+            length = end - start + 1
+        elif status_code == 206 and ranges:
+            boundary = uuid.uuid4().hex
+            headers["Content-Type"] = f"multipart/byteranges; boundary={boundary}"
+            length = 0
+            for i, (start, end) in enumerate(ranges):
+                prefix = (
+                    ("\r\n" if i else "")
+                    + f"--{boundary}\r\n"
+                    + f"Content-Type: {self.media_type}\r\n"
+                    + f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+                ).encode("latin-1")
+                self.parts.append((prefix, start, end))
+                length += len(prefix) + end - start + 1
+            self.epilogue = f"\r\n--{boundary}--\r\n".encode("latin-1")
+            length += len(self.epilogue)
+        elif status_code == 200:
+            self.parts = [(b"", 0, size - 1)] if size else []
+            length = size
+        else:
+            length = 0
+
+        headers["Content-Length"] = str(length)
+        headers.setdefault("Content-Type", self.media_type)
+        self.init_headers(headers)
+
+    async def __call__(self, scope, receive, send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+
+        if scope.get("method") == "HEAD" or not self.parts:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        ext = scope.get("extensions") or {}
+        whole = self.status_code == 200
+
+        if self.path and whole and "http.response.pathsend" in ext:
+            await send({"type": "http.response.pathsend", "path": self.path})
+            return
+
+        if self.path and "http.response.zerocopysend" in ext:
+            fd = await anyio.to_thread.run_sync(os.open, self.path, os.O_RDONLY)
+            try:
+                for prefix, start, end in self.parts:
+                    if prefix:
+                        await send({"type": "http.response.body", "body": prefix, "more_body": True})
+                    await send({
+                        "type": "http.response.zerocopysend",
+                        "file": fd,
+                        "offset": start,
+                        "count": end - start + 1,
+                        "more_body": True,
+                    })
+                await send({"type": "http.response.body", "body": self.epilogue})
+            finally:
+                os.close(fd)
+            return
+
+        for prefix, start, end in self.parts:
+            if prefix:
+                await send({"type": "http.response.body", "body": prefix, "more_body": True})
+            async for chunk in self.reader(start, end):
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": self.epilogue})
+
+
+def file_response(
+    request: Request,
+    *,
+    size: int,
+    etag: str,
+    reader: Reader,
+    path: str | None = None,
+    cache_control: str | None = None,
+    last_modified: float | None = None,
+) -> Response:
+    headers = {"ETag": etag, "Accept-Ranges": "bytes"}
+    if cache_control:
+        headers["Cache-Control"] = cache_control
+    if last_modified is not None:
+        headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+
+    # If-None-Match: client sudah punya versi yang sama
+    inm = request.headers.get("if-none-match")
+    if inm and _etag_in(inm, etag):
+        return Response(status_code=304, headers=headers)
+
+    # If-Range: Range hanya dipakai kalau ETag masih sama (perbandingan strong)
+    ranges = parse_range(request.headers.get("range"), size)
+    if_range = request.headers.get("if-range")
+    if ranges is not None and if_range is not None and if_range.strip() != etag:
+        ranges = None
+
+    if ranges is None:
+        return RangeFileResponse(size=size, headers=headers, reader=reader, path=path)
+
+    if not ranges:
+        headers["Content-Range"] = f"bytes */{size}"
+        return Response(status_code=416, headers=headers)
+
+    return RangeFileResponse(size=size, headers=headers, reader=reader, path=path, ranges=ranges, status_code=206)
+
+
+async def iter_file(path: str, start: int, end: int) -> AsyncIterator[bytes]:
+    # fallback tanpa sendfile untuk file lokal
+    remaining = end - start + 1
+    async with await anyio.open_file(path, "rb") as f:
+        await f.seek(start)
+        while remaining > 0:
+            chunk = await f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
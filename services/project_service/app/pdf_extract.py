@@ -0,0 +1,60 @@
+# Dijalankan di process pool worker ingest (lihat pdf_ingest.py). Sengaja tidak mengimpor
+# modul app lain: worker di-spawn dan hanya perlu modul ini untuk unpickle fungsi extract.
+
+def extract(path: str, thumbnail_width: int, max_text_pages: int) -> dict:
+    """Metadata, teks per halaman dan thumbnail halaman pertama dari file PDF di path."""
+    # pypdf wajib untuk ingest; pymupdf opsional, hanya untuk thumbnail
+    try:
+        from pypdf import PdfReader
+    except ImportError as e:
+        raise RuntimeError("ingest PDF butuh paket pypdf (pip install pypdf)") from e
+
+    reader = PdfReader(path)
+    if reader.is_encrypted:
+        # banyak PDF "terenkripsi" hanya dengan password kosong (batasan cetak/copy)
+        reader.decrypt("")
+
+    pages = []
+    for i, page in enumerate(reader.pages):
+        if i >= max_text_pages:
+            break
+        try:
+            text = page.extract_text() or ""
+        except Exception:
+            text = ""  # satu halaman rusak tidak menggagalkan seluruh dokumen
+        # NUL tidak boleh ada di kolom text PostgreSQL
+        pages.append(text.replace("\x00", ""))
+
+    meta = reader.metadata
+    return {
+        "page_count": len(reader.pages),
+        "title": _meta_str(meta.title if meta else None),
+        "author": _meta_str(meta.author if meta else None),
+        "pages": pages,
+        "thumbnail": _thumbnail(path, thumbnail_width) if thumbnail_width > 0 else None,
+    }
+
+
+def _meta_str(value) -> str | None:
+    if not value:
+        return None
+    return str(value).replace("\x00", "").strip()[:300] or None
+
+
+def _thumbnail(path: str, width: int) -> bytes | None:
+    # JPEG halaman pertama selebar width px; None kalau pymupdf tidak terpasang atau render gagal
+    try:
+        import pymupdf
+    except ImportError:
+        return None
+
+    try:
+        with pymupdf.open(path) as doc:
+            if doc.page_count == 0:
+                return None
+            page = doc[0]
+            zoom = width / page.rect.width
+            pix = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), alpha=False)
+            return pix.tobytes("jpg", jpg_quality=80)
+    except Exception:
+        return None
@@ -0,0 +1,353 @@
+import os
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+
+import aiofiles
+import aiofiles.os
+from sqlalchemy import select, update, delete, func, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects import postgresql, sqlite
+
+from . import models, storage, changes, pdf_extract
+from .uploads import UPLOAD_TMP_DIR
+
+# =========================
+# PDF INGEST CONFIG
+# =========================
+INGEST_ENABLED = os.getenv("PDF_INGEST", "1") == "1"
+# proses worker per instance project_service (per worker uvicorn/gunicorn)
+INGEST_WORKERS = int(os.getenv("PDF_INGEST_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+INGEST_POLL_SECONDS = float(os.getenv("PDF_INGEST_POLL_SECONDS", "5"))  # cek job dari instance lain
+INGEST_LEASE_SECONDS = int(os.getenv("PDF_INGEST_LEASE_SECONDS", "600"))  # job "running" tanpa kabar = diambil ulang
+INGEST_MAX_ATTEMPTS = int(os.getenv("PDF_INGEST_MAX_ATTEMPTS", "3"))
+INGEST_MAX_TASKS_PER_CHILD = int(os.getenv("PDF_INGEST_MAX_TASKS_PER_CHILD", "50"))  # batasi bocor memori parser
+INGEST_MAX_TEXT_PAGES = int(os.getenv("PDF_INGEST_MAX_TEXT_PAGES", "2000"))
+THUMBNAIL_WIDTH = int(os.getenv("PDF_THUMBNAIL_WIDTH", "240"))  # 0 = tanpa thumbnail
+
+PAGE_INSERT_BATCH = 500
+
+Job = models.PdfIngestJob
+
+logger = logging.getLogger(__name__)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def thumbnail_url(digest: str) -> str:
+    return f"/files/{digest}/thumbnail.jpg"
+
+
+# =========================
+# ANTREAN JOB (tabel pdf_ingest_jobs)
+# =========================
+async def enqueue(db: AsyncSession, digest: str, force: bool = False) -> None:
+    # Tidak commit; ikut transaksi pemanggil. Isi yang sudah pernah diproses tidak diproses
+    # ulang kecuali force (reprocess).
+    now = _now()
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(Job).values(sha256=digest, status="queued", attempts=0, run_after=now, updated_at=now)
+    if force:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Job.sha256],
+            set_={"status": "queued", "attempts": 0, "run_after": now, "locked_until": None, "error": None, "updated_at": now},
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=[Job.sha256])
+    await db.execute(stmt)
+
+
+async def enqueue_missing(db: AsyncSession) -> int:
+    # PDF yang diupload sebelum ada pipeline ingest: dibuatkan job sekali saat startup
+    digests = (await db.execute(
+        select(models.Book.pdf_sha256)
+        .where(
+            models.Book.pdf_sha256.is_not(None),
+            ~select(Job.id).where(Job.sha256 == models.Book.pdf_sha256).exists(),
+        )
+        .distinct()
+    )).scalars().all()
+    for digest in digests:
+        await enqueue(db, digest)
+    if digests:
+        await db.commit()
+    return len(digests)
+
+
+async def _claim(db: AsyncSession) -> tuple[int, str, int] | None:
+    # satu UPDATE: job siap jalan (atau lease-nya habis) diambil dan di-lease; SKIP LOCKED di
+    # postgres supaya beberapa instance tidak saling menunggu job yang sama
+    now = _now()
+    candidate = (
+        select(Job.id)
+        .where(or_(
+            and_(Job.status == "queued", Job.run_after <= now),
+            and_(Job.status == "running", Job.locked_until < now),
+        ))
+        .order_by(Job.run_after, Job.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    row = (await db.execute(
+        update(Job)
+        .where(Job.id == candidate)
+        .values(
+            status="running",
+            attempts=Job.attempts + 1,
+            locked_until=now + timedelta(seconds=INGEST_LEASE_SECONDS),
+            updated_at=now,
+        )
+        .returning(Job.id, Job.sha256, Job.attempts)
+        .execution_options(synchronize_session=False)
+    )).first()
+    if row is None:
+        # poll kosong (sering, tiap INGEST_POLL_SECONDS): tutup transaksi tanpa commit
+        await db.rollback()
+        return None
+    await db.commit()
+    return tuple(row)
+
+
+async def _finish(db: AsyncSession, job_id: int, attempt: int, **values) -> None:
+    # attempt sebagai fencing token: kalau job di-reprocess / diambil ulang selagi jalan,
+    # hasil ini tidak menimpa statusnya
+    await db.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.status == "running", Job.attempts == attempt)
+        .values(locked_until=None, updated_at=_now(), **values)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def _fail(db: AsyncSession, job_id: int, attempt: int, error: str, permanent: bool = False) -> None:
+    if permanent or attempt >= INGEST_MAX_ATTEMPTS:
+        await _finish(db, job_id, attempt, status="failed", error=error[:500])
+    else:
+        retry_in = 30 * 2 ** (attempt - 1)
+        await _finish(
+            db, job_id, attempt,
+            status="queued", error=error[:500], run_after=_now() + timedelta(seconds=retry_in),
+        )
+    await db.commit()
+
+
+# =========================
+# SIMPAN HASIL (idempotent: hasil lama untuk isi yang sama diganti)
+# =========================
+async def _save(db: AsyncSession, digest: str, size: int, result: dict) -> None:
+    pages = result["pages"]
+    await db.execute(delete(models.PdfPage).where(models.PdfPage.sha256 == digest))
+    await db.execute(delete(models.PdfDocument).where(models.PdfDocument.sha256 == digest))
+
+    for start in range(0, len(pages), PAGE_INSERT_BATCH):
+        await db.execute(
+            models.PdfPage.__table__.insert(),
+            [
+                {"sha256": digest, "page_no": start + i + 1, "text": text}
+                for i, text in enumerate(pages[start:start + PAGE_INSERT_BATCH])
+            ],
+        )
+
+    thumbnail = result["thumbnail"]
+    await db.execute(models.PdfDocument.__table__.insert().values(
+        sha256=digest,
+        page_count=result["page_count"],
+        size=size,
+        title=result["title"],
+        author=result["author"],
+        text_chars=sum(len(t) for t in pages),
+        thumbnail_url=thumbnail_url(digest) if thumbnail else None,
+        thumbnail=thumbnail,
+        ingested_at=_now(),
+    ))
+
+
+async def _publish_books(db: AsyncSession, digest: str) -> None:
+    # jumlah halaman / thumbnail buku-buku dengan PDF ini berubah
+    books = (await db.execute(select(models.Book).where(models.Book.pdf_sha256 == digest))).scalars().all()
+    for book in books:
+        changes.book_saved("update", book)
+
+
+# =========================
+# FILE LOKAL UNTUK WORKER
+# =========================
+async def _local_copy(digest: str) -> tuple[str, bool] | None:
+    # (path, temp?) ; None = blob sudah tidak ada
+    path = storage.backend.local_path(digest)
+    if path is not None:
+        return (path, False) if await aiofiles.os.path.exists(path) else None
+
+    size = await storage.backend.size(digest)
+    if size is None:
+        return None
+    tmp = os.path.join(UPLOAD_TMP_DIR, f"ingest-{digest}-{os.getpid()}.pdf")
+    async with aiofiles.open(tmp, "wb") as f:
+        async for chunk in storage.backend.iter_range(digest, 0, size - 1):
+            await f.write(chunk)
+    return tmp, True
+
+
+# =========================
+# DISPATCHER + PROCESS POOL
+# =========================
+class PdfIngestor:
+    """Mengambil job dari database dan menjalankan parsing PDF di process pool.
+
+    Parsing (CPU) tidak pernah jalan di event loop worker request; dispatcher hanya
+    meng-claim job, menunggu hasil dari pool, lalu menulisnya ke database. Upload
+    membangunkan dispatcher lewat ``wake()``; job dari instance lain ketahuan lewat
+    polling tiap ``INGEST_POLL_SECONDS``.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._pool: ProcessPoolExecutor | None = None
+        self._wake = asyncio.Event()
+        self._running: set[asyncio.Task] = set()
+        self.done = 0
+        self.failed = 0
+        self.pool_restarts = 0
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # spawn, bukan fork: proses app sudah punya thread (aiosqlite, to_thread)
+        return ProcessPoolExecutor(
+            self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            max_tasks_per_child=INGEST_MAX_TASKS_PER_CHILD or None,
+        )
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    async def run(self, session_factory) -> None:
+        # dijalankan sebagai background task dari startup app
+        self._pool = self._new_pool()
+        async with session_factory() as db:
+            queued = await enqueue_missing(db)
+        if queued:
+            logger.info("pdf ingest: %s PDF lama masuk antrean", queued)
+
+        while True:
+            self._wake.clear()
+            try:
+                while len(self._running) < self.workers:
+                    async with session_factory() as db:
+                        job = await _claim(db)
+                    if job is None:
+                        break
+                    task = asyncio.create_task(self._process(session_factory, *job))
+                    self._running.add(task)
+                    task.add_done_callback(self._task_done)
+            except Exception:
+                logger.exception("pdf ingest: gagal mengambil job")
+            try:
+                await asyncio.wait_for(self._wake.wait(), INGEST_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        self._running.discard(task)
+        self.wake()  # slot kosong: ambil job berikutnya
+
+    async def _process(self, session_factory, job_id: int, digest: str, attempt: int) -> None:
+        local = None
+        try:
+            local = await _local_copy(digest)
+            async with session_factory() as db:
+                if local is None:
+                    await _fail(db, job_id, attempt, "blob PDF tidak ditemukan", permanent=True)
+                    self.failed += 1
+                    return
+
+                path, _ = local
+                size = (await aiofiles.os.stat(path)).st_size
+                loop = asyncio.get_running_loop()
+                try:
+                    result = await loop.run_in_executor(
+                        self._pool, pdf_extract.extract, path, THUMBNAIL_WIDTH, INGEST_MAX_TEXT_PAGES
+                    )
+                except BrokenProcessPool:
+                    # worker mati mendadak (mis. crash di parser): pool diganti, job dicoba lagi nanti
+                    self._restart_pool()
+                    await _fail(db, job_id, attempt, "worker ingest berhenti mendadak")
+                    self.failed += 1
+                    return
+                except Exception as e:
+                    await _fail(db, job_id, attempt, f"{e.__class__.__name__}: {e}")
+                    self.failed += 1
+                    return
+
+                await _save(db, digest, size, result)
+                await _finish(db, job_id, attempt, status="done", error=None)
+                await db.commit()
+                self.done += 1
+                await _publish_books(db, digest)
+        except Exception:
+            logger.exception("pdf ingest: job %s gagal", job_id)
+        finally:
+            if local is not None and local[1]:
+                try:
+                    await aiofiles.os.remove(local[0])
+                except FileNotFoundError:
+                    pass
+
+    def _restart_pool(self) -> None:
+        old, self._pool = self._pool, self._new_pool()
+        self.pool_restarts += 1
+        if old is not None:
+            old.shutdown(wait=False, cancel_futures=True)
+
+    async def dispose(self) -> None:
+        for task in list(self._running):
+            task.cancel()
+        if self._pool is not None:
+            # job yang belum mulai dibatalkan; yang sedang di-parse ditunggu (lease-nya tetap aman)
+            await asyncio.to_thread(self._pool.shutdown, wait=True, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "running": len(self._running),
+            "done": self.done,
+            "failed": self.failed,
+            "pool_restarts": self.pool_restarts,
+        }
+
+
+ingestor = PdfIngestor(INGEST_WORKERS)
+
+
+async def queue_stats(db: AsyncSession) -> dict:
+    rows = (await db.execute(select(Job.status, func.count()).group_by(Job.status))).all()
+    return {"enabled": INGEST_ENABLED, "jobs": dict(rows), **ingestor.stats()}
+
+
+# =========================
+# DIPANGGIL ROUTE
+# =========================
+async def reprocess(db: AsyncSession, book: models.Book) -> None:
+    await enqueue(db, book.pdf_sha256, force=True)
+    await db.commit()
+    ingestor.wake()
+
+
+async def list_pages(db: AsyncSession, digest: str, dari: int, limit: int) -> list[models.PdfPage]:
+    return (await db.execute(
+        select(models.PdfPage)
+        .where(models.PdfPage.sha256 == digest, models.PdfPage.page_no >= dari)
+        .order_by(models.PdfPage.page_no)
+        .limit(max(1, min(limit, 100)))
+    )).scalars().all()
+
+
+async def get_thumbnail(db: AsyncSession, digest: str) -> bytes | None:
+    return (await db.execute(
+        select(models.PdfDocument.thumbnail).where(models.PdfDocument.sha256 == digest)
+    )).scalar_one_or_none()
@@ -0,0 +1,80 @@
+import os
+import zlib
+
+import orjson
+from fastapi import Request
+from fastapi.responses import Response
+
+# =========================
+# JSON RESPONSE CONFIG (endpoint baca buku)
+# =========================
+# body lebih kecil dari ini dikirim apa adanya: header + CPU kompresi tidak sebanding
+COMPRESS_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", "4"))  # 4: rasio di atas gzip-6, CPU sekelas
+
+# brotli opsional: tanpa paket ini hanya gzip yang ditawarkan
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def _accepted(accept_encoding: str) -> dict[str, float]:
+    # "gzip;q=0.8, br" -> {"gzip": 0.8, "br": 1.0}
+    codings = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.partition(";")
+        name = name.strip()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        codings[name] = q
+    return codings
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    codings = _accepted(accept_encoding)
+    wildcard = codings.get("*", 0.0)
+    br = codings.get("br", wildcard) if brotli is not None else 0.0
+    gzip = codings.get("gzip", wildcard)
+    if br > 0 and br >= gzip:
+        return "br"
+    if gzip > 0:
+        return "gzip"
+    return None
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    # untuk stream yang hanya bisa gzip (export): q=0 dan nama lain (x-gzip) tidak dihitung
+    codings = _accepted(accept_encoding)
+    return codings.get("gzip", codings.get("*", 0.0)) > 0
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    comp = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits 31 = format gzip
+    return comp.compress(body) + comp.flush()
+
+
+def json_response(request: Request, data, status_code: int = 200) -> Response:
+    """Body JSON via orjson, dikompres gzip/br sesuai Accept-Encoding kalau cukup besar.
+
+    ``data`` harus sudah berbentuk dict/list siap kirim (mis. ``crud_books.book_row``):
+    tidak ada validasi response_model kedua.
+    """
+    body = orjson.dumps(data)
+    headers = {"Vary": "Accept-Encoding"}
+    if len(body) >= COMPRESS_MIN_BYTES:
+        encoding = choose_encoding(request.headers.get("accept-encoding", ""))
+        if encoding:
+            body = compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+    return Response(body, status_code=status_code, media_type="application/json", headers=headers)
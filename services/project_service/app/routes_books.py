@@ -1,17 +1,15 @@
-import os, uuid, shutil
-from fastapi import APIRouter, Depends, status, UploadFile, File, HTTPException
-from sqlalchemy.orm import Session
-
-from .database import get_db
-from . import schemas, crud_books
+from typing import Literal, Optional, Union
+from fastapi import APIRouter, Depends, status, Request, HTTPException, Query, Header
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import get_db, get_read_db, wants_strong
+from . import schemas, crud_books, uploads, storage, search, bulk_import, export, changes, pdf_ingest
+from .responses import json_response, accepts_gzip
 from .security import require_admin, get_current_user
-from .models import Book
 
 router = APIRouter(prefix="/books", tags=["Books"])
 
-UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-
 # =========================
 # ADMIN ONLY (CREATE)
 # =========================
@@ -21,19 +19,111 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
     status_code=status.HTTP_201_CREATED,
     dependencies=[Depends(require_admin)]
 )
-def create_book(payload: schemas.BookCreate, db: Session = Depends(get_db)):
-    return crud_books.create_book(db, payload)
+async def create_book(payload: schemas.BookCreate, db: AsyncSession = Depends(get_db)):
+    return await crud_books.create_book(db, payload)
+
+# =========================
+# ADMIN ONLY (BULK IMPORT)
+# =========================
+@router.post(
+    "/bulk",
+    response_model=schemas.BulkImportResult,
+    dependencies=[Depends(require_admin)],
+    openapi_extra=bulk_import.BULK_IMPORT_OPENAPI,
+)
+async def import_books_bulk(
+    request: Request,
+    mode: Literal["skip", "upsert"] = "skip",
+    db: AsyncSession = Depends(get_db),
+):
+    # body NDJSON/CSV dibaca per baris dan di-insert per batch (multi-row INSERT ... ON CONFLICT)
+    return await bulk_import.import_books(db, request, mode)
 
 # =========================
 # USER/ADMIN (READ ALL)
 # =========================
 @router.get(
     "",
+    response_model=Union[list[schemas.BookOut], schemas.BookPage],
+    dependencies=[Depends(get_current_user)]
+)
+async def list_books(
+    request: Request,
+    skip: int = 0,
+    limit: int = 20,
+    cursor: Optional[str] = Query(
+        default=None,
+        description="Mode keyset: kirim cursor kosong (?cursor=) untuk halaman pertama, "
+                    "lalu next_cursor dari respons sebelumnya. Tanpa parameter ini = mode lama skip/limit.",
+    ),
+    sort: Literal["id_buku", "judul", "penulis"] = "id_buku",
+    order: Literal["asc", "desc"] = "asc",
+    kategori: Optional[int] = Query(default=None, description="Hanya buku dengan id_kategori ini"),
+    db: AsyncSession = Depends(get_read_db),
+):
+    # baris sudah berbentuk BookOut: dikirim langsung lewat orjson, response_model hanya untuk dokumentasi
+    if cursor is None:
+        return json_response(request, await crud_books.list_books(db, skip, limit, kategori))
+    return json_response(request, await crud_books.list_books_page(db, cursor, limit, sort, order, kategori))
+
+# =========================
+# USER/ADMIN (SEARCH)
+# =========================
+# harus didaftarkan sebelum "/{id_buku}" supaya "search" tidak dianggap id
+@router.get(
+    "/search",
     response_model=list[schemas.BookOut],
     dependencies=[Depends(get_current_user)]
 )
-def list_books(skip: int = 0, limit: int = 20, db: Session = Depends(get_db)):
-    return crud_books.list_books(db, skip, limit)
+async def search_books(
+    request: Request,
+    q: str = Query(min_length=1, max_length=200),
+    tahun: Optional[int] = None,
+    tersedia: Optional[bool] = None,
+    id_kategori: Optional[int] = None,
+    limit: int = 20,
+    db: AsyncSession = Depends(get_read_db),
+):
+    books = await search.search_books(db, q, tahun, tersedia, id_kategori, limit)
+    return json_response(request, [crud_books.book_dict(b) for b in books])
+
+# =========================
+# USER/ADMIN (EXPORT)
+# =========================
+@router.get(
+    "/export",
+    dependencies=[Depends(get_current_user)]
+)
+async def export_books(request: Request, format: Literal["ndjson", "csv"] = "ndjson"):
+    # streaming dari server-side cursor; memori konstan berapa pun jumlah bukunya
+    accept_encoding = request.headers.get("accept-encoding")
+    gzip = accept_encoding is not None and accepts_gzip(accept_encoding)
+    headers = {"Content-Disposition": f'attachment; filename="books.{format}"'}
+    if accept_encoding is not None:
+        headers["Vary"] = "Accept-Encoding"
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        export.export_stream(format, gzip, strong=wants_strong(request)),
+        media_type=export.MEDIA_TYPES[format],
+        headers=headers,
+    )
+
+# =========================
+# USER/ADMIN (CHANGE FEED, SSE)
+# =========================
+@router.get(
+    "/changes",
+    dependencies=[Depends(get_current_user)]
+)
+async def book_changes(last_event_id: Optional[str] = Header(default=None)):
+    # create/update/delete/upload PDF dikirim begitu di-commit; reconnect dengan Last-Event-ID
+    # mendapat replay event yang terlewat (atau event "reset" kalau sudah keluar dari buffer)
+    return StreamingResponse(
+        changes.hub.stream(last_event_id),
+        media_type="text/event-stream",
+        headers=changes.SSE_HEADERS,
+    )
 
 # =========================
 # USER/ADMIN (READ ONE)
@@ -43,8 +133,8 @@ def list_books(skip: int = 0, limit: int = 20, db: Session = Depends(get_db)):
     response_model=schemas.BookOut,
     dependencies=[Depends(get_current_user)]
 )
-def get_book(id_buku: int, db: Session = Depends(get_db)):
-    return crud_books.get_book(db, id_buku)
+async def get_book(id_buku: int, request: Request, db: AsyncSession = Depends(get_read_db)):
+    return json_response(request, await crud_books.get_book_row(db, id_buku))
 
 # =========================
 # ADMIN ONLY (UPDATE)
@@ -54,8 +144,8 @@ def get_book(id_buku: int, db: Session = Depends(get_db)):
     response_model=schemas.BookOut,
     dependencies=[Depends(require_admin)]
 )
-def update_book(id_buku: int, payload: schemas.BookUpdate, db: Session = Depends(get_db)):
-    return crud_books.update_book(db, id_buku, payload)
+async def update_book(id_buku: int, payload: schemas.BookUpdate, db: AsyncSession = Depends(get_db)):
+    return await crud_books.update_book(db, id_buku, payload)
 
 # =========================
 # ADMIN ONLY (DELETE)
@@ -65,8 +155,8 @@ def update_book(id_buku: int, payload: schemas.BookUpdate, db: Session = Depends
     status_code=status.HTTP_204_NO_CONTENT,
     dependencies=[Depends(require_admin)]
 )
-def delete_book(id_buku: int, db: Session = Depends(get_db)):
-    crud_books.delete_book(db, id_buku)
+async def delete_book(id_buku: int, db: AsyncSession = Depends(get_db)):
+    await crud_books.delete_book(db, id_buku)
     return None
 
 # =========================
@@ -74,42 +164,85 @@ def delete_book(id_buku: int, db: Session = Depends(get_db)):
 # =========================
 @router.post(
     "/{id_buku}/pdf",
-    dependencies=[Depends(require_admin)]
+    dependencies=[Depends(require_admin)],
+    openapi_extra=uploads.PDF_UPLOAD_OPENAPI,
 )
 async def upload_book_pdf(
     id_buku: int,
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    request: Request,
+    db: AsyncSession = Depends(get_db)
 ):
-    if file.content_type != "application/pdf":
-        raise HTTPException(status_code=400, detail="File harus PDF")
-
-    book = db.query(Book).filter(Book.id_buku == id_buku).first()
-    if not book:
-        raise HTTPException(status_code=404, detail="Buku tidak ditemukan")
-
-    filename = f"{id_buku}_{uuid.uuid4().hex}.pdf"
-    filepath = os.path.join(UPLOAD_DIR, filename)
-
-    # 🔥 cara simpan paling aman
-    content = await file.read()
-    if not content:
-        raise HTTPException(status_code=400, detail="File kosong / gagal terbaca")
-
-    with open(filepath, "wb") as f:
-        f.write(content)
-
-    # cek ukuran
-    size = os.path.getsize(filepath)
-    if size <= 0:
-        raise HTTPException(status_code=500, detail="File tersimpan tapi ukuran 0 byte")
-
-    book.pdf_url = f"/uploads/{filename}"
-    db.commit()
-    db.refresh(book)
-
+    # cek buku dulu supaya tidak menulis file untuk buku yang tidak ada
+    await crud_books.get_book(db, id_buku)
+    # transaksi cek ditutup sekarang: koneksi pool tidak tertahan selama body di-stream (bisa lama)
+    await db.rollback()
+
+    # body di-stream langsung ke temp file (async I/O), ukuran & sha256 dihitung sambil jalan
+    upload = await uploads.receive_pdf(request)
+    digest = upload.sha256
+
+    # 1) pin blob, 2) simpan ke backend kalau isinya belum pernah ada (dedup), 3) pasang ke buku
+    await storage.pin_blob(db, digest, upload.size)
+    try:
+        if await storage.backend.exists(digest):
+            await uploads.discard_upload(upload)
+        else:
+            await storage.backend.put(digest, upload.tmp_path)
+    except Exception:
+        await uploads.discard_upload(upload)
+        await storage.unpin_blob(db, digest)
+        raise HTTPException(status_code=500, detail="Gagal menyimpan file PDF")
+
+    try:
+        book = await crud_books.attach_pdf(db, id_buku, digest)
+    except HTTPException:
+        # buku terhapus di tengah upload: lepas lagi pin-nya
+        await storage.unpin_blob(db, digest)
+        raise
+
+    # langsung dibalas; metadata, teks & thumbnail menyusul dari pipeline ingest (lihat pdf_status)
     return {
         "message": "PDF berhasil diupload",
         "pdf_url": book.pdf_url,
-        "bytes": size
+        "bytes": upload.size,
+        "sha256": digest,
+        "pdf_status": book.pdf_job.status if book.pdf_job else None,
     }
+
+async def _book_with_blob(db: AsyncSession, id_buku: int):
+    book = await crud_books.get_book(db, id_buku)
+    if not book.pdf_sha256:
+        # PDF format lama (/uploads) tidak ikut pipeline ingest
+        raise HTTPException(status_code=404, detail="Buku ini belum punya PDF.")
+    return book
+
+# =========================
+# ADMIN ONLY (PROSES ULANG PDF)
+# =========================
+@router.post(
+    "/{id_buku}/pdf/reprocess",
+    status_code=status.HTTP_202_ACCEPTED,
+    dependencies=[Depends(require_admin)]
+)
+async def reprocess_book_pdf(id_buku: int, db: AsyncSession = Depends(get_db)):
+    # aman dipanggil berulang: hasil lama untuk isi file yang sama diganti
+    book = await _book_with_blob(db, id_buku)
+    await pdf_ingest.reprocess(db, book)
+    return {"sha256": book.pdf_sha256, "pdf_status": "queued"}
+
+# =========================
+# USER/ADMIN (TEKS PER HALAMAN)
+# =========================
+@router.get(
+    "/{id_buku}/pages",
+    response_model=list[schemas.PdfPageOut],
+    dependencies=[Depends(get_current_user)]
+)
+async def book_pages(
+    id_buku: int,
+    dari: int = Query(default=1, ge=1, description="Nomor halaman pertama"),
+    limit: int = 20,
+    db: AsyncSession = Depends(get_read_db),
+):
+    book = await _book_with_blob(db, id_buku)
+    return await pdf_ingest.list_pages(db, book.pdf_sha256, dari, limit)
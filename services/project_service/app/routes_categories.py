@@ -0,0 +1,83 @@
+from fastapi import APIRouter, Depends, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import get_db, get_read_db
+from . import schemas, crud_categories
+from .security import require_admin, get_current_user
+
+router = APIRouter(prefix="/categories", tags=["Categories"])
+
+# =========================
+# USER/ADMIN (READ ALL)
+# =========================
+@router.get(
+    "",
+    response_model=list[schemas.CategoryOut],
+    dependencies=[Depends(get_current_user)]
+)
+async def list_categories(db: AsyncSession = Depends(get_read_db)):
+    return await crud_categories.list_categories(db)
+
+# =========================
+# USER/ADMIN (STATISTIK)
+# =========================
+# harus didaftarkan sebelum "/{id_kategori}"
+@router.get(
+    "/stats",
+    response_model=schemas.CategoryStats,
+    dependencies=[Depends(get_current_user)]
+)
+async def category_stats(db: AsyncSession = Depends(get_read_db)):
+    # dari counter category_stats (di-update tiap tulis buku), bukan COUNT(*) tiap kali dashboard dibuka
+    return await crud_categories.get_stats(db)
+
+@router.post(
+    "/stats/recompute",
+    response_model=schemas.CategoryStats,
+    dependencies=[Depends(require_admin)]
+)
+async def recompute_category_stats(db: AsyncSession = Depends(get_db)):
+    # perbaikan manual kalau counter melenceng (mis. data diubah langsung di database)
+    await crud_categories.recompute_stats(db)
+    await db.commit()
+    return await crud_categories.get_stats(db)
+
+# =========================
+# USER/ADMIN (READ ONE)
+# =========================
+@router.get(
+    "/{id_kategori}",
+    response_model=schemas.CategoryOut,
+    dependencies=[Depends(get_current_user)]
+)
+async def get_category(id_kategori: int, db: AsyncSession = Depends(get_read_db)):
+    return await crud_categories.get_category(db, id_kategori)
+
+# =========================
+# ADMIN ONLY (CREATE / UPDATE / DELETE)
+# =========================
+@router.post(
+    "",
+    response_model=schemas.CategoryOut,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(require_admin)]
+)
+async def create_category(payload: schemas.CategoryCreate, db: AsyncSession = Depends(get_db)):
+    return await crud_categories.create_category(db, payload)
+
+@router.put(
+    "/{id_kategori}",
+    response_model=schemas.CategoryOut,
+    dependencies=[Depends(require_admin)]
+)
+async def update_category(id_kategori: int, payload: schemas.CategoryUpdate, db: AsyncSession = Depends(get_db)):
+    return await crud_categories.update_category(db, id_kategori, payload)
+
+@router.delete(
+    "/{id_kategori}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    dependencies=[Depends(require_admin)]
+)
+async def delete_category(id_kategori: int, db: AsyncSession = Depends(get_db)):
+    await crud_categories.delete_category(db, id_kategori)
+    return None
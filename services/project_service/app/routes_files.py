@@ -0,0 +1,61 @@
+import re
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import get_db, get_read_db
+from . import storage, pdf_delivery, pdf_ingest
+from .security import require_admin
+
+router = APIRouter(prefix="/files", tags=["Files"])
+
+# blob dialamatkan dengan isinya: URL yang sama tidak akan pernah berubah isi
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+_DIGEST_RE = re.compile(r"[0-9a-f]{64}")
+
+# =========================
+# PUBLIC (DOWNLOAD PDF, mendukung Range)
+# =========================
+@router.api_route("/{digest}.pdf", methods=["GET", "HEAD"])
+async def get_pdf(digest: str, request: Request):
+    if not _DIGEST_RE.fullmatch(digest):
+        raise HTTPException(status_code=404, detail="File tidak ditemukan")
+
+    size = await storage.backend.size(digest)
+    if size is None:
+        raise HTTPException(status_code=404, detail="File tidak ditemukan")
+
+    return pdf_delivery.file_response(
+        request,
+        size=size,
+        etag=f'"{digest}"',
+        reader=lambda start, end: storage.backend.iter_range(digest, start, end),
+        path=storage.backend.local_path(digest),
+        cache_control=IMMUTABLE_CACHE,
+    )
+
+# =========================
+# PUBLIC (THUMBNAIL HALAMAN PERTAMA, hasil ingest)
+# =========================
+@router.get("/{digest}/thumbnail.jpg")
+async def get_thumbnail(digest: str, request: Request, db: AsyncSession = Depends(get_read_db)):
+    if not _DIGEST_RE.fullmatch(digest):
+        raise HTTPException(status_code=404, detail="Thumbnail tidak ditemukan")
+
+    etag = f'"{digest}-thumb"'
+    # bisa berubah kalau PDF di-reprocess, jadi tidak immutable
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=86400"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    thumbnail = await pdf_ingest.get_thumbnail(db, digest)
+    if not thumbnail:
+        raise HTTPException(status_code=404, detail="Thumbnail tidak ditemukan")
+    return Response(content=thumbnail, media_type="image/jpeg", headers=headers)
+
+# =========================
+# ADMIN ONLY (GARBAGE COLLECTION)
+# =========================
+@router.post("/gc", dependencies=[Depends(require_admin)])
+async def collect_garbage(db: AsyncSession = Depends(get_db)):
+    return await storage.collect_garbage(db)
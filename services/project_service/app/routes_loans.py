@@ -0,0 +1,62 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import get_db
+from . import schemas, crud_loans
+from .security import get_current_user
+
+router = APIRouter(tags=["Loans"])
+
+def _target_user(user: dict, untuk: Optional[str]) -> str:
+    # admin boleh meminjamkan / menerima pengembalian atas nama user lain
+    if untuk is None or untuk == user["sub"]:
+        return user["sub"]
+    if user.get("r") != "a":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Akses ditolak: hanya admin.")
+    return untuk
+
+# =========================
+# USER/ADMIN (PINJAM & KEMBALIKAN)
+# =========================
+@router.post(
+    "/books/{id_buku}/borrow",
+    response_model=schemas.LoanOut,
+    status_code=status.HTTP_201_CREATED,
+)
+async def borrow_book(
+    id_buku: int,
+    untuk: Optional[str] = Query(default=None, description="Admin: username peminjam"),
+    user=Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    return await crud_loans.borrow(db, id_buku, _target_user(user, untuk))
+
+@router.post(
+    "/books/{id_buku}/return",
+    response_model=schemas.LoanOut,
+)
+async def return_book(
+    id_buku: int,
+    untuk: Optional[str] = Query(default=None, description="Admin: username peminjam"),
+    user=Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    return await crud_loans.return_book(db, id_buku, _target_user(user, untuk))
+
+# =========================
+# USER/ADMIN (RIWAYAT PINJAMAN)
+# =========================
+@router.get("/loans", response_model=list[schemas.LoanOut])
+async def list_loans(
+    aktif: Optional[bool] = None,
+    id_buku: Optional[int] = None,
+    user_sub: Optional[str] = Query(default=None, description="Admin: filter per user (kosong = semua user)"),
+    limit: int = 50,
+    user=Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    # user biasa hanya melihat pinjamannya sendiri
+    if user.get("r") != "a":
+        user_sub = user["sub"]
+    return await crud_loans.list_loans(db, user_sub, id_buku, aktif, limit)
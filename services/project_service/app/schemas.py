@@ -1,4 +1,5 @@
-from pydantic import BaseModel, Field
+from datetime import datetime
+from pydantic import BaseModel, Field, AliasPath
 from typing import Optional
 
 class BookBase(BaseModel):
@@ -11,17 +12,93 @@ class BookBase(BaseModel):
 class BookCreate(BookBase):
     # ID diinput admin
     id_buku: int = Field(ge=1)
+    jumlah_eksemplar: int = Field(default=1, ge=1)
 
 class BookUpdate(BaseModel):
     judul: Optional[str] = Field(default=None, min_length=1, max_length=200)
     penulis: Optional[str] = Field(default=None, min_length=1, max_length=150)
     tahun: Optional[int] = Field(default=None, ge=0, le=2100)
+    # False = tarik semua eksemplar dari peminjaman, True = kembalikan yang tidak sedang dipinjam
     tersedia: Optional[bool] = None
     id_kategori: Optional[int] = None
+    jumlah_eksemplar: Optional[int] = Field(default=None, ge=1)
+
+class CategoryBase(BaseModel):
+    nama: str = Field(min_length=1, max_length=100)
+
+class CategoryCreate(CategoryBase):
+    pass
+
+class CategoryUpdate(CategoryBase):
+    pass
+
+class CategoryOut(CategoryBase):
+    id_kategori: int
+
+    class Config:
+        from_attributes = True
+
+class CategoryStat(BaseModel):
+    # id_kategori None = buku tanpa kategori
+    id_kategori: Optional[int] = None
+    nama: Optional[str] = None
+    jumlah_buku: int
+    jumlah_tersedia: int
+
+class CategoryStats(BaseModel):
+    total_buku: int
+    total_tersedia: int
+    kategori: list[CategoryStat]
 
 class BookOut(BookBase):
     id_buku: int
     pdf_url: Optional[str] = None
+    jumlah_eksemplar: int = 1
+    eksemplar_tersedia: int = 1
+    # dari relasi Book.category (di-load selectin, bukan lazy per buku)
+    kategori: Optional[CategoryOut] = Field(default=None, validation_alias="category")
+    # hasil ingest PDF di background; None selama belum ada PDF / belum selesai diproses
+    pdf_status: Optional[str] = Field(default=None, validation_alias=AliasPath("pdf_job", "status"))
+    jumlah_halaman: Optional[int] = Field(default=None, validation_alias=AliasPath("pdf_document", "page_count"))
+    ukuran_pdf: Optional[int] = Field(default=None, validation_alias=AliasPath("pdf_document", "size"))
+    thumbnail_url: Optional[str] = Field(default=None, validation_alias=AliasPath("pdf_document", "thumbnail_url"))
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class LoanOut(BaseModel):
+    id: int
+    id_buku: Optional[int] = None  # None = bukunya sudah dihapus
+    judul: Optional[str] = None
+    user_sub: str
+    borrowed_at: datetime
+    due_at: datetime
+    returned_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class PdfPageOut(BaseModel):
+    halaman: int = Field(validation_alias="page_no")
+    teks: str = Field(validation_alias="text")
+
+    class Config:
+        from_attributes = True
+
+class BookPage(BaseModel):
+    items: list[BookOut]
+    # None = sudah halaman terakhir
+    next_cursor: Optional[str] = None
+
+class BulkRowError(BaseModel):
+    line: int
+    id_buku: Optional[int] = None
+    error: str
+
+class BulkImportResult(BaseModel):
+    inserted: int
+    updated: int
+    skipped: int
+    failed: int
+    errors: list[BulkRowError]
+    errors_truncated: bool = False
@@ -0,0 +1,188 @@
+import re
+from difflib import SequenceMatcher
+from sqlalchemy import text, select, or_
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+
+# =========================
+# SEARCH CONFIG
+# =========================
+MAX_RESULTS = 100
+FUZZY_MIN_SIMILARITY = 0.75  # rata-rata kemiripan kata query vs kata judul/penulis (fallback SQLite)
+
+# Ekspresi dokumen harus sama persis dengan index GIN supaya planner memakai index-nya
+_PG_DOCUMENT = "to_tsvector('simple', coalesce(judul, '') || ' ' || coalesce(penulis, ''))"
+
+_PG_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS ix_books_fts ON books USING gin ({_PG_DOCUMENT})",
+    "CREATE INDEX IF NOT EXISTS ix_books_judul_trgm ON books USING gin (judul gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_books_penulis_trgm ON books USING gin (penulis gin_trgm_ops)",
+]
+
+# SQLite: dua tabel FTS5 external-content (isi tetap di tabel books), disinkronkan lewat trigger.
+#   books_fts      -> token kata (unicode61) untuk full-text + prefix
+#   books_fts_tri  -> token trigram untuk pencarian toleran typo
+_SQLITE_FTS_TABLES = {
+    "books_fts": "unicode61 remove_diacritics 2",
+    "books_fts_tri": "trigram",
+}
+
+
+def _sqlite_ddl(table: str, tokenizer: str) -> list[str]:
+    cols = "judul, penulis"
+    new = "new.id_buku, new.judul, new.penulis"
+    old = "old.id_buku, old.judul, old.penulis"
+    return [
+        f"CREATE VIRTUAL TABLE {table} USING fts5({cols}, content='books', content_rowid='id_buku', "
+        f"tokenize='{tokenizer}')",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_ai AFTER INSERT ON books BEGIN "
+        f"INSERT INTO {table}(rowid, {cols}) VALUES ({new}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_ad AFTER DELETE ON books BEGIN "
+        f"INSERT INTO {table}({table}, rowid, {cols}) VALUES ('delete', {old}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_au AFTER UPDATE OF judul, penulis ON books BEGIN "
+        f"INSERT INTO {table}({table}, rowid, {cols}) VALUES ('delete', {old}); "
+        f"INSERT INTO {table}(rowid, {cols}) VALUES ({new}); END",
+        f"INSERT INTO {table}({table}) VALUES ('rebuild')",
+    ]
+
+
+def install_search(conn: Connection) -> None:
+    # dipanggil sekali saat startup (AsyncConnection.run_sync), setelah tabel books ada
+    if conn.dialect.name == "postgresql":
+        for ddl in _PG_DDL:
+            conn.execute(text(ddl))
+    elif conn.dialect.name == "sqlite":
+        existing = set(conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'")).scalars())
+        for table, tokenizer in _SQLITE_FTS_TABLES.items():
+            if table in existing:
+                continue
+            for ddl in _sqlite_ddl(table, tokenizer):
+                conn.execute(text(ddl))
+
+
+# =========================
+# QUERY
+# =========================
+def _terms(q: str) -> list[str]:
+    return re.findall(r"\w+", q.lower())
+
+
+def _trigrams(s: str) -> set[str]:
+    s = s.lower()
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+def _fuzzy_score(terms: list[str], book: models.Book) -> float:
+    # tiap kata query dicocokkan ke kata paling mirip di judul/penulis (awalan = cocok penuh)
+    words = _terms(f"{book.judul} {book.penulis}")
+    total = 0.0
+    for t in terms:
+        total += max(
+            (1.0 if w.startswith(t) else SequenceMatcher(None, t, w).ratio() for w in words),
+            default=0.0,
+        )
+    return total / len(terms)
+
+
+def _filters(tahun, tersedia, id_kategori) -> tuple[str, dict]:
+    sql, params = "", {}
+    if tahun is not None:
+        sql += " AND b.tahun = :tahun"
+        params["tahun"] = tahun
+    if tersedia is not None:
+        sql += " AND b.tersedia = :tersedia"
+        params["tersedia"] = tersedia
+    if id_kategori is not None:
+        sql += " AND b.id_kategori = :id_kategori"
+        params["id_kategori"] = id_kategori
+    return sql, params
+
+
+async def _books(db: AsyncSession, sql: str, params: dict) -> list[models.Book]:
+    return list((await db.execute(select(models.Book).from_statement(text(sql)), params)).scalars())
+
+
+async def _search_postgres(db, q, terms, where, params, limit):
+    # full-text (prefix) ATAU kemiripan trigram per kata (toleran typo), diurutkan gabungan skor
+    tsquery = " & ".join(f"{t}:*" for t in terms)
+    sql = f"""
+        SELECT b.* FROM books b
+        WHERE ({_PG_DOCUMENT} @@ to_tsquery('simple', :tsq) OR :q <% b.judul OR :q <% b.penulis){where}
+        ORDER BY ts_rank({_PG_DOCUMENT}, to_tsquery('simple', :tsq))
+                 + greatest(word_similarity(:q, b.judul), word_similarity(:q, b.penulis)) DESC,
+                 b.id_buku
+        LIMIT :limit
+    """
+    return await _books(db, sql, {**params, "tsq": tsquery, "q": q, "limit": limit})
+
+
+async def _search_sqlite(db, q, terms, where, params, limit):
+    # 1) full-text + prefix: semua kata harus cocok (sebagai awalan)
+    match = " ".join(f'"{t}"*' for t in terms)
+    exact = await _books(db, f"""
+        SELECT b.*, bm25(books_fts) AS score FROM books_fts JOIN books b ON b.id_buku = books_fts.rowid
+        WHERE books_fts MATCH :m{where} ORDER BY score, b.id_buku LIMIT :limit
+    """, {**params, "m": match, "limit": limit})
+    if len(exact) >= limit:
+        return exact
+
+    # 2) fuzzy: kandidat dari trigram query (OR), lalu disaring dengan kemiripan per kata
+    grams = set().union(*(_trigrams(t) for t in terms if len(t) >= 3))
+    if not grams:
+        return exact
+    fuzzy_match = " OR ".join(f'"{g}"' for g in sorted(grams))
+    candidates = await _books(db, f"""
+        SELECT b.*, bm25(books_fts_tri) AS score FROM books_fts_tri JOIN books b ON b.id_buku = books_fts_tri.rowid
+        WHERE books_fts_tri MATCH :m{where} ORDER BY score, b.id_buku LIMIT :limit
+    """, {**params, "m": fuzzy_match, "limit": limit * 5})
+
+    seen = {b.id_buku for b in exact}
+    scored = []
+    for b in candidates:
+        if b.id_buku in seen:
+            continue
+        sim = _fuzzy_score(terms, b)
+        if sim >= FUZZY_MIN_SIMILARITY:
+            scored.append((-sim, b.id_buku, b))
+    scored.sort(key=lambda x: x[:2])
+    return exact + [b for _, _, b in scored[: limit - len(exact)]]
+
+
+async def _search_generic(db, terms, tahun, tersedia, id_kategori, limit):
+    # dialect lain: LIKE sederhana tanpa ranking (tidak dipakai di produksi)
+    stmt = select(models.Book)
+    for t in terms:
+        like = f"%{t}%"
+        stmt = stmt.where(or_(models.Book.judul.ilike(like), models.Book.penulis.ilike(like)))
+    if tahun is not None:
+        stmt = stmt.where(models.Book.tahun == tahun)
+    if tersedia is not None:
+        stmt = stmt.where(models.Book.tersedia == tersedia)
+    if id_kategori is not None:
+        stmt = stmt.where(models.Book.id_kategori == id_kategori)
+    return (await db.execute(stmt.order_by(models.Book.id_buku).limit(limit))).scalars().all()
+
+
+async def search_books(
+    db: AsyncSession,
+    q: str,
+    tahun: int | None = None,
+    tersedia: bool | None = None,
+    id_kategori: int | None = None,
+    limit: int = 20,
+) -> list[models.Book]:
+    terms = _terms(q)
+    if not terms:
+        return []
+    limit = max(1, min(limit, MAX_RESULTS))
+    where, params = _filters(tahun, tersedia, id_kategori)
+
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return await _search_postgres(db, q, terms, where, params, limit)
+    if dialect == "sqlite":
+        return await _search_sqlite(db, q, terms, where, params, limit)
+    return await _search_generic(db, terms, tahun, tersedia, id_kategori, limit)
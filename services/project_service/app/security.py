@@ -1,19 +1,18 @@
-import os
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from jose import jwt, JWTError
+from jose import JWTError
 
-bearer = HTTPBearer()
+from .token_cache import token_cache
 
-JWT_SECRET = os.getenv("JWT_SECRET", "CHANGE_ME_SUPER_SECRET")
-JWT_ALG = os.getenv("JWT_ALG", "HS256")
+bearer = HTTPBearer()
 
-def get_current_user(
+async def get_current_user(
     creds: HTTPAuthorizationCredentials = Depends(bearer)
 ):
     token = creds.credentials
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG])
+        # signature hanya dicek sekali per token; berikutnya dari cache sampai exp
+        payload = token_cache.verify(token)
         # payload minimal: {"sub": "...", "r": "a/u", "exp": ...}
         return payload
     except JWTError:
@@ -22,7 +21,7 @@ def get_current_user(
             detail="Token tidak valid atau kadaluarsa."
         )
 
-def require_admin(user=Depends(get_current_user)):
+async def require_admin(user=Depends(get_current_user)):
     # token ringkas: admin="a"
     if user.get("r") != "a":
         raise HTTPException(
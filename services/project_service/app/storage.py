@@ -0,0 +1,304 @@
+import os
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator
+
+import aiofiles
+import aiofiles.os
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .models import Book, PdfBlob, PdfIngestJob, PdfDocument, PdfPage
+from .pdf_delivery import iter_file
+from .uploads import UPLOAD_DIR
+
+# =========================
+# STORAGE CONFIG
+# =========================
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")  # local | s3
+BLOB_DIR = os.getenv("BLOB_DIR", os.path.join(UPLOAD_DIR, "blobs"))
+# blob tanpa referensi baru dihapus setelah masa tenggang (upload yang sedang jalan bisa memakainya lagi)
+BLOB_GC_GRACE_SECONDS = int(os.getenv("BLOB_GC_GRACE_SECONDS", "3600"))
+BLOB_GC_INTERVAL_SECONDS = int(os.getenv("BLOB_GC_INTERVAL_SECONDS", "3600"))  # 0 = GC periodik mati
+
+S3_BUCKET = os.getenv("S3_BUCKET", "")
+S3_PREFIX = os.getenv("S3_PREFIX", "pdf/")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None  # mis. MinIO lokal: http://minio:9000
+S3_REGION = os.getenv("S3_REGION") or None
+
+CHUNK_SIZE = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def blob_url(digest: str) -> str:
+    return f"/files/{digest}.pdf"
+
+
+# =========================
+# BACKEND INTERFACE
+# =========================
+class BlobBackend(ABC):
+    """Penyimpanan blob PDF yang dialamatkan dengan sha256 isinya."""
+
+    @abstractmethod
+    async def put(self, digest: str, src_path: str) -> None:
+        """Pindahkan file lokal src_path menjadi blob digest (src_path dianggap habis dipakai)."""
+
+    @abstractmethod
+    async def exists(self, digest: str) -> bool: ...
+
+    @abstractmethod
+    async def size(self, digest: str) -> int | None: ...
+
+    @abstractmethod
+    async def delete(self, digest: str) -> None: ...
+
+    @abstractmethod
+    def iter_range(self, digest: str, start: int, end: int) -> AsyncIterator[bytes]:
+        """Isi blob dari byte start sampai end (inklusif)."""
+
+    def local_path(self, digest: str) -> str | None:
+        # hanya backend disk yang punya path (dipakai untuk FileResponse / sendfile)
+        return None
+
+
+class LocalBlobBackend(BlobBackend):
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def local_path(self, digest: str) -> str:
+        # fan-out 2 karakter supaya satu direktori tidak berisi jutaan file
+        return os.path.join(self.root, digest[:2], f"{digest}.pdf")
+
+    async def put(self, digest: str, src_path: str) -> None:
+        path = self.local_path(digest)
+        await aiofiles.os.makedirs(os.path.dirname(path), exist_ok=True)
+        # isi sama = nama sama, jadi replace aman walau blob sudah ada
+        await aiofiles.os.replace(src_path, path)
+
+    async def exists(self, digest: str) -> bool:
+        return await aiofiles.os.path.exists(self.local_path(digest))
+
+    async def size(self, digest: str) -> int | None:
+        try:
+            return (await aiofiles.os.stat(self.local_path(digest))).st_size
+        except FileNotFoundError:
+            return None
+
+    async def delete(self, digest: str) -> None:
+        try:
+            await aiofiles.os.remove(self.local_path(digest))
+        except FileNotFoundError:
+            pass
+
+    def iter_range(self, digest: str, start: int, end: int) -> AsyncIterator[bytes]:
+        return iter_file(self.local_path(digest), start, end)
+
+
+class S3BlobBackend(BlobBackend):
+    # boto3 bersifat opsional: hanya dibutuhkan kalau STORAGE_BACKEND=s3.
+    # Bisa diuji lokal dengan MinIO (lihat profile "s3" di infra/docker-compose.yml).
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: str | None = None, region: str | None = None):
+        try:
+            import boto3
+        except ImportError as e:
+            raise RuntimeError("STORAGE_BACKEND=s3 butuh paket boto3 (pip install boto3)") from e
+        from botocore.exceptions import ClientError
+
+        if not bucket:
+            raise RuntimeError("S3_BUCKET environment variable is not set")
+        self.bucket = bucket
+        self.prefix = prefix
+        self._client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        self._ClientError = ClientError
+
+    def _key(self, digest: str) -> str:
+        return f"{self.prefix}{digest}.pdf"
+
+    async def put(self, digest: str, src_path: str) -> None:
+        await asyncio.to_thread(
+            self._client.upload_file,
+            src_path, self.bucket, self._key(digest),
+            ExtraArgs={"ContentType": "application/pdf"},
+        )
+        await aiofiles.os.remove(src_path)
+
+    async def size(self, digest: str) -> int | None:
+        try:
+            head = await asyncio.to_thread(self._client.head_object, Bucket=self.bucket, Key=self._key(digest))
+        except self._ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return head["ContentLength"]
+
+    async def exists(self, digest: str) -> bool:
+        return await self.size(digest) is not None
+
+    async def delete(self, digest: str) -> None:
+        await asyncio.to_thread(self._client.delete_object, Bucket=self.bucket, Key=self._key(digest))
+
+    async def iter_range(self, digest: str, start: int, end: int) -> AsyncIterator[bytes]:
+        obj = await asyncio.to_thread(
+            self._client.get_object, Bucket=self.bucket, Key=self._key(digest), Range=f"bytes={start}-{end}"
+        )
+        body = obj["Body"]
+        try:
+            while True:
+                chunk = await asyncio.to_thread(body.read, CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            body.close()
+
+
+def _make_backend() -> BlobBackend:
+    if STORAGE_BACKEND == "s3":
+        return S3BlobBackend(S3_BUCKET, S3_PREFIX, S3_ENDPOINT_URL, S3_REGION)
+    if STORAGE_BACKEND == "local":
+        return LocalBlobBackend(BLOB_DIR)
+    raise RuntimeError(f"STORAGE_BACKEND tidak dikenal: {STORAGE_BACKEND}")
+
+
+backend: BlobBackend = _make_backend()
+
+
+# =========================
+# REFERENCE COUNTING (tabel pdf_blobs)
+# =========================
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+async def acquire_blob(db: AsyncSession, digest: str, size: int) -> None:
+    # upsert atomik: dua upload isi yang sama secara bersamaan tidak bentrok
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(PdfBlob).values(sha256=digest, size=size, ref_count=1, updated_at=_now())
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[PdfBlob.sha256],
+        set_={"ref_count": PdfBlob.ref_count + 1, "updated_at": _now()},
+    )
+    await db.execute(stmt)
+
+
+async def release_blob(db: AsyncSession, digest: str) -> None:
+    await db.execute(
+        update(PdfBlob)
+        .where(PdfBlob.sha256 == digest, PdfBlob.ref_count > 0)
+        .values(ref_count=PdfBlob.ref_count - 1, updated_at=_now())
+    )
+
+
+async def pin_blob(db: AsyncSession, digest: str, size: int) -> None:
+    # ref +1 di-commit SEBELUM file dipindah ke backend, supaya GC tidak menghapusnya di tengah jalan
+    await acquire_blob(db, digest, size)
+    await db.commit()
+
+
+async def unpin_blob(db: AsyncSession, digest: str) -> None:
+    await release_blob(db, digest)
+    await db.commit()
+
+
+async def set_book_pdf(db: AsyncSession, book: Book, digest: str) -> str | None:
+    # Ganti PDF buku; referensi ke blob baru harus sudah di-pin oleh pemanggil.
+    # Return path file format lama (/uploads/...) yang boleh dihapus setelah commit.
+    legacy_file = await release_book_pdf(db, book)
+    book.pdf_sha256 = digest
+    book.pdf_url = blob_url(digest)
+    return legacy_file
+
+
+async def release_book_pdf(db: AsyncSession, book: Book) -> str | None:
+    if book.pdf_sha256:
+        await release_blob(db, book.pdf_sha256)
+        return None
+    if book.pdf_url and book.pdf_url.startswith("/uploads/"):
+        return os.path.join(UPLOAD_DIR, os.path.basename(book.pdf_url))
+    return None
+
+
+async def remove_legacy_file(path: str | None) -> None:
+    if not path:
+        return
+    try:
+        await aiofiles.os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+# =========================
+# GARBAGE COLLECTION
+# =========================
+async def collect_garbage(db: AsyncSession, grace_seconds: int = BLOB_GC_GRACE_SECONDS) -> dict:
+    cutoff = _now() - timedelta(seconds=grace_seconds)
+    unreferenced = (PdfBlob.ref_count <= 0, PdfBlob.updated_at < cutoff)
+    candidates = (await db.execute(select(PdfBlob.sha256).where(*unreferenced))).scalars().all()
+
+    removed, repaired = [], []
+    for digest in candidates:
+        # kunci baris lalu cek ulang: upload bersamaan yang meng-acquire blob ini akan menunggu
+        locked = (await db.execute(
+            select(PdfBlob.sha256)
+            .where(PdfBlob.sha256 == digest, *unreferenced)
+            .with_for_update(skip_locked=True)
+        )).scalar_one_or_none()
+        if locked is None:
+            await db.rollback()
+            continue
+
+        # jangan andalkan FK untuk mendeteksi ref_count melenceng: cek langsung masih ada buku
+        # yang menunjuk blob ini (SQLite lama / tanpa PRAGMA foreign_keys tidak menolak DELETE)
+        still_used = (await db.execute(
+            select(Book.id_buku).where(Book.pdf_sha256 == digest).limit(1)
+        )).first()
+        if still_used is not None:
+            await db.rollback()
+            await _recount(db, digest)
+            repaired.append(digest)
+            continue
+
+        try:
+            await db.execute(delete(PdfBlob).where(PdfBlob.sha256 == digest))
+            await db.flush()
+            # hasil ingest ikut dibuang bersama blob-nya
+            for derived in (PdfPage, PdfDocument, PdfIngestJob):
+                await db.execute(delete(derived).where(derived.sha256 == digest))
+        except IntegrityError:
+            # buku baru menunjuk blob ini di antara cek dan DELETE: hitung ulang
+            await db.rollback()
+            await _recount(db, digest)
+            repaired.append(digest)
+            continue
+
+        await backend.delete(digest)
+        await db.commit()
+        removed.append(digest)
+
+    return {"removed": removed, "repaired": repaired}
+
+
+async def _recount(db: AsyncSession, digest: str) -> None:
+    count = (await db.execute(select(func.count()).select_from(Book).where(Book.pdf_sha256 == digest))).scalar_one()
+    await db.execute(update(PdfBlob).where(PdfBlob.sha256 == digest).values(ref_count=count, updated_at=_now()))
+    await db.commit()
+
+
+async def gc_loop(session_factory) -> None:
+    # dijalankan sebagai background task dari startup app
+    while True:
+        await asyncio.sleep(BLOB_GC_INTERVAL_SECONDS)
+        try:
+            async with session_factory() as db:
+                result = await collect_garbage(db)
+            if result["removed"] or result["repaired"]:
+                logger.info("blob gc: %s", result)
+        except Exception:
+            logger.exception("blob gc gagal")
@@ -0,0 +1,73 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from jose import jwt
+
+from . import metrics
+
+# =========================
+# TOKEN CACHE CONFIG
+# =========================
+# Modul ini sama persis di gateway_service dan project_service (tiap service di-build terpisah).
+JWT_SECRET = os.getenv("JWT_SECRET", "CHANGE_ME_SUPER_SECRET")
+JWT_ALG = os.getenv("JWT_ALG", "HS256")
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))  # 0 = cache mati, selalu jwt.decode
+
+
+class TokenCache:
+    """LRU payload JWT yang sudah diverifikasi, di-key dengan sha256 token.
+
+    Entri kedaluwarsa tepat di ``exp`` token, jadi hasilnya sama dengan ``jwt.decode``
+    tanpa mengulang verifikasi signature untuk token yang sama.
+    """
+
+    def __init__(self, secret: str, algorithm: str, maxsize: int):
+        self.secret = secret
+        self.algorithms = [algorithm]
+        self.maxsize = maxsize
+        self._entries: OrderedDict[bytes, tuple[dict, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def verify(self, token: str) -> dict:
+        # raise JWTError (dari python-jose) kalau token tidak valid / kadaluarsa
+        started = time.perf_counter()
+        key = hashlib.sha256(token.encode()).digest()
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                payload, exp = entry
+                if exp > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    metrics.JWT_VERIFY.labels("hit").observe(time.perf_counter() - started)
+                    return payload
+                del self._entries[key]
+            self.misses += 1
+
+        try:
+            payload = jwt.decode(token, self.secret, algorithms=self.algorithms)
+        finally:
+            metrics.JWT_VERIFY.labels("miss").observe(time.perf_counter() - started)
+
+        exp = payload.get("exp")
+        # token tanpa exp tidak di-cache: tidak ada batas kapan harus dicek ulang
+        if self.maxsize > 0 and isinstance(exp, (int, float)):
+            with self._lock:
+                self._entries[key] = (payload, float(exp))
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return payload
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+token_cache = TokenCache(JWT_SECRET, JWT_ALG, TOKEN_CACHE_SIZE)
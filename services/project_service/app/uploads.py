@@ -0,0 +1,174 @@
+import os
+import uuid
+import asyncio
+import hashlib
+from typing import AsyncIterator, NamedTuple
+
+import aiofiles
+import aiofiles.os
+from fastapi import HTTPException, Request, status
+from multipart.multipart import MultipartParser, parse_options_header
+
+# =========================
+# UPLOAD CONFIG
+# =========================
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+UPLOAD_TMP_DIR = os.path.join(UPLOAD_DIR, ".tmp")  # harus satu filesystem dengan UPLOAD_DIR (rename atomik)
+MAX_PDF_BYTES = int(os.getenv("MAX_PDF_BYTES", str(50 * 1024 * 1024)))
+
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+
+# Body upload tidak lagi di-parse FastAPI (UploadFile), jadi skemanya ditulis manual untuk Swagger
+PDF_UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"],
+                }
+            },
+            "application/pdf": {"schema": {"type": "string", "format": "binary"}},
+        },
+    }
+}
+
+
+class StoredUpload(NamedTuple):
+    tmp_path: str
+    sha256: str
+    size: int
+
+
+# =========================
+# SUMBER CHUNK (MULTIPART / RAW)
+# =========================
+async def _multipart_pdf_chunks(request: Request, boundary: bytes) -> AsyncIterator[bytes]:
+    # Parser multipart berbasis push: tiap chunk dari socket langsung diteruskan,
+    # tanpa SpooledTemporaryFile seperti UploadFile.
+    pending: list[bytes] = []
+    headers: dict[bytes, bytes] = {}
+    field = bytearray()
+    value = bytearray()
+    state = {"in_file": False, "found": False}
+
+    def on_part_begin():
+        headers.clear()
+
+    def on_header_field(data, start, end):
+        field.extend(data[start:end])
+
+    def on_header_value(data, start, end):
+        value.extend(data[start:end])
+
+    def on_header_end():
+        headers[bytes(field).lower()] = bytes(value)
+        field.clear()
+        value.clear()
+
+    def on_headers_finished():
+        _, opts = parse_options_header(headers.get(b"content-disposition", b""))
+        if opts.get(b"name") != b"file" or state["found"]:
+            return
+        ctype, _ = parse_options_header(headers.get(b"content-type", b""))
+        if ctype != b"application/pdf":
+            raise HTTPException(status_code=400, detail="File harus PDF")
+        state["in_file"] = True
+        state["found"] = True
+
+    def on_part_data(data, start, end):
+        if state["in_file"]:
+            pending.append(data[start:end])
+
+    def on_part_end():
+        state["in_file"] = False
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    async for chunk in request.stream():
+        parser.write(chunk)
+        if pending:
+            yield b"".join(pending)
+            pending.clear()
+    parser.finalize()
+
+    if not state["found"]:
+        raise HTTPException(status_code=400, detail="Field 'file' tidak ditemukan")
+
+
+async def _raw_chunks(request: Request) -> AsyncIterator[bytes]:
+    async for chunk in request.stream():
+        if chunk:
+            yield chunk
+
+
+def _pdf_chunks(request: Request) -> AsyncIterator[bytes]:
+    ctype, opts = parse_options_header(request.headers.get("content-type", ""))
+    if ctype == b"multipart/form-data":
+        boundary = opts.get(b"boundary")
+        if not boundary:
+            raise HTTPException(status_code=400, detail="Boundary multipart tidak ada")
+        return _multipart_pdf_chunks(request, boundary)
+    if ctype == b"application/pdf":
+        return _raw_chunks(request)
+    raise HTTPException(
+        status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+        detail="Kirim sebagai multipart/form-data (field 'file') atau application/pdf",
+    )
+
+
+# =========================
+# STREAM -> TEMP FILE
+# =========================
+async def _discard(path: str) -> None:
+    try:
+        await aiofiles.os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+async def receive_pdf(request: Request) -> StoredUpload:
+    # Tolak lebih awal kalau Content-Length sudah jelas kebesaran
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > MAX_PDF_BYTES + 64 * 1024:
+        raise HTTPException(status_code=413, detail=f"File melebihi batas {MAX_PDF_BYTES} byte")
+
+    chunks = _pdf_chunks(request)
+    tmp_path = os.path.join(UPLOAD_TMP_DIR, f"{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        async with aiofiles.open(tmp_path, "wb") as f:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > MAX_PDF_BYTES:
+                    raise HTTPException(status_code=413, detail=f"File melebihi batas {MAX_PDF_BYTES} byte")
+                digest.update(chunk)
+                await f.write(chunk)
+            await f.flush()
+            await asyncio.to_thread(os.fsync, f.fileno())
+    except BaseException:
+        await _discard(tmp_path)
+        raise
+
+    if size == 0:
+        await _discard(tmp_path)
+        raise HTTPException(status_code=400, detail="File kosong / gagal terbaca")
+
+    return StoredUpload(tmp_path=tmp_path, sha256=digest.hexdigest(), size=size)
+
+
+async def discard_upload(upload: StoredUpload) -> None:
+    await _discard(upload.tmp_path)
@@ -0,0 +1,31 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# konfigurasi app dibaca saat import: env harus siap sebelum modul app mana pun di-import
+_workdir = tempfile.mkdtemp()
+os.environ.setdefault("PROJECT_DB_URL", f"sqlite:///{os.path.join(_workdir, 'project.db')}")
+os.environ.setdefault("UPLOAD_DIR", os.path.join(_workdir, "uploads"))
+os.environ.setdefault("JWT_SECRET", "test-secret")
+os.environ.setdefault("METRICS", "0")
+os.environ.setdefault("BLOB_GC_INTERVAL_SECONDS", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def session_factory():
+    # skema baru per test
+    from app.database import Base, engine, SessionLocal, sync_schema
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(sync_schema)
+    yield SessionLocal
+    await engine.dispose()
@@ -0,0 +1,68 @@
+"""Cursor keyset: encode/decode, cursor rusak/diubah, dan menelusuri semua halaman."""
+import json
+import base64
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app import models, pagination, crud_books
+
+
+def _raw_cursor(payload) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def test_cursor_roundtrip():
+    row = SimpleNamespace(id_buku=42, judul="Laskar Pelangi", penulis="Andrea")
+    cursor = pagination.encode_cursor("judul", "desc", row)
+    assert "=" not in cursor
+    assert pagination.decode_cursor(cursor, "judul", "desc") == ("Laskar Pelangi", 42)
+    assert pagination.decode_cursor(pagination.encode_cursor("id_buku", "asc", row), "id_buku", "asc") == (42, 42)
+
+
+@pytest.mark.parametrize("cursor", [
+    "bukan-base64!!",
+    base64.urlsafe_b64encode(b"bukan json").decode(),
+    _raw_cursor({"sort": "judul"}),
+    _raw_cursor(["judul", "asc", "x"]),
+    _raw_cursor(["judul", "asc", "x", "42"]),     # id_buku bukan int
+    _raw_cursor(["judul", "asc", "x", True]),
+    _raw_cursor(["judul", "asc", {"a": 1}, 42]),  # nilai sort bukan string
+    _raw_cursor(["judul", "asc", 7, 42]),
+])
+def test_tampered_cursor_rejected(cursor):
+    with pytest.raises(HTTPException) as exc:
+        pagination.decode_cursor(cursor, "judul", "asc")
+    assert exc.value.status_code == 400
+
+
+def test_cursor_for_other_sort_rejected():
+    cursor = pagination.encode_cursor("judul", "asc", SimpleNamespace(id_buku=1, judul="A"))
+    for sort, order in (("penulis", "asc"), ("judul", "desc")):
+        with pytest.raises(HTTPException) as exc:
+            pagination.decode_cursor(cursor, sort, order)
+        assert exc.value.status_code == 400
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("sort, order", [("id_buku", "asc"), ("judul", "asc"), ("judul", "desc"), ("penulis", "desc")])
+async def test_pages_cover_every_book_once(session_factory, sort, order):
+    async with session_factory() as db:
+        # judul kembar: urutan ditentukan tiebreaker id_buku
+        db.add_all(
+            models.Book(id_buku=i, judul=f"Judul {i % 4}", penulis=f"Penulis {i % 7}", tahun=2000)
+            for i in range(1, 24)
+        )
+        await db.commit()
+
+        seen, cursor = [], None
+        while True:
+            page = await crud_books.list_books_page(db, cursor, limit=5, sort=sort, order=order)
+            seen.extend(b["id_buku"] for b in page["items"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+    assert sorted(seen) == list(range(1, 24))
+    assert len(seen) == len(set(seen))
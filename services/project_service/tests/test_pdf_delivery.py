@@ -0,0 +1,69 @@
+"""Parsing Range dan pilihan status di file_response (200 / 206 / 304 / 416)."""
+import pytest
+from starlette.requests import Request
+
+from app import pdf_delivery
+from app.pdf_delivery import parse_range
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", [(0, 99)]),
+    ("bytes=100-", [(100, 999)]),
+    ("bytes=-100", [(900, 999)]),
+    ("bytes=-5000", [(0, 999)]),            # suffix lebih besar dari file = seluruh file
+    ("bytes=900-5000", [(900, 999)]),       # akhir dipotong ke ukuran file
+    ("bytes=0-9, 5-19, 20-29", [(0, 29)]),  # tumpang tindih & bersebelahan digabung
+    ("bytes=50-59, 0-9", [(0, 9), (50, 59)]),
+    ("BYTES = 0-0", [(0, 0)]),
+])
+def test_parse_range_satisfiable(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=5000-6000", "bytes=-0", "bytes=2000-, 3000-3999"])
+def test_parse_range_unsatisfiable(header):
+    assert parse_range(header, 1000) == []
+
+
+@pytest.mark.parametrize("header", [
+    None, "", "items=0-9", "bytes=", "bytes=abc", "bytes=9-0", "bytes=0-x", "bytes=1-2-3",
+])
+def test_parse_range_ignored(header):
+    assert parse_range(header, 1000) is None
+
+
+def test_parse_range_too_many_ranges_ignored():
+    header = "bytes=" + ",".join(f"{i * 10}-{i * 10 + 1}" for i in range(pdf_delivery.MAX_RANGES + 1))
+    assert parse_range(header, 100_000) is None
+
+
+def _request(**headers) -> Request:
+    raw = [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()]
+    return Request({"type": "http", "method": "GET", "headers": raw})
+
+
+async def _reader(start: int, end: int):
+    yield b"x" * (end - start + 1)
+
+
+def _respond(**headers):
+    return pdf_delivery.file_response(_request(**headers), size=1000, etag='"abc"', reader=_reader)
+
+
+def test_file_response_statuses():
+    assert _respond().status_code == 200
+    assert _respond(range="bytes=0-9").status_code == 206
+    assert _respond(range="bytes=0-9").headers["content-range"] == "bytes 0-9/1000"
+    multi = _respond(range="bytes=0-9,100-109")
+    assert multi.status_code == 206
+    assert multi.headers["content-type"].startswith("multipart/byteranges")
+    assert _respond(if_none_match='"abc"').status_code == 304
+    assert _respond(if_none_match='W/"abc"').status_code == 304
+
+    unsatisfiable = _respond(range="bytes=5000-")
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers["content-range"] == "bytes */1000"
+
+    # If-Range dengan ETag lama: Range diabaikan, file utuh dikirim
+    assert _respond(range="bytes=0-9", if_range='"old"').status_code == 200
+    assert _respond(range="bytes=0-9", if_range='"abc"').status_code == 206
@@ -0,0 +1,96 @@
+"""Reference counting blob PDF dan GC pada backend lokal."""
+import os
+
+import pytest
+from sqlalchemy import select
+
+from app import models, storage
+
+
+def _digest(n: int) -> str:
+    return f"{n:064x}"
+
+
+async def _stored_blob(db, digest: str, body: bytes = b"%PDF-1.4 test") -> None:
+    # jalur upload: pin dulu, baru file dipindah ke backend
+    tmp = os.path.join(storage.UPLOAD_DIR, f"{digest}.tmp")
+    os.makedirs(storage.UPLOAD_DIR, exist_ok=True)
+    with open(tmp, "wb") as f:
+        f.write(body)
+    await storage.pin_blob(db, digest, len(body))
+    await storage.backend.put(digest, tmp)
+
+
+async def _add_book(db, id_buku: int, digest: str) -> models.Book:
+    book = models.Book(id_buku=id_buku, judul=f"Buku {id_buku}", penulis="P", tahun=2000)
+    db.add(book)
+    await storage.set_book_pdf(db, book, digest)
+    await db.commit()
+    return book
+
+
+async def _ref_count(db, digest: str) -> int | None:
+    return (await db.execute(select(models.PdfBlob.ref_count).where(models.PdfBlob.sha256 == digest))).scalar()
+
+
+@pytest.mark.anyio
+async def test_put_exists_range_delete(session_factory):
+    digest = _digest(1)
+    async with session_factory() as db:
+        await _stored_blob(db, digest, b"0123456789")
+    assert await storage.backend.exists(digest)
+    assert await storage.backend.size(digest) == 10
+    assert b"".join([c async for c in storage.backend.iter_range(digest, 2, 5)]) == b"2345"
+    await storage.backend.delete(digest)
+    assert not await storage.backend.exists(digest)
+
+
+@pytest.mark.anyio
+async def test_shared_blob_survives_until_last_book_released(session_factory):
+    digest = _digest(2)
+    async with session_factory() as db:
+        await _stored_blob(db, digest)
+        book_a = await _add_book(db, 1, digest)
+        # buku kedua dengan isi yang sama: dedup, blob dipakai bersama
+        await storage.acquire_blob(db, digest, 13)
+        book_b = await _add_book(db, 2, digest)
+        assert await _ref_count(db, digest) == 2
+
+        await storage.release_book_pdf(db, book_a)
+        book_a.pdf_sha256 = None
+        await db.commit()
+        assert await _ref_count(db, digest) == 1
+        assert (await storage.collect_garbage(db, grace_seconds=0))["removed"] == []
+        assert await storage.backend.exists(digest)
+
+        await storage.release_book_pdf(db, book_b)
+        book_b.pdf_sha256 = None
+        await db.commit()
+        assert (await storage.collect_garbage(db, grace_seconds=0))["removed"] == [digest]
+    assert not await storage.backend.exists(digest)
+
+
+@pytest.mark.anyio
+async def test_gc_repairs_drifted_count_of_referenced_blob(session_factory):
+    digest = _digest(3)
+    async with session_factory() as db:
+        await _stored_blob(db, digest)
+        await _add_book(db, 1, digest)
+        await db.execute(models.PdfBlob.__table__.update().values(ref_count=0))
+        await db.commit()
+
+        result = await storage.collect_garbage(db, grace_seconds=0)
+        assert result == {"removed": [], "repaired": [digest]}
+        assert await _ref_count(db, digest) == 1
+    assert await storage.backend.exists(digest)
+
+
+@pytest.mark.anyio
+async def test_gc_respects_grace_period(session_factory):
+    digest = _digest(4)
+    async with session_factory() as db:
+        await _stored_blob(db, digest)
+        await storage.unpin_blob(db, digest)
+        # upload yang baru saja gagal / dilepas: masih dalam masa tenggang
+        assert (await storage.collect_garbage(db, grace_seconds=3600))["removed"] == []
+    assert await storage.backend.exists(digest)